@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Brotli (brotli-asgi) com as mesmas exclusoes por content-type do GZipMiddleware.
+
+O BrotliMiddleware original so exclui por caminho; como /analyze devolve JSON ou
+PDF/XLSX/Parquet conforme o pedido, a decisao precisa vir do content-type da resposta.
+Importar este modulo exige o pacote brotli-asgi.
+"""
+from brotli_asgi import BrotliMiddleware, BrotliResponder
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES, GZipResponder
+
+
+def _content_type_excluded(headers: Headers, exclude_content_types: tuple) -> bool:
+    media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+    return media_type in exclude_content_types or media_type.partition("/")[0] + "/*" in exclude_content_types
+
+
+class ExcludingBrotliResponder(BrotliResponder):
+    def __init__(self, *args, exclude_content_types: tuple = DEFAULT_EXCLUDED_CONTENT_TYPES):
+        super().__init__(*args)
+        self.exclude_content_types = exclude_content_types
+
+    async def send_with_brotli(self, message):
+        await super().send_with_brotli(message)
+        if message["type"] == "http.response.start":
+            # Reaproveita o caminho de resposta ja codificada: repassa o corpo sem comprimir
+            if _content_type_excluded(Headers(raw=message["headers"]), self.exclude_content_types):
+                self.content_encoding_set = True
+
+
+class ExcludingBrotliMiddleware(BrotliMiddleware):
+    """BrotliMiddleware com exclusao por content-type tambem no fallback gzip."""
+
+    def __init__(self, app, exclude_content_types: tuple = DEFAULT_EXCLUDED_CONTENT_TYPES,
+                 gzip_level: int = 9, **kwargs):
+        super().__init__(app, **kwargs)
+        self.exclude_content_types = tuple(t.partition(";")[0].strip().lower() for t in exclude_content_types)
+        self.gzip_level = gzip_level
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._is_handler_excluded(scope):
+            return await self.app(scope, receive, send)
+        accept_encoding = Headers(scope=scope).get("Accept-Encoding", "")
+        if "br" in accept_encoding:
+            responder = ExcludingBrotliResponder(
+                self.app, self.quality, self.mode, self.lgwin, self.lgblock, self.minimum_size,
+                exclude_content_types=self.exclude_content_types,
+            )
+        elif self.gzip_fallback and "gzip" in accept_encoding:
+            responder = GZipResponder(
+                self.app, self.minimum_size, compresslevel=self.gzip_level,
+                exclude_content_types=self.exclude_content_types,
+            )
+        else:
+            responder = self.app
+        await responder(scope, receive, send)
@@ -6,4 +6,171 @@ load_dotenv()
 class Settings:
     GOOGLE_API_KEY: str = os.getenv("GOOGLE_API_KEY")
 
+    # Provedor de IA: gemini, stub (local, deterministico) ou openai (endpoint compativel)
+    LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "gemini")
+    LLM_MODEL: str = os.getenv("LLM_MODEL", "gemini-2.5-flash")
+    # Roteamento por classe de requisicao (default, followup, small): "classe=provedor:modelo,..."
+    LLM_ROUTES: str = os.getenv("LLM_ROUTES", "")
+    LLM_OPENAI_BASE_URL: str = os.getenv("LLM_OPENAI_BASE_URL", "http://localhost:8080/v1")
+    LLM_OPENAI_API_KEY: str = os.getenv("LLM_OPENAI_API_KEY")
+    LLM_STUB_LATENCY_MS: float = float(os.getenv("LLM_STUB_LATENCY_MS", "0"))
+    # Orcamento de tokens do prompt (0 desliga) e contagem: 'local' (estimativa) ou 'provider' (SDK, em cache por template)
+    LLM_PROMPT_TOKEN_BUDGET: int = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "12000"))
+    LLM_PROMPT_MIN_EXAMPLES: int = int(os.getenv("LLM_PROMPT_MIN_EXAMPLES", "2"))
+    LLM_TOKEN_COUNTER: str = os.getenv("LLM_TOKEN_COUNTER", "local")
+
+    # Pool de conexoes do engine assincrono (por worker)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_SCHEMA: str = os.getenv("DB_SCHEMA", "unit")
+    # Cache de prepared statements do asyncpg por conexao (0 desliga, ex.: PgBouncer em modo transaction)
+    DB_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+    # Troca literais do SQL gerado pela IA por binds, para reaproveitar o statement em cache
+    DB_PARAMETERIZE_SQL: bool = os.getenv("DB_PARAMETERIZE_SQL", "true").lower() == "true"
+
+    # Replicas de leitura (URLs separadas por virgula) e roteamento das consultas analiticas:
+    # 'round_robin' ou 'least_connections'. Sem replica saudavel, a leitura vai para o primary.
+    DATABASE_REPLICA_URLS: list = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+    DB_READ_ROUTING: str = os.getenv("DB_READ_ROUTING", "round_robin")
+    DB_REPLICA_POOL_SIZE: int = int(os.getenv("DB_REPLICA_POOL_SIZE", os.getenv("DB_POOL_SIZE", "5")))
+    DB_REPLICA_FALLBACK_TO_PRIMARY: bool = os.getenv("DB_REPLICA_FALLBACK_TO_PRIMARY", "true").lower() == "true"
+
+    # Fonte MSSQL opcional (antes fixa em db_connector.py)
+    MSSQL_DATABASE_URL: str = os.getenv("MSSQL_DATABASE_URL")
+    MSSQL_POOL_SIZE: int = int(os.getenv("MSSQL_POOL_SIZE", "5"))
+
+    # Importa reportlab/openpyxl/Gemini em segundo plano apos o startup
+    WARM_UP_IMPORTS: bool = os.getenv("WARM_UP_IMPORTS", "true").lower() == "true"
+
+    # Health checks: revalidacao em segundo plano e verificacao da IA ('off', 'stub' ou 'real')
+    HEALTH_REFRESH_SECONDS: float = float(os.getenv("HEALTH_REFRESH_SECONDS", "15"))
+    HEALTH_CHECK_TIMEOUT: float = float(os.getenv("HEALTH_CHECK_TIMEOUT", "5"))
+    HEALTH_LLM_CHECK: str = os.getenv("HEALTH_LLM_CHECK", "stub")
+
+    # Exportacao Parquet/Arrow: codec padrao e tamanho dos lotes lidos do cursor
+    PARQUET_COMPRESSION: str = os.getenv("PARQUET_COMPRESSION", "zstd")
+    PARQUET_COMPRESSION_LEVEL: int | None = int(os.getenv("PARQUET_COMPRESSION_LEVEL")) if os.getenv("PARQUET_COMPRESSION_LEVEL") else None
+    ARROW_COMPRESSION: str = os.getenv("ARROW_COMPRESSION", "lz4")
+    EXPORT_BATCH_ROWS: int = int(os.getenv("EXPORT_BATCH_ROWS", "50000"))
+
+    # Sessoes de conversa (tabela conversa_sessoes no PostgreSQL, compartilhada pelos workers).
+    # Ficam num schema proprio, fora do schema de negocio que a IA ve e consulta
+    SESSION_SCHEMA: str = os.getenv("SESSION_SCHEMA", "app_sessoes")
+    SESSION_TTL_SECONDS: int = int(os.getenv("SESSION_TTL_SECONDS", "1800"))
+    SESSION_MAX_TURNS: int = int(os.getenv("SESSION_MAX_TURNS", "10"))
+    SESSION_CONTEXT_TURNS: int = int(os.getenv("SESSION_CONTEXT_TURNS", "3"))
+
+    # /analyze/batch: limite de itens e paralelismo de chamadas a IA e ao banco
+    BATCH_MAX_ITEMS: int = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+    BATCH_LLM_CONCURRENCY: int = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+    BATCH_SQL_CONCURRENCY: int = int(os.getenv("BATCH_SQL_CONCURRENCY", "4"))
+
+    # Tabelas pre-agregadas (rollups) atualizadas incrementalmente a partir de datapedido
+    ROLLUPS_ENABLED: bool = os.getenv("ROLLUPS_ENABLED", "false").lower() == "true"
+    ROLLUP_REFRESH_SECONDS: float = float(os.getenv("ROLLUP_REFRESH_SECONDS", "300"))
+    ROLLUP_LOOKBACK_DAYS: int = int(os.getenv("ROLLUP_LOOKBACK_DAYS", "3"))
+
+    # Series temporais incrementais das rotas estaticas (app.services.timeseries_service)
+    TIMESERIES_INCREMENTAL_ENABLED: bool = os.getenv("TIMESERIES_INCREMENTAL_ENABLED", "true").lower() == "true"
+    TIMESERIES_LOOKBACK_DAYS: int = int(os.getenv("TIMESERIES_LOOKBACK_DAYS", "0"))
+    TIMESERIES_FULL_REFRESH_SECONDS: float = float(os.getenv("TIMESERIES_FULL_REFRESH_SECONDS", "3600"))
+
+    # Compressao das respostas ('auto' usa brotli se brotli-asgi estiver instalado, senao gzip; 'off' desliga)
+    COMPRESSION: str = os.getenv("COMPRESSION", "auto")
+    COMPRESSION_MIN_SIZE: int = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+    GZIP_LEVEL: int = int(os.getenv("GZIP_LEVEL", "6"))
+    BROTLI_QUALITY: int = int(os.getenv("BROTLI_QUALITY", "4"))
+    # Cache da versao dos dados (ETag/Last-Modified das rotas estaticas)
+    DATA_VERSION_TTL_SECONDS: float = float(os.getenv("DATA_VERSION_TTL_SECONDS", "2"))
+
+    # Cache em disco dos relatorios gerados (chave: SQL + formato + versao dos dados), limitado em tamanho (LRU)
+    ARTIFACT_CACHE_ENABLED: bool = os.getenv("ARTIFACT_CACHE_ENABLED", "true").lower() == "true"
+    ARTIFACT_CACHE_DIR: str = os.getenv("ARTIFACT_CACHE_DIR")
+    ARTIFACT_CACHE_MAX_MB: int = int(os.getenv("ARTIFACT_CACHE_MAX_MB", "512"))
+
+    # Profiling por amostragem: cabecalho com o token de admin ou sorteio (0 a 1)
+    PROFILE_ADMIN_TOKEN: str = os.getenv("PROFILE_ADMIN_TOKEN")
+    PROFILE_HEADER: str = os.getenv("PROFILE_HEADER", "X-Profile-Token")
+    PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    PROFILE_INTERVAL_MS: float = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR")
+    PROFILE_MAX_FILES: int = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+    # Log de consultas lentas (app.services.query_log)
+    QUERY_LOG_ENABLED: bool = os.getenv("QUERY_LOG_ENABLED", "true").lower() == "true"
+    # Diretorio do host compartilhado pelos workers (log e agregados por slot de worker)
+    QUERY_LOG_DIR: str = os.getenv("QUERY_LOG_DIR")
+    # {slot} (ou {pid}, aceito por compatibilidade) vira o slot do worker
+    QUERY_LOG_FILE: str = os.getenv("QUERY_LOG_FILE")
+    QUERY_LOG_MAX_BYTES: int = int(os.getenv("QUERY_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    QUERY_LOG_BACKUPS: int = int(os.getenv("QUERY_LOG_BACKUPS", "5"))
+    QUERY_LOG_QUEUE_SIZE: int = int(os.getenv("QUERY_LOG_QUEUE_SIZE", "1000"))
+    QUERY_STATS_MAX: int = int(os.getenv("QUERY_STATS_MAX", "500"))
+    QUERY_STATS_FLUSH_SECONDS: float = float(os.getenv("QUERY_STATS_FLUSH_SECONDS", "10"))
+    SLOW_QUERY_MS: float = float(os.getenv("SLOW_QUERY_MS", "500"))
+    SLOW_QUERY_EXPLAIN_MS: float = float(os.getenv("SLOW_QUERY_EXPLAIN_MS", "2000"))
+    SLOW_QUERY_EXPLAIN_TIMEOUT_MS: int = int(os.getenv("SLOW_QUERY_EXPLAIN_TIMEOUT_MS", "5000"))
+
+    # Resiliencia das chamadas ao modelo (app.services.llm_resilience)
+    LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+    LLM_TOTAL_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TOTAL_TIMEOUT_SECONDS", "60"))
+    LLM_MAX_ATTEMPTS: int = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+    LLM_RETRY_BASE_MS: float = float(os.getenv("LLM_RETRY_BASE_MS", "250"))
+    LLM_RETRY_MAX_MS: float = float(os.getenv("LLM_RETRY_MAX_MS", "4000"))
+    LLM_HEDGE_ENABLED: bool = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    LLM_HEDGE_MIN_MS: float = float(os.getenv("LLM_HEDGE_MIN_MS", "1000"))
+    LLM_HEDGE_MIN_SAMPLES: int = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+    LLM_BREAKER_FAILURES: int = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+    LLM_BREAKER_RESET_SECONDS: float = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+    LLM_FALLBACK_CACHE_SIZE: int = int(os.getenv("LLM_FALLBACK_CACHE_SIZE", "256"))
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+    # Tentativas abandonadas (timeout/hedge perdido) ainda rodando ate o timeout do SDK; acima disso falha rapido
+    LLM_MAX_ORPHANS: int = int(os.getenv("LLM_MAX_ORPHANS", "64"))
+
+    # Respostas prontas para conversa, meta-perguntas e fora de escopo (app.services.chat_classifier)
+    CHAT_CLASSIFIER_ENABLED: bool = os.getenv("CHAT_CLASSIFIER_ENABLED", "true").lower() == "true"
+    CHAT_CLASSIFIER_MIN_CONFIDENCE: float = float(os.getenv("CHAT_CLASSIFIER_MIN_CONFIDENCE", "0.85"))
+    CHAT_CLASSIFIER_MAX_WORDS: int = int(os.getenv("CHAT_CLASSIFIER_MAX_WORDS", "15"))
+
+    # Executores dedicados (app.core.executors): threads de IO e processos de renderizacao
+    IO_THREADS: int = int(os.getenv("IO_THREADS", "32"))
+    RENDER_PROCESSES: int = int(os.getenv("RENDER_PROCESSES", "2"))
+    RENDER_MEMORY_LIMIT_MB: int = int(os.getenv("RENDER_MEMORY_LIMIT_MB", "1024"))
+    RENDER_TIMEOUT_SECONDS: float = float(os.getenv("RENDER_TIMEOUT_SECONDS", "120"))
+    RENDER_MAX_TASKS_PER_CHILD: int = int(os.getenv("RENDER_MAX_TASKS_PER_CHILD", "100"))
+    RENDER_START_METHOD: str = os.getenv("RENDER_START_METHOD", "forkserver")
+
+    # Reducao de pontos dos graficos (app.services.chart_service)
+    CHART_DOWNSAMPLING_ENABLED: bool = os.getenv("CHART_DOWNSAMPLING_ENABLED", "true").lower() == "true"
+    CHART_MAX_POINTS: int = int(os.getenv("CHART_MAX_POINTS", "500"))
+    CHART_MAX_CATEGORIES: int = int(os.getenv("CHART_MAX_CATEGORIES", "50"))
+    CHART_PIE_MAX_SLICES: int = int(os.getenv("CHART_PIE_MAX_SLICES", "10"))
+    CHART_OTHERS_LABEL: str = os.getenv("CHART_OTHERS_LABEL", "Outros")
+
+    # Modo de resposta do /analyze pelo tamanho do resultado (app.services.result_mode)
+    RESULT_MODE_ENABLED: bool = os.getenv("RESULT_MODE_ENABLED", "true").lower() == "true"
+    RESULT_INLINE_MAX_ROWS: int = int(os.getenv("RESULT_INLINE_MAX_ROWS", "5000"))
+    RESULT_PAGE_ROWS: int = int(os.getenv("RESULT_PAGE_ROWS", "1000"))
+    RESULT_DOWNLOAD_MIN_ROWS: int = int(os.getenv("RESULT_DOWNLOAD_MIN_ROWS", "100000"))
+    RESULT_REPORT_INLINE_MAX_ROWS: int = int(os.getenv("RESULT_REPORT_INLINE_MAX_ROWS", "10"))
+    RESULT_COUNT_TIMEOUT_MS: int = int(os.getenv("RESULT_COUNT_TIMEOUT_MS", "2000"))
+    # Chave HMAC dos cursores; sem ela, aleatoria por deploy (nao vale entre hosts nem apos restart)
+    RESULT_CURSOR_SECRET: str = os.getenv("RESULT_CURSOR_SECRET")
+    RESULT_CURSOR_TTL_SECONDS: int = int(os.getenv("RESULT_CURSOR_TTL_SECONDS", "3600"))
+
+    # Multi-tenancy (app.core.tenancy): "id=schema,..."; vazio = tenant unico em DB_SCHEMA
+    TENANTS: str = os.getenv("TENANTS", "")
+    TENANT_DATABASE_URLS: str = os.getenv("TENANT_DATABASE_URLS", "")
+    TENANT_POOL_SIZE: int = int(os.getenv("TENANT_POOL_SIZE", os.getenv("DB_POOL_SIZE", "5")))
+    TENANT_POOL_SIZES: str = os.getenv("TENANT_POOL_SIZES", "")
+    TENANT_MAX_OVERFLOW: int = int(os.getenv("TENANT_MAX_OVERFLOW", os.getenv("DB_MAX_OVERFLOW", "10")))
+    TENANT_TOKENS: str = os.getenv("TENANT_TOKENS", "")
+    TENANT_DEFAULT: str = os.getenv("TENANT_DEFAULT", "")
+    TENANT_HEADER: str = os.getenv("TENANT_HEADER", "X-Tenant-Id")
+    TENANT_TOKEN_HEADER: str = os.getenv("TENANT_TOKEN_HEADER", "X-Tenant-Token")
+    # Sem valor definido: obrigatorio quando ha mais de um tenant (app.core.tenancy.REQUIRE_TOKEN)
+    TENANT_REQUIRE_TOKEN: bool | None = os.getenv("TENANT_REQUIRE_TOKEN").lower() == "true" if os.getenv("TENANT_REQUIRE_TOKEN") else None
+    TENANT_REQUIRED: bool = os.getenv("TENANT_REQUIRED", "false").lower() == "true"
+
 settings = Settings()
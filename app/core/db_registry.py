@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Registro dos bancos de dados da aplicacao.
+
+Cada alvo (primary, replicas de leitura e uma fonte MSSQL opcional) tem o seu
+proprio engine/pool e o seu estado de saude. As consultas analiticas somente
+leitura (SQL gerado pela IA, relatorios e rotas estaticas) sao roteadas para as
+replicas saudaveis em round-robin ou pela replica com menos conexoes em uso;
+sem replicas disponiveis, caem no primary.
+"""
+import asyncio
+import itertools
+import time
+from contextlib import asynccontextmanager
+from fastapi import HTTPException, status
+from sqlalchemy import text
+
+ROUTING_POLICIES = ("round_robin", "least_connections")
+
+
+class DatabaseTarget:
+    """Um banco registrado: engine proprio (async ou sync) + estado de saude."""
+    __slots__ = ("name", "role", "engine", "is_async", "healthy", "checked_at", "last_error", "latency_ms")
+
+    def __init__(self, name: str, role: str, engine, is_async: bool = True):
+        self.name = name
+        self.role = role
+        self.engine = engine
+        self.is_async = is_async
+        self.healthy = None  # desconhecido ate a primeira verificacao
+        self.checked_at = None
+        self.last_error = None
+        self.latency_ms = None
+
+    @property
+    def pool(self):
+        return self.engine.sync_engine.pool if self.is_async else self.engine.pool
+
+    def checked_out(self) -> int:
+        """Conexoes do pool em uso neste worker."""
+        try:
+            return self.pool.checkedout()
+        except Exception:
+            return 0
+
+    def mark(self, healthy: bool, error: Exception = None, latency_ms: float = None):
+        self.healthy = healthy
+        self.checked_at = time.time()
+        self.last_error = f"{type(error).__name__}: {error}" if error is not None else None
+        self.latency_ms = round(latency_ms, 1) if latency_ms is not None else None
+
+    async def ping(self):
+        """SELECT 1 no alvo (engines sincronos rodam numa thread)."""
+        if self.is_async:
+            async with self.engine.connect() as connection:
+                await connection.execute(text("SELECT 1"))
+        else:
+            def _ping():
+                with self.engine.connect() as connection:
+                    connection.execute(text("SELECT 1"))
+            await asyncio.to_thread(_ping)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "role": self.role,
+            "healthy": self.healthy,
+            "checked_at": self.checked_at,
+            "latency_ms": self.latency_ms,
+            "error": self.last_error,
+            "in_use": self.checked_out(),
+        }
+
+
+class DatabaseRegistry:
+    def __init__(self, routing: str = "round_robin", fallback_to_primary: bool = True):
+        if routing not in ROUTING_POLICIES:
+            print(f"Politica de roteamento '{routing}' desconhecida; usando round_robin.")
+            routing = "round_robin"
+        self.routing = routing
+        self.fallback_to_primary = fallback_to_primary
+        self.targets = {}
+        self._round_robin = itertools.count()
+
+    def register(self, name: str, role: str, engine, is_async: bool = True) -> DatabaseTarget:
+        target = DatabaseTarget(name, role, engine, is_async)
+        self.targets[name] = target
+        return target
+
+    def get(self, name: str) -> DatabaseTarget | None:
+        return self.targets.get(name)
+
+    @property
+    def primary(self) -> DatabaseTarget | None:
+        return self.targets.get("primary")
+
+    @property
+    def replicas(self) -> list:
+        return [t for t in self.targets.values() if t.role == "replica"]
+
+    def pick_reader(self) -> DatabaseTarget:
+        """Escolhe o alvo para uma consulta somente leitura."""
+        candidates = [t for t in self.replicas if t.healthy is not False]
+        if not candidates:
+            if self.primary is None or (self.replicas and not self.fallback_to_primary):
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Nenhum banco de leitura disponivel."
+                )
+            return self.primary
+        if self.routing == "least_connections":
+            return min(candidates, key=lambda t: t.checked_out())
+        return candidates[next(self._round_robin) % len(candidates)]
+
+    @asynccontextmanager
+    async def connect_reader(self):
+        """
+        Conexao (com transacao) no alvo de leitura escolhido. Se a replica nao
+        aceitar a conexao, ela e marcada como indisponivel e o primary assume.
+        """
+        target = self.pick_reader()
+        connection = target.engine.connect()
+        try:
+            await connection.start()
+        except Exception as e:
+            if target.role == "primary" or self.primary is None or not self.fallback_to_primary:
+                raise
+            print(f"Replica '{target.name}' indisponivel, usando o primary: {e}")
+            target.mark(False, e)
+            connection = self.primary.engine.connect()
+            await connection.start()
+        try:
+            async with connection.begin():
+                yield connection
+        finally:
+            await connection.close()
+
+    async def check_all(self, timeout: float):
+        """Revalida todos os alvos em paralelo, atualizando o estado de cada um."""
+        async def _check(target: DatabaseTarget):
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(target.ping(), timeout=timeout)
+                target.mark(True, latency_ms=(time.perf_counter() - start) * 1000)
+            except Exception as e:
+                target.mark(False, e, (time.perf_counter() - start) * 1000)
+
+        await asyncio.gather(*(_check(t) for t in self.targets.values()))
+
+    def status(self) -> dict:
+        return {
+            "routing": self.routing,
+            "targets": [t.to_dict() for t in self.targets.values()],
+        }
+
+    def dispose_after_fork(self):
+        """Descarta as conexoes herdadas do processo pai (sem fecha-las) em todos os pools."""
+        for target in self.targets.values():
+            engine = target.engine.sync_engine if target.is_async else target.engine
+            engine.dispose(close=False)
+
+    async def dispose(self):
+        for target in self.targets.values():
+            if target.is_async:
+                await target.engine.dispose()
+            else:
+                target.engine.dispose()
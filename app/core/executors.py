@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Executores dedicados do worker.
+
+- IO: pool de threads para chamadas bloqueantes limitadas por I/O (IA, escrita
+  de arquivos), separado do executor padrao do loop. Tamanho: IO_THREADS.
+- Renderizacao: pool de processos para os relatorios CSV/PDF/XLSX, que sao
+  limitados por CPU e, em thread, disputariam o GIL com o restante do worker.
+  Tamanho: RENDER_PROCESSES (0 desliga e a renderizacao volta para o pool de IO).
+  Cada processo tem teto de memoria (RENDER_MEMORY_LIMIT_MB, via RLIMIT_AS) e
+  cada tarefa um tempo maximo (RENDER_TIMEOUT_SECONDS, via alarme no proprio
+  processo, que interrompe so a tarefa). Os processos sao iniciados com
+  RENDER_START_METHOD (forkserver por padrao: o worker ja tem threads e um
+  event loop, que nao devem ser herdados por fork) e reciclados a cada
+  RENDER_MAX_TASKS_PER_CHILD tarefas.
+
+Os pools sao criados no primeiro uso em cada worker e encerrados no shutdown.
+"""
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.core.config import settings
+
+_io_executor = None
+_render_executor = None
+_lock = threading.Lock()
+
+EXECUTOR_STATS = {"render_jobs": 0, "render_timeouts": 0, "render_memory_errors": 0, "render_pool_restarts": 0}
+
+
+class RenderTimeout(Exception):
+    """A tarefa de renderizacao passou de RENDER_TIMEOUT_SECONDS."""
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    global _io_executor
+    if _io_executor is None:
+        with _lock:
+            if _io_executor is None:
+                _io_executor = ThreadPoolExecutor(max_workers=settings.IO_THREADS, thread_name_prefix="io")
+    return _io_executor
+
+
+async def run_io(func, *args, **kwargs):
+    """Como asyncio.to_thread (inclusive copiando o contexto), mas no pool de IO."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_io_executor(), call)
+
+
+# --- Pool de processos de renderizacao ---
+
+def _init_render_process(memory_limit_mb: int):
+    """Inicializador de cada processo: aplica o teto de memoria."""
+    if memory_limit_mb > 0:
+        import resource
+
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _raise_timeout(signum, frame):
+    raise RenderTimeout()
+
+
+def _run_with_alarm(timeout: float, func, args):
+    """Executa func(*args) no processo filho com um alarme que interrompe apenas esta tarefa."""
+    import signal
+
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    if timeout > 0:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def get_render_executor() -> ProcessPoolExecutor | None:
+    global _render_executor
+    if settings.RENDER_PROCESSES <= 0:
+        return None
+    if _render_executor is None:
+        with _lock:
+            if _render_executor is None:
+                _render_executor = ProcessPoolExecutor(
+                    max_workers=settings.RENDER_PROCESSES,
+                    mp_context=multiprocessing.get_context(settings.RENDER_START_METHOD),
+                    initializer=_init_render_process,
+                    initargs=(settings.RENDER_MEMORY_LIMIT_MB,),
+                    max_tasks_per_child=settings.RENDER_MAX_TASKS_PER_CHILD or None,
+                )
+    return _render_executor
+
+
+def _reset_render_executor(broken):
+    global _render_executor
+    with _lock:
+        if _render_executor is broken:
+            _render_executor = None
+            EXECUTOR_STATS["render_pool_restarts"] += 1
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_render(func, *args):
+    """
+    Executa func(*args) no pool de processos (func e args precisam ser
+    serializaveis: funcoes de modulo e dados compactos, nao objetos com estado).
+    Sem pool configurado, roda no pool de IO.
+    """
+    executor = get_render_executor()
+    if executor is None:
+        return await run_io(func, *args)
+
+    EXECUTOR_STATS["render_jobs"] += 1
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(executor, _run_with_alarm, settings.RENDER_TIMEOUT_SECONDS, func, args)
+    except RenderTimeout:
+        EXECUTOR_STATS["render_timeouts"] += 1
+        raise
+    except MemoryError:
+        EXECUTOR_STATS["render_memory_errors"] += 1
+        raise
+    except BrokenProcessPool:
+        # Processo morto (ex.: OOM killer): descarta o pool para o proximo uso recria-lo
+        _reset_render_executor(executor)
+        raise
+
+
+def get_executor_stats() -> dict:
+    return {
+        **EXECUTOR_STATS,
+        "io_threads": settings.IO_THREADS,
+        "render_processes": settings.RENDER_PROCESSES,
+        "render_memory_limit_mb": settings.RENDER_MEMORY_LIMIT_MB,
+        "render_timeout_seconds": settings.RENDER_TIMEOUT_SECONDS,
+    }
+
+
+def shutdown():
+    """Encerra os pools deste worker (chamado no shutdown da aplicacao)."""
+    global _io_executor, _render_executor
+    with _lock:
+        if _render_executor is not None:
+            _render_executor.shutdown(wait=False, cancel_futures=True)
+            _render_executor = None
+        if _io_executor is not None:
+            _io_executor.shutdown(wait=False)
+            _io_executor = None
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Profiling por amostragem de requisicoes, sob demanda.
+
+Uma requisicao e perfilada quando traz o cabecalho PROFILE_HEADER com o token
+PROFILE_ADMIN_TOKEN, ou por sorteio (PROFILE_SAMPLE_RATE). Enquanto houver
+requisicoes perfiladas, uma thread de amostragem le sys._current_frames() a cada
+PROFILE_INTERVAL_MS e atribui cada pilha ao perfil correto:
+
+- thread do event loop: pela task em execucao -- a task da requisicao e as tasks
+  criadas dentro dela (ex.: o corpo de um StreamingResponse), registradas por
+  uma task factory instalada no loop no primeiro perfil;
+- threads de trabalho: as chamadas feitas com run_blocking() registram a thread
+  no perfil enquanto a funcao roda (use no lugar de asyncio.to_thread). A
+  renderizacao em processos separados (executors.run_render) nao e amostrada.
+
+O resultado e gravado em PROFILE_DIR no formato "folded" (uma pilha por linha,
+frames separados por ';' e a contagem no final), aceito por flamegraph.pl,
+speedscope e inferno. O id do perfil volta no cabecalho X-Profile-Id.
+"""
+import asyncio
+import contextvars
+import hmac
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from collections import Counter
+from app.core.config import settings
+from app.core.executors import run_io
+
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+_task_profiles = weakref.WeakKeyDictionary()
+_active = set()
+_active_lock = threading.Lock()
+_sampler = None
+
+
+class RequestProfile:
+    __slots__ = ("profile_id", "method", "path", "started_at", "loop", "loop_thread", "threads", "stacks", "samples", "lock")
+
+    def __init__(self, method: str, path: str, loop, loop_thread: int):
+        self.profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.loop = loop
+        self.loop_thread = loop_thread
+        self.threads = {}
+        self.stacks = Counter()
+        self.samples = 0
+        self.lock = threading.Lock()
+
+    def add(self, label: str, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        stack.append(label)
+        with self.lock:
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        with self.lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _install_task_factory(loop):
+    """
+    Encadeia uma task factory que associa ao perfil as tasks criadas dentro de
+    uma requisicao perfilada (o contexto da task nao e acessivel de outra thread).
+    """
+    previous = loop.get_task_factory()
+    if getattr(previous, "_profiling", False):
+        return
+
+    def factory(loop, coro, **kwargs):
+        task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+        profile = _current_profile.get()
+        if profile is not None:
+            _task_profiles[task] = profile
+        return task
+
+    factory._profiling = True
+    loop.set_task_factory(factory)
+
+
+def _task_profile(loop):
+    """Perfil associado a task que esta rodando no loop neste instante (se houver)."""
+    task = asyncio.current_task(loop)
+    return _task_profiles.get(task) if task is not None else None
+
+
+def _sample_loop():
+    global _sampler
+    interval = settings.PROFILE_INTERVAL_MS / 1000
+    while True:
+        with _active_lock:
+            if not _active:
+                _sampler = None
+                return
+            profiles = list(_active)
+
+        frames = sys._current_frames()
+        loops = {}
+        for profile in profiles:
+            loops.setdefault((profile.loop, profile.loop_thread), []).append(profile)
+            for ident, label in profile.threads.copy().items():
+                frame = frames.get(ident)
+                if frame is not None:
+                    profile.add(label, frame)
+
+        for (loop, thread_id), loop_profiles in loops.items():
+            frame = frames.get(thread_id)
+            owner = _task_profile(loop) if frame is not None else None
+            if owner in loop_profiles:
+                owner.add("event-loop", frame)
+
+        del frames
+        time.sleep(interval)
+
+
+def _start(profile: RequestProfile):
+    global _sampler
+    with _active_lock:
+        _active.add(profile)
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_loop, name="profile-sampler", daemon=True)
+            _sampler.start()
+
+
+def _stop(profile: RequestProfile):
+    with _active_lock:
+        _active.discard(profile)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Executa func no pool de threads de IO (app.core.executors) e, numa
+    requisicao perfilada, registra a thread de trabalho no perfil enquanto func roda.
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        return await run_io(func, *args, **kwargs)
+
+    def _run():
+        ident = threading.get_ident()
+        profile.threads[ident] = f"worker:{getattr(func, '__name__', 'func')}"
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.threads.pop(ident, None)
+
+    return await run_io(_run)
+
+
+# --- Armazenamento dos perfis ---
+
+def profile_dir() -> str:
+    path = settings.PROFILE_DIR or os.path.join(tempfile.gettempdir(), "bi_profiles")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _save(profile: RequestProfile, status_code: int):
+    path = os.path.join(profile_dir(), f"{profile.profile_id}.folded")
+    header = (
+        f"# {profile.method} {profile.path} status={status_code} "
+        f"duration_ms={(time.time() - profile.started_at) * 1000:.1f} samples={profile.samples} "
+        f"interval_ms={settings.PROFILE_INTERVAL_MS}\n"
+    )
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write(header)
+        fh.write(profile.folded())
+
+    files = sorted(f for f in os.listdir(profile_dir()) if f.endswith(".folded"))
+    for name in files[:-settings.PROFILE_MAX_FILES]:
+        try:
+            os.remove(os.path.join(profile_dir(), name))
+        except FileNotFoundError:
+            pass
+
+
+def list_profiles() -> list:
+    profiles = []
+    for name in sorted(os.listdir(profile_dir()), reverse=True):
+        if not name.endswith(".folded"):
+            continue
+        path = os.path.join(profile_dir(), name)
+        with open(path, encoding="utf-8") as fh:
+            header = fh.readline().lstrip("# ").strip()
+        profiles.append({"profile_id": name[:-len(".folded")], "summary": header, "bytes": os.path.getsize(path)})
+    return profiles
+
+
+def profile_path(profile_id: str) -> str | None:
+    if not profile_id.replace("-", "").isalnum():
+        return None
+    path = os.path.join(profile_dir(), f"{profile_id}.folded")
+    return path if os.path.exists(path) else None
+
+
+def is_admin(token: str) -> bool:
+    """Compara em tempo constante, para o tempo de resposta nao revelar o token."""
+    if not settings.PROFILE_ADMIN_TOKEN:
+        return False
+    return hmac.compare_digest(token.encode(), settings.PROFILE_ADMIN_TOKEN.encode())
+
+
+class ProfilingMiddleware:
+    """Middleware ASGI que decide, por requisicao, se ela sera perfilada."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _wanted(self, scope) -> bool:
+        headers = dict(scope.get("headers") or [])
+        token = headers.get(settings.PROFILE_HEADER.lower().encode(), b"").decode()
+        if token and is_admin(token):
+            return True
+        return settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"], asyncio.get_running_loop(), threading.get_ident())
+        status_code = {"value": None}
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                status_code["value"] = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", profile.profile_id.encode())]
+            await send(message)
+
+        _install_task_factory(profile.loop)
+        task = asyncio.current_task()
+        _task_profiles[task] = profile
+        token = _current_profile.set(profile)
+        _start(profile)
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            _stop(profile)
+            _current_profile.reset(token)
+            _task_profiles.pop(task, None)
+            try:
+                await asyncio.to_thread(_save, profile, status_code["value"])
+            except Exception as e:
+                print(f"Falha ao gravar o perfil {profile.profile_id}: {e}")
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-tenancy: varias unidades de negocio com o mesmo modelo de dados, cada uma
+no seu schema PostgreSQL (ou no seu proprio banco).
+
+Configuracao:
+- TENANTS: "id=schema,..." (ex.: "matriz=unit,filial_sul=unit_sul"). Vazio: um
+  unico tenant "default" no schema DB_SCHEMA, como antes.
+- TENANT_DATABASE_URLS: "id=url,..." para tenants em outro banco (os demais usam
+  DATABASE_URL e as replicas de DATABASE_REPLICA_URLS).
+- TENANT_POOL_SIZES: "id=n,..." sobrepoe TENANT_POOL_SIZE (por worker); o
+  overflow de cada tenant e TENANT_MAX_OVERFLOW.
+- TENANT_TOKENS: "token=id,..." para identificar o tenant pelo token.
+
+Cada tenant tem engines e pools proprios (app.services.db_service), entao os
+relatorios pesados de um tenant esgotam apenas as conexoes dele. Resumo do
+esquema, versao dos dados, cache de relatorios, fallback da IA e sessoes sao
+separados por tenant. O SQL gerado pela IA usa o search_path do tenant; para
+isolamento garantido pelo proprio banco, use um usuario por tenant com acesso
+apenas ao seu schema (URL em TENANT_DATABASE_URLS).
+
+O tenant da requisicao vem do token (TENANT_TOKEN_HEADER) ou do id
+(TENANT_HEADER); com TENANT_REQUIRE_TOKEN o id sozinho nao e aceito. O token
+e obrigatorio por padrao quando ha mais de um tenant (senao qualquer cliente
+leria outro tenant so trocando o id); TENANT_REQUIRE_TOKEN=false desliga. Sem
+nenhum dos dois, usa TENANT_DEFAULT (ou o primeiro de TENANTS), a menos que
+TENANT_REQUIRED esteja ativo. /health e /ops nao dependem de tenant (as rotas
+/ops que expoem tenants exigem o token de admin).
+"""
+import contextvars
+import re
+from dataclasses import dataclass
+from starlette.responses import JSONResponse
+from app.core.config import settings
+
+DEFAULT_TENANT_ID = "default"
+TENANT_EXEMPT_PREFIXES = ("/health", "/ops", "/docs", "/redoc", "/openapi.json")
+_TENANT_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+_SCHEMA_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]{0,62}$")
+
+
+@dataclass(frozen=True)
+class Tenant:
+    id: str
+    schema: str
+    database_url: str | None
+    pool_size: int
+    max_overflow: int
+    replica_pool_size: int
+
+    @property
+    def dedicated_database(self) -> bool:
+        """True quando o tenant tem banco proprio (sem as replicas compartilhadas)."""
+        return self.database_url is not None
+
+
+def _parse_pairs(value: str) -> dict:
+    pairs = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            key, target = item.split("=", 1)
+            pairs[key.strip()] = target.strip()
+    return pairs
+
+
+def load_tenants() -> dict:
+    """Tenants configurados, na ordem de TENANTS (ids e schemas validados)."""
+    schemas = _parse_pairs(settings.TENANTS)
+    if not schemas:
+        return {
+            DEFAULT_TENANT_ID: Tenant(
+                DEFAULT_TENANT_ID, settings.DB_SCHEMA, None,
+                settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW, settings.DB_REPLICA_POOL_SIZE,
+            )
+        }
+
+    urls = _parse_pairs(settings.TENANT_DATABASE_URLS)
+    pool_sizes = _parse_pairs(settings.TENANT_POOL_SIZES)
+    tenants = {}
+    for tenant_id, schema in schemas.items():
+        if not _TENANT_ID_RE.match(tenant_id) or not _SCHEMA_RE.match(schema):
+            raise ValueError(f"Tenant invalido em TENANTS: {tenant_id!r}={schema!r}")
+        pool_size = int(pool_sizes.get(tenant_id, settings.TENANT_POOL_SIZE))
+        tenants[tenant_id] = Tenant(
+            tenant_id, schema, urls.get(tenant_id), pool_size, settings.TENANT_MAX_OVERFLOW, pool_size
+        )
+    return tenants
+
+
+TENANTS = load_tenants()
+TENANT_TOKENS = _parse_pairs(settings.TENANT_TOKENS)
+DEFAULT_TENANT = TENANTS.get(settings.TENANT_DEFAULT) or next(iter(TENANTS.values()))
+REQUIRE_TOKEN = settings.TENANT_REQUIRE_TOKEN if settings.TENANT_REQUIRE_TOKEN is not None else len(TENANTS) > 1
+
+_current_tenant = contextvars.ContextVar("current_tenant", default=None)
+
+
+def current_tenant() -> Tenant:
+    """Tenant da requisicao atual (o padrao fora de uma requisicao)."""
+    return _current_tenant.get() or DEFAULT_TENANT
+
+
+def get_tenant(tenant_id: str | None) -> Tenant:
+    return TENANTS.get(tenant_id) or DEFAULT_TENANT
+
+
+def set_tenant(tenant: Tenant):
+    """Define o tenant do contexto atual; retorna o token para reset."""
+    return _current_tenant.set(tenant)
+
+
+def reset_tenant(token):
+    _current_tenant.reset(token)
+
+
+class TenantError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def resolve_tenant(tenant_id: str, token: str) -> Tenant | None:
+    """Tenant pelo token ou pelo id (None quando nenhum foi informado)."""
+    if token:
+        token_tenant = TENANT_TOKENS.get(token)
+        if token_tenant is None or token_tenant not in TENANTS:
+            raise TenantError(401, "Token de tenant invalido.")
+        if tenant_id and tenant_id != token_tenant:
+            raise TenantError(403, "O token nao pertence ao tenant informado.")
+        return TENANTS[token_tenant]
+    if tenant_id:
+        if REQUIRE_TOKEN:
+            raise TenantError(401, "Token de tenant obrigatorio.")
+        if tenant_id not in TENANTS:
+            raise TenantError(404, f"Tenant '{tenant_id}' desconhecido.")
+        return TENANTS[tenant_id]
+    return None
+
+
+class TenantMiddleware:
+    """Middleware ASGI que resolve o tenant da requisicao e o deixa no contexto."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        tenant_id = headers.get(settings.TENANT_HEADER.lower().encode(), b"").decode().strip()
+        token = headers.get(settings.TENANT_TOKEN_HEADER.lower().encode(), b"").decode().strip()
+        try:
+            tenant = resolve_tenant(tenant_id, token)
+        except TenantError as e:
+            await JSONResponse({"detail": e.detail}, status_code=e.status_code)(scope, receive, send)
+            return
+
+        exempt = scope["path"] == "/" or scope["path"].startswith(TENANT_EXEMPT_PREFIXES)
+        if tenant is None:
+            if settings.TENANT_REQUIRED and not exempt:
+                await JSONResponse(
+                    {"detail": f"Informe o tenant ({settings.TENANT_HEADER} ou {settings.TENANT_TOKEN_HEADER})."},
+                    status_code=400,
+                )(scope, receive, send)
+                return
+            tenant = DEFAULT_TENANT
+
+        context_token = set_tenant(tenant)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            reset_tenant(context_token)
@@ -1,9 +1,48 @@
 # -*- coding: utf-8 -*-
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import data_routes
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES
+from app.core import executors
+from app.core.config import settings
+from app.core.profiling import ProfilingMiddleware
+from app.core.tenancy import TenantMiddleware
+from app.routes import data_routes, health_routes, ops_routes, session_routes
+from app.services import health_service, query_log, rollup_service
 
-app = FastAPI()
+
+def warm_up_imports():
+    """Carrega as dependencias pesadas (relatorios e SDK da IA) fora do caminho das requisicoes."""
+    from app.services import ai_service, report_service
+
+    for warm_up in (report_service.warm_up_imports, ai_service.warm_up_imports):
+        try:
+            warm_up()
+        except Exception as e:
+            print(f"Falha no aquecimento de importacoes ({warm_up.__module__}): {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # O aquecimento roda numa thread para que o servidor ja aceite conexoes
+    if settings.WARM_UP_IMPORTS:
+        asyncio.get_running_loop().create_task(asyncio.to_thread(warm_up_imports))
+    # Warm-up de pool/esquema/prompt/IA; /health/ready so responde 200 ao final
+    health_service.start()
+    # Atualizacao incremental das tabelas pre-agregadas (ROLLUPS_ENABLED)
+    rollup_service.start()
+    # Gravacao assincrona do log de consultas lentas (com EXPLAIN acima do limite)
+    query_log.start()
+    yield
+    await query_log.stop()
+    await rollup_service.stop()
+    await health_service.stop()
+    executors.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Configuracao de CORS
 app.add_middleware(
@@ -14,8 +53,58 @@ app.add_middleware(
     allow_headers=["*"],          # permite Content-Type, Authorization, etc.
 )
 
+# Compressao das respostas acima de COMPRESSION_MIN_SIZE. Arquivos ja comprimidos
+# (PDF, XLSX, Parquet/Arrow) e o NDJSON do lote (precisa sair linha a linha) ficam de fora.
+COMPRESSION_EXCLUDED_CONTENT_TYPES = DEFAULT_EXCLUDED_CONTENT_TYPES + (
+    "application/pdf",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "application/vnd.apache.parquet",
+    "application/vnd.apache.arrow.file",
+    "application/x-ndjson",
+)
+
+
+def add_compression(app: FastAPI):
+    if settings.COMPRESSION == "off":
+        return
+    if settings.COMPRESSION in ("auto", "brotli"):
+        try:
+            from app.core.compression import ExcludingBrotliMiddleware
+        except ImportError:
+            if settings.COMPRESSION == "brotli":
+                print("brotli-asgi nao instalado; usando gzip.")
+        else:
+            app.add_middleware(
+                ExcludingBrotliMiddleware,
+                quality=settings.BROTLI_QUALITY,
+                minimum_size=settings.COMPRESSION_MIN_SIZE,
+                gzip_fallback=True,
+                gzip_level=settings.GZIP_LEVEL,
+                exclude_content_types=COMPRESSION_EXCLUDED_CONTENT_TYPES,
+            )
+            return
+    app.add_middleware(
+        GZipMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_SIZE,
+        compresslevel=settings.GZIP_LEVEL,
+        exclude_content_types=COMPRESSION_EXCLUDED_CONTENT_TYPES,
+    )
+
+
+add_compression(app)
+
+# Profiling sob demanda (cabecalho com token de admin ou PROFILE_SAMPLE_RATE); fica por
+# fora da compressao para medir a requisicao inteira, inclusive a serializacao
+app.add_middleware(ProfilingMiddleware)
+
+# Tenant da requisicao (cabecalho ou token) -> schema/banco, pools e caches proprios
+app.add_middleware(TenantMiddleware)
+
 # Inclui o router
 app.include_router(data_routes.router)
+app.include_router(health_routes.router)
+app.include_router(session_routes.router)
+app.include_router(ops_routes.router)
 
 @app.get("/")
 def read_root():
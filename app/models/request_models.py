@@ -1,10 +1,19 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 
 class QueryRequest(BaseModel):
     user_question: str
+    # Compressao opcional para relatorios parquet/arrow (ex.: 'zstd', 'snappy', 'lz4', 'none')
+    compression: Optional[str] = None
+    # Sessao de conversa (POST /sessions); perguntas de continuacao usam o contexto anterior
+    session_id: Optional[str] = None
     # db_connection_string: str
 
+class BatchQueryRequest(BaseModel):
+    items: list[QueryRequest] = Field(..., min_length=1)
+    # True: resposta em NDJSON (uma linha por item, na ordem de conclusao)
+    stream: bool = False
+
 class AIResponseSchema(BaseModel):
     message: str
     sql_query: str | None
@@ -13,4 +22,6 @@ class AIResponseSchema(BaseModel):
     x_axis: Optional[str] = None 
     y_axis: Optional[str] = None 
     label: Optional[str] = None 
-    value: Optional[str] = None 
\ No newline at end of file
+    value: Optional[str] = None 
+    # Tokens de entrada/saida da chamada a IA e cortes feitos para caber no orcamento
+    token_usage: Optional[dict] = None
\ No newline at end of file
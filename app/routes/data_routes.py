@@ -1,430 +1,79 @@
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter, Query, Depends, HTTPException, status
-import asyncio
-import google.generativeai as genai
-from app.core.config import settings
+from fastapi import APIRouter, Query, Depends, HTTPException, Request, Response, status
 from fastapi.responses import StreamingResponse
-from app.models.request_models import QueryRequest
-from app.services.ai_service import generate_ai_response
-from app.services.db_service import execute_sql_query, GLOBAL_ASYNC_ENGINE
-from sqlalchemy.ext.asyncio import AsyncConnection
+import functools
+from app.models.request_models import BatchQueryRequest, QueryRequest
+from app.services.ai_service import generate_ai_response, generate_followup_response
+from app.core.config import settings
+from app.core.profiling import run_blocking
+from app.services.db_service import execute_sql_query, fetch_result_set, get_schema_digest, stream_query_partitions, primary_engine, tenant_registry
+from app.services.report_service import (
+    COLUMNAR_EXPORT_FORMATS, generate_columnar_export_response, generate_json_response,
+    generate_report_response, iter_csv_partitions, render_report, report_headers, write_columnar_export,
+)
+from app.services.artifact_cache import cached_report_response, render_to_cache, report_cache_key
+from app.services.data_version import conditional_headers, not_modified_response
+from app.services.chart_service import downsample_chart
+from app.services.timeseries_service import DAILY_SALES_QUERY, monthly_sales
+from app.services.result_mode import choose_report_mode, choose_table_mode, fetch_page, read_cursor
+from app.services.chat_classifier import classify_chat
+from app.services.intent_service import match_intent
+from app.services import query_log
+from app.services.batch_service import iter_batch_ndjson, run_batch
+from app.services.session_service import record_turn, require_session
 from sqlalchemy import text
-import pandas as pd
-import io
-import os
-from dotenv import load_dotenv
-import asyncio
 from sqlalchemy.ext.asyncio import AsyncSession
-# Importacoes do ReportLab CORRIGIDAS
-from reportlab.lib.pagesizes import letter, A4 
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.units import inch
-import re
-
-# --- Configuracao do Ambiente ---
-load_dotenv()
-db_connection_string = os.getenv("DATABASE_URL") or ""
 
 router = APIRouter()
 
-# --- FUNCAO AUXILIAR NECESSARIA PARA O PDF ---
-def _safe_filename(text: str) -> str:
-    """Garante que o nome do arquivo seja seguro."""
-    text = text.replace(" ", "_")
-# Usa o modulo 're' para remover caracteres invalidos
-    return re.sub(r'[^\w\-_\.]', '', text)[:50] 
-# -----------------------------------------------------------------
-
-
-# --- Dependencia para Injecao de Sessao Assincrona ---
-async def get_db():
-    if GLOBAL_ASYNC_ENGINE is None:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="O motor assincrono do banco de dados nao foi inicializado."
-        )
-    # Abre uma nova conexao assincrona para cada requisicao
-    async with GLOBAL_ASYNC_ENGINE.connect() as connection:
-        await connection.execute(text("SET search_path TO unit"))
-        yield connection
-
-
-# --- Funcoes Auxiliares (Geracao de Arquivo) ---
-
-def generate_csv_response(data: list) -> StreamingResponse:
-    """Converte a lista de dicionarios em um arquivo CSV e retorna um StreamingResponse."""
-    df = pd.DataFrame(data)
-    buffer = io.StringIO()
-    df.to_csv(buffer, index=False)
-    buffer.seek(0)
-    
-    return StreamingResponse(
-        buffer, 
-        media_type="text/csv", 
-        headers={"Content-Disposition": "attachment;filename=report.csv"}
-    )
-
-def generate_pdf_response(data: list, title: str) -> StreamingResponse:
-    """
-    Gera um PDF robusto:
-    """
-    df = pd.DataFrame(data or [])
-    buffer = io.BytesIO()
-
-    # Pagina e margens
-    page_size = A4 
-    left, right, top, bottom = 24, 24, 36, 36
-
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=page_size,
-        leftMargin=left,
-        rightMargin=right,
-        topMargin=top,
-        bottomMargin=bottom
-    )
-
-    styles = getSampleStyleSheet()
-    title_style = styles["Title"]
-    normal_style = styles["Normal"]
-
-    elements = []
-
-    # Titulo
-    title_text = title or "Relatorio BI"
-    elements.append(Paragraph(title_text, title_style))
-    elements.append(Spacer(1, 0.25 * inch))
-
-    # Dataset vazio
-    if df.empty:
-        elements.append(Paragraph("Nenhum dado encontrado para a consulta.", normal_style))
-        doc.build(elements)
-        buffer.seek(0)
-        return StreamingResponse(
-            buffer,
-            media_type="application/pdf",
-            headers={"Content-Disposition": f"attachment; filename={_safe_filename(title_text)}.pdf"}
-        )
-
-    # Construcao dos dados para a tabela (tudo como string)
-    headers = [str(c) for c in df.columns.tolist()]
-    rows = [
-        [("" if pd.isna(v) else str(v)) for v in row]
-        for row in df.itertuples(index=False, name=None)
-    ]
-    table_data = [headers] + rows
-
-    # Calculo de larguras de coluna para caber na pagina
-    available_width = page_size[0] - left - right
-    font_size_body = 8
-    avg_char_width = font_size_body * 0.55
-    
-    max_chars_per_col = []
-    sample_rows = rows[:1000]
-    for j in range(len(headers)):
-        max_len = len(headers[j])
-        for r in sample_rows:
-            if j < len(r):
-                l = len(r[j] or "")
-                if l > max_len:
-                    max_len = l
-        max_chars_per_col.append(min(max_len, 40))
-
-    raw_widths = [max(50, m * avg_char_width + 12) for m in max_chars_per_col]
-    scale = min(1.0, available_width / sum(raw_widths))
-    col_widths = [w * scale for w in raw_widths]
-
-    table = Table(table_data, colWidths=col_widths, repeatRows=1, splitByRow=1)
-
-    table_style = TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
-        ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-        ("FONTSIZE", (0, 0), (-1, 0), 9),
-        ("BOTTOMPADDING", (0, 0), (-1, 0), 8),
-        ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
-        ("FONTSIZE", (0, 1), (-1, -1), font_size_body),
-        ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
-        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
-        ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f7f7f7")]),
-        ("LEFTPADDING", (0, 0), (-1, -1), 4),
-        ("RIGHTPADDING", (0, 0), (-1, -1), 4),
-        ("TOPPADDING", (0, 0), (-1, -1), 3),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 3),
-    ])
-    table.setStyle(table_style)
-
-    elements.append(table)
-
-    # Constroi o PDF
-    try:
-        doc.build(elements)
-    except Exception as e:
-        # Fallback: se der erro de layout, gera um PDF com mensagem
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=page_size,
-            leftMargin=left,
-            rightMargin=right,
-            topMargin=top,
-            bottomMargin=bottom
-        )
-        elements = [
-            Paragraph(title_text, title_style),
-            Spacer(1, 0.25 * inch),
-            Paragraph(f"Falha ao renderizar a tabela: {str(e)}", normal_style)
-        ]
-        doc.build(elements)
-
-    buffer.seek(0)
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={_safe_filename(title_text)}.pdf"}
-    )
-
-def generate_xlsx_response(data: list, title: str) -> StreamingResponse:
-    """
-    Gera um XLSX com largura de coluna ajustada e cabecalho congelado.
-    """
-    df = pd.DataFrame(data or [])
-    buffer = io.BytesIO()
-
-    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-        wdf = df if not df.empty else pd.DataFrame({"Mensagem": ["Nenhum dado encontrado para a consulta."]})
-        wdf.to_excel(writer, index=False, sheet_name="Report", freeze_panes=(1, 0))
-        ws = writer.sheets["Report"]
-
-        # Ajusta largura das colunas
-        for col_idx, column in enumerate(wdf.columns, start=1):
-            col_values = wdf[column].astype(str)
-            max_len = max(col_values.map(len).max() if not wdf.empty else 0, len(str(column)))
-            ws.column_dimensions[ws.cell(1, col_idx).column_letter].width = min(max_len + 2, 50)
-
-    buffer.seek(0)
-    return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={_safe_filename(title)}.xlsx"}
-    )
-
-
-# --- Rotas da API ---
-
-# --- FUNÇÃO AUXILIAR NECESSÁRIA PARA O PDF ---
-def _safe_filename(text: str) -> str:
-    """Garante que o nome do arquivo seja seguro."""
-    text = text.replace(" ", "_")
-    # Usa o módulo 're' para remover caracteres inválidos
-    return re.sub(r'[^\w\-_\.]', '', text)[:50] 
-# -----------------------------------------------------------------
-
 
 # --- Dependência para Injeção de Sessão Assíncrona ---
 async def get_db():
-    if GLOBAL_ASYNC_ENGINE is None:
+    engine = primary_engine()
+    if engine is None:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="O motor assíncrono do banco de dados não foi inicializado."
         )
-    # Abre uma nova conexão assíncrona para cada requisição
-    async with GLOBAL_ASYNC_ENGINE.begin() as connection:
+    # Abre uma nova conexão assíncrona (no pool do tenant) para cada requisição
+    async with engine.begin() as connection:
         yield connection
 
 
-# --- Funções Auxiliares (Geração de Arquivo) ---
-
-def generate_csv_response(data: list) -> StreamingResponse:
-    """Converte a lista de dicionários em um arquivo CSV e retorna um StreamingResponse."""
-    df = pd.DataFrame(data)
-    buffer = io.StringIO()
-    df.to_csv(buffer, index=False)
-    buffer.seek(0)
-    
-    return StreamingResponse(
-        buffer, 
-        media_type="text/csv", 
-        headers={"Content-Disposition": "attachment;filename=report.csv"}
-    )
-
-def generate_pdf_response(data: list, title: str) -> StreamingResponse:
-    """Gera um PDF robusto."""
-    df = pd.DataFrame(data or [])
-    buffer = io.BytesIO()
-
-    # Página e margens
-    page_size = A4 
-    left, right, top, bottom = 24, 24, 36, 36
-
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=page_size,
-        leftMargin=left,
-        rightMargin=right,
-        topMargin=top,
-        bottomMargin=bottom
-    )
-
-    styles = getSampleStyleSheet()
-    title_style = styles["Title"]
-    normal_style = styles["Normal"]
-
-    elements = []
-
-    # Título
-    title_text = title or "Relatório BI"
-    elements.append(Paragraph(title_text, title_style))
-    elements.append(Spacer(1, 0.25 * inch))
-
-    # Dataset vazio
-    if df.empty:
-        elements.append(Paragraph("Nenhum dado encontrado para a consulta.", normal_style))
-        doc.build(elements)
-        buffer.seek(0)
-        return StreamingResponse(
-            buffer,
-            media_type="application/pdf",
-            headers={"Content-Disposition": f"attachment; filename={_safe_filename(title_text)}.pdf"}
-        )
-
-    # Construção dos dados para a tabela (tudo como string)
-    headers = [str(c) for c in df.columns.tolist()]
-    rows = [
-        [("" if pd.isna(v) else str(v)) for v in row]
-        for row in df.itertuples(index=False, name=None)
-    ]
-    table_data = [headers] + rows
-
-    # Cálculo de larguras de coluna para caber na página
-    available_width = page_size[0] - left - right
-    font_size_body = 8
-    avg_char_width = font_size_body * 0.55
-    
-    max_chars_per_col = []
-    sample_rows = rows[:1000]
-    for j in range(len(headers)):
-        max_len = len(headers[j])
-        for r in sample_rows:
-            if j < len(r):
-                l = len(r[j] or "")
-                if l > max_len:
-                    max_len = l
-        max_chars_per_col.append(min(max_len, 40))
-
-    raw_widths = [max(50, m * avg_char_width + 12) for m in max_chars_per_col]
-    scale = min(1.0, available_width / sum(raw_widths))
-    col_widths = [w * scale for w in raw_widths]
-
-    table = Table(table_data, colWidths=col_widths, repeatRows=1, splitByRow=1)
-
-    table_style = TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
-        ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-        ("FONTSIZE", (0, 0), (-1, 0), 9),
-        ("BOTTOMPADDING", (0, 0), (-1, 0), 8),
-        ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
-        ("FONTSIZE", (0, 1), (-1, -1), font_size_body),
-        ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
-        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
-        ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f7f7f7")]),
-        ("LEFTPADDING", (0, 0), (-1, -1), 4),
-        ("RIGHTPADDING", (0, 0), (-1, -1), 4),
-        ("TOPPADDING", (0, 0), (-1, -1), 3),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 3),
-    ])
-    table.setStyle(table_style)
-
-    elements.append(table)
-
-    # Constrói o PDF
-    try:
-        doc.build(elements)
-    except Exception as e:
-        # Fallback: se der erro de layout, gera um PDF com mensagem
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=page_size,
-            leftMargin=left,
-            rightMargin=right,
-            topMargin=top,
-            bottomMargin=bottom
-        )
-        elements = [
-            Paragraph(title_text, title_style),
-            Spacer(1, 0.25 * inch),
-            Paragraph(f"Falha ao renderizar a tabela: {str(e)}", normal_style)
-        ]
-        doc.build(elements)
-
-    buffer.seek(0)
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={_safe_filename(title_text)}.pdf"}
-    )
+# --- Dependência de leitura: réplica (round-robin/least-connections) ou primary do tenant ---
+async def get_read_db():
+    async with tenant_registry().connect_reader() as connection:
+        yield connection
 
-def generate_xlsx_response(data: list, title: str) -> StreamingResponse:
-    """Gera um XLSX com largura de coluna ajustada e cabeçalho congelado."""
-    df = pd.DataFrame(data or [])
-    buffer = io.BytesIO()
-
-    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-        wdf = df if not df.empty else pd.DataFrame({"Mensagem": ["Nenhum dado encontrado para a consulta."]})
-        wdf.to_excel(writer, index=False, sheet_name="Report", freeze_panes=(1, 0))
-        ws = writer.sheets["Report"]
-
-        # Ajusta largura das colunas
-        for col_idx, column in enumerate(wdf.columns, start=1):
-            col_values = wdf[column].astype(str)
-            max_len = max(col_values.map(len).max() if not wdf.empty else 0, len(str(column)))
-            ws.column_dimensions[ws.cell(1, col_idx).column_letter].width = min(max_len + 2, 50)
-
-    buffer.seek(0)
-    return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={_safe_filename(title)}.xlsx"}
-    )
 
 # -----------------------------------------------------------------
 # --- NOVAS ROTAS ESTÁTICAS (GET) SEM USO DE IA (Atualizadas para PostgreSQL) ---
 # -----------------------------------------------------------------
 
-## 🔑 Rota Estática para KPI
-@router.get("/kpi/static")
-async def get_static_kpi(db: AsyncSession = Depends(get_db)):
-    """
-    Retorna 3 KPIs: Total de vendas no mês, Quantidade produtos vendidos, e Ticket médio.
-    Corrigido para PostgreSQL.
-    """
-    static_query = """
+# Consultas estáticas compiladas uma única vez (text() no nível do módulo); o texto
+# da consulta é sempre o mesmo, então o asyncpg reaproveita o prepared statement.
+# As tabelas não levam o schema: o search_path da conexão aponta para o schema do tenant.
+KPI_STATIC_QUERY = """
     WITH MonthlySales AS (
     -- Total de Vendas no Mês
     SELECT SUM(valortotal) AS total_sales
-    FROM unit.pedidosvenda
+    FROM pedidosvenda
     -- Condição de Mês Corrente
     WHERE TO_CHAR(datapedido::date, 'YYYY-MM') = TO_CHAR(NOW()::date, 'YYYY-MM')
     ),
     TotalItemsSold AS (
     -- Quantidade de Produtos Vendidos no Mês
     SELECT SUM(t2.quantidade) AS total_items
-    FROM unit.pedidosvenda t1
+    FROM pedidosvenda t1
     -- CORREÇÃO FINAL: Usando a chave primária correta 't1.pedidoid' 
     -- para se ligar à chave estrangeira 't2.pedidoid'
-    JOIN unit.itenspedidovenda t2 ON t1.pedidoid = t2.pedidoid 
+    JOIN itenspedidovenda t2 ON t1.pedidoid = t2.pedidoid 
     WHERE TO_CHAR(t1.datapedido::date, 'YYYY-MM') = TO_CHAR(NOW()::date, 'YYYY-MM')
     ),
     AverageTicket AS (
     -- Ticket Médio (média do valor total dos pedidos no mês)
     SELECT AVG(valortotal) AS avg_ticket
-    FROM unit.pedidosvenda
+    FROM pedidosvenda
     WHERE TO_CHAR(datapedido::date, 'YYYY-MM') = TO_CHAR(NOW()::date, 'YYYY-MM')
     )
     SELECT 
@@ -432,8 +81,63 @@ async def get_static_kpi(db: AsyncSession = Depends(get_db)):
     COALESCE((SELECT total_items FROM TotalItemsSold), 0) AS quantidade_produtos_vendidos,
     COALESCE((SELECT avg_ticket FROM AverageTicket), 0) AS ticket_medio;
     """
-    
-    data = await execute_sql_query(db, static_query)
+KPI_STATIC_SQL = text(KPI_STATIC_QUERY)
+
+# Vendas por mês no ano atual (PostgreSQL)
+BAR_STATIC_QUERY = """
+    SELECT 
+        TO_CHAR(datapedido::date, 'YYYY-MM') AS month_label, 
+        SUM(valortotal) AS total_sales
+    FROM pedidosvenda
+    WHERE 
+        TO_CHAR(datapedido::date, 'YYYY') = TO_CHAR(NOW()::date, 'YYYY')
+    GROUP BY month_label
+    ORDER BY month_label;
+    """
+BAR_STATIC_SQL = text(BAR_STATIC_QUERY)
+
+# Top 5 Clientes por Valor Comprado (PostgreSQL)
+TOP_CLIENTS_QUERY = """
+        SELECT
+            c.nome AS client_name, 
+            SUM(o.valortotal) AS value_purchased,
+            COUNT(o.pedidoid) AS total_orders -- CORREÇÃO: Usando a PK correta da tabela pedidosvenda
+        FROM pedidosvenda o
+        -- CORREÇÃO: Trocando c.id por c.clienteid
+        JOIN clientes c ON o.clienteid = c.clienteid 
+        GROUP BY c.nome
+        ORDER BY value_purchased DESC
+        LIMIT 5;
+        """
+TOP_CLIENTS_SQL = text(TOP_CLIENTS_QUERY)
+
+# Vendedores por Valor Total Vendido (Decrescente) (PostgreSQL)
+TOP_SELLERS_QUERY = """
+    SELECT
+        e.nomecompleto AS seller_name, -- CORREÇÃO: Usando 'nomecompleto' que é a coluna que contém o nome do vendedor
+        SUM(o.valortotal) AS total_sold
+    FROM pedidosvenda o
+    -- CORREÇÃO: Trocando e.id por e.vendedorid
+    JOIN vendedores e ON o.vendedorid = e.vendedorid
+    GROUP BY e.nomecompleto -- CORREÇÃO: Agrupando pelo nome correto da coluna
+    ORDER BY total_sold DESC;
+    """
+TOP_SELLERS_SQL = text(TOP_SELLERS_QUERY)
+
+## 🔑 Rota Estática para KPI
+@router.get("/kpi/static")
+async def get_static_kpi(request: Request, response: Response):
+    """
+    Retorna 3 KPIs: Total de vendas no mês, Quantidade produtos vendidos, e Ticket médio.
+    Corrigido para PostgreSQL. Responde 304 se os dados não mudaram (ETag/Last-Modified).
+    """
+    headers, not_modified = await conditional_headers(request, "kpi")
+    if not_modified:
+        return not_modified_response(headers)
+    response.headers.update(headers)
+
+    async with tenant_registry().connect_reader() as db:
+        data = await execute_sql_query(db, KPI_STATIC_SQL)
     
     kpi_values = {}
     if data and isinstance(data[0], dict):
@@ -443,92 +147,72 @@ async def get_static_kpi(db: AsyncSession = Depends(get_db)):
         "type": "kpi",
         "status": "success",
         "message": "KPIs Estáticos: Vendas do Mês, Produtos Vendidos e Ticket Médio.",
-        "query": static_query,
+        "query": KPI_STATIC_QUERY,
         "kpis": kpi_values,
         "data": data # Retorna os dados brutos também
     }
 
-@router.get("/health/db")
-async def health_db(db: AsyncConnection = Depends(get_db)):
-    result = await db.execute(text("SELECT 1"))
-    return {"db": (result.scalar() == 1)}
-
 ## 📊 Rota Estática para Gráfico de Barras
 @router.get("/bar/static")
-async def get_static_bar_chart(db: AsyncSession = Depends(get_db)):
+async def get_static_bar_chart(request: Request, response: Response):
     """
     Retorna dados estáticos para Gráfico de Barras: Vendas nos meses daquele ano.
-    Corrigido para PostgreSQL.
-    """
-    # Query SQL estática: Vendas por mês no ano atual (PostgreSQL)
-    static_query = """
-    SELECT 
-        TO_CHAR(datapedido::date, 'YYYY-MM') AS month_label, 
-        SUM(valortotal) AS total_sales
-    FROM unit.pedidosvenda
-    WHERE 
-        TO_CHAR(datapedido::date, 'YYYY') = TO_CHAR(NOW()::date, 'YYYY')
-    GROUP BY month_label
-    ORDER BY month_label;
+    Corrigido para PostgreSQL. Responde 304 se os dados não mudaram (ETag/Last-Modified).
+    Os meses fechados ficam congelados em memória; só o período aberto é reconsultado.
     """
-    
-    data = await execute_sql_query(db, static_query)
-
-    return {
+    headers, not_modified = await conditional_headers(request, "bar")
+    if not_modified:
+        return not_modified_response(headers)
+    response.headers.update(headers)
+
+    refresh = None
+    query = BAR_STATIC_QUERY
+    if settings.TIMESERIES_INCREMENTAL_ENABLED:
+        # Totais diarios incrementais (refresh.since diz o periodo reconsultado; "cached" = nenhum)
+        data, refresh = await monthly_sales()
+        query = DAILY_SALES_QUERY
+    else:
+        async with tenant_registry().connect_reader() as db:
+            data = await execute_sql_query(db, BAR_STATIC_SQL)
+
+    payload = {
         "type": "bar",
         "status": "success",
         "message": "Gráfico Estático: Vendas Totais nos Meses do Ano Atual",
-        "query": static_query,
+        "query": query,
         "data": data,
         "x_axis": "Mês/Ano",
         "y_axis": "Total de Vendas",
     }
+    if refresh is not None:
+        payload["refresh"] = refresh
+    return payload
 
 
 ## 🍕 Rota Estática para Gráfico de Pizza
 @router.get("/pie/static")
-async def get_static_pie_chart(db: AsyncSession = Depends(get_db)):
+async def get_static_pie_chart(request: Request, response: Response):
     """
     Retorna dados estáticos para Gráfico de Pizza: Os 5 melhores clientes (maior valor comprado).
     Também inclui dados para Vendedores (quem vendeu mais, decrescente).
-    Corrigido para PostgreSQL (minúsculas).
+    Corrigido para PostgreSQL (minúsculas). Responde 304 se os dados não mudaram.
     """
-    # Query SQL estática 1: Top 5 Clientes por Valor Comprado (PostgreSQL)
-    top_clients_query = """
-        SELECT
-            c.nome AS client_name, 
-            SUM(o.valortotal) AS value_purchased,
-            COUNT(o.pedidoid) AS total_orders -- CORREÇÃO: Usando a PK correta da tabela pedidosvenda
-        FROM unit.pedidosvenda o
-        -- CORREÇÃO: Trocando c.id por c.clienteid
-        JOIN unit.clientes c ON o.clienteid = c.clienteid 
-        GROUP BY c.nome
-        ORDER BY value_purchased DESC
-        LIMIT 5;
-        """
-    
-    # Query SQL estática 2: Vendedores por Valor Total Vendido (Decrescente) (PostgreSQL)
-    top_sellers_query = """
-    SELECT
-        e.nomecompleto AS seller_name, -- CORREÇÃO: Usando 'nomecompleto' que é a coluna que contém o nome do vendedor
-        SUM(o.valortotal) AS total_sold
-    FROM unit.pedidosvenda o
-    -- CORREÇÃO: Trocando e.id por e.vendedorid
-    JOIN unit.vendedores e ON o.vendedorid = e.vendedorid
-    GROUP BY e.nomecompleto -- CORREÇÃO: Agrupando pelo nome correto da coluna
-    ORDER BY total_sold DESC;
-    """
-    
-    top_clients_data = await execute_sql_query(db, top_clients_query)
-    top_sellers_data = await execute_sql_query(db, top_sellers_query)
+    headers, not_modified = await conditional_headers(request, "pie")
+    if not_modified:
+        return not_modified_response(headers)
+    response.headers.update(headers)
+
+    async with tenant_registry().connect_reader() as db:
+        top_clients_data = await execute_sql_query(db, TOP_CLIENTS_SQL)
+        top_sellers_data = await execute_sql_query(db, TOP_SELLERS_SQL)
 
     return {
         "type": "pie",
         "status": "success",
         "message": "Gráfico Estático: Top 5 Clientes e Vendedores por Performance",
         "queries": {
-            "top_clients": top_clients_query,
-            "top_sellers": top_sellers_query,
+            "top_clients": TOP_CLIENTS_QUERY,
+            "top_sellers": TOP_SELLERS_QUERY,
         },
         "data_clients": top_clients_data, # Dados dos 5 melhores clientes
         "data_sellers": top_sellers_data, # Dados dos vendedores
@@ -539,13 +223,37 @@ async def get_static_pie_chart(db: AsyncSession = Depends(get_db)):
 
 ## 🔎 Rota de Análise Original (Inalterada)
 @router.post("/analyze")
-async def analyze_data(body: QueryRequest, db: AsyncSession = Depends(get_db)): 
+async def analyze_data(body: QueryRequest, db: AsyncSession = Depends(get_read_db)): 
     user_question = body.user_question
-    db_schema = db_connection_string 
-    
-    # 2. Gere a resposta da IA (Bloqueante/Síncrona)
-    ai_response = await asyncio.to_thread(generate_ai_response, user_question, db_schema)
+    query_log.set_question(user_question)
+    db_schema = await get_schema_digest()
     
+    # 2. Gere a resposta da IA (Bloqueante/Síncrona). Perguntas frequentes reconhecidas
+    # pelo atalho de intenções usam uma consulta parametrizada pronta, sem chamar a IA.
+    # Em uma sessão com consulta anterior, usa o prompt compacto de continuação.
+    # Sessão desconhecida ou expirada responde 404 session_expired em vez de recomeçar vazia
+    session = await require_session(body.session_id) if body.session_id else None
+    intent = match_intent(user_question)
+    query_params = None
+    # Saudações, meta-perguntas e pedidos fora de escopo recebem resposta pronta (classificador local)
+    canned = classify_chat(user_question) if intent is None else None
+    if intent is not None:
+        ai_response, query_params = intent.ai_response, intent.params
+    elif canned is not None:
+        ai_response = canned
+    elif session is not None and session.has_query:
+        ai_response = await run_blocking(generate_followup_response, user_question, db_schema, session.context())
+    else:
+        ai_response = await run_blocking(generate_ai_response, user_question, db_schema)
+    response = await _answer(body, db, user_question, ai_response, intent, query_params)
+    # Só depois que o SQL executou: uma consulta com erro não vira contexto da sessão
+    if session is not None:
+        await record_turn(session, user_question, ai_response)
+    return response
+
+
+async def _answer(body: QueryRequest, db: AsyncSession, user_question: str, ai_response, intent, query_params):
+    """Executa a resposta da IA (ou do atalho de intenções) e monta o retorno do /analyze."""
     # 3. Se não há query, retorna erro ou mensagem de texto
     if not ai_response.sql_query:
         return {
@@ -554,37 +262,83 @@ async def analyze_data(body: QueryRequest, db: AsyncSession = Depends(get_db)):
             "data": None,
             "visualization_type": "text", 
             "x_axis": None, "y_axis": None, "label": None, "value": None,
+            "session_id": body.session_id,
         }
         
-    # 4. Executa a query SQL
-    data = await execute_sql_query(db, ai_response.sql_query) 
+    # 4a. Relatórios já gerados para o mesmo SQL, formato e versão dos dados saem do cache em disco
+    cache_key = None
+    if ai_response.visualization_type == "report":
+        report_title = ai_response.message if ai_response.message else user_question
+        cache_key = await report_cache_key(ai_response.sql_query, ai_response.report_type, report_title, body.compression)
+        if cache_key is not None:
+            cached = cached_report_response(cache_key, ai_response.report_type, report_title)
+            if cached is not None:
+                return cached
+
+    # 4b. Parquet/Arrow sao gravados direto do cursor, em lotes (record batches)
+    if ai_response.visualization_type == "report" and ai_response.report_type in COLUMNAR_EXPORT_FORMATS:
+        partitions = stream_query_partitions(db, intent.statement if intent else ai_response.sql_query, settings.EXPORT_BATCH_ROWS, query_params)
+        if cache_key is not None:
+            write = functools.partial(write_columnar_export, partitions, ai_response.report_type, compression=body.compression)
+            return await render_to_cache(cache_key, ai_response.report_type, report_title, write)
+        return await generate_columnar_export_response(partitions, ai_response.report_type, report_title, body.compression)
+
+    # 4c. O tamanho estimado do resultado decide o modo (inline, paginado ou download)
+    # antes de trazer as linhas: tabelas grandes não viram um JSON de centenas de MB e
+    # PDF/XLSX mínimos ou enormes não passam pela renderização
+    response_mode = None
+    if settings.RESULT_MODE_ENABLED:
+        sql = str(intent.statement) if intent else ai_response.sql_query
+        if ai_response.visualization_type == "table":
+            title = ai_response.message if ai_response.message else user_question
+            response_mode = await choose_table_mode(db, sql, query_params, ai_response.sql_query, title)
+        elif ai_response.visualization_type == "report" and ai_response.report_type in ("pdf", "xlsx"):
+            response_mode = await choose_report_mode(db, sql, query_params, ai_response.sql_query, report_title, ai_response.report_type)
+    if response_mode is not None:
+        data = response_mode.data
+        payload = {
+            "message": ai_response.message,
+            "query": ai_response.sql_query,
+            "data": data,
+            "visualization_type": "table",
+            "x_axis": None, "y_axis": None, "label": None, "value": None,
+            "session_id": body.session_id,
+            "response_mode": response_mode.describe(),
+        }
+        if ai_response.token_usage is not None:
+            payload["token_usage"] = ai_response.token_usage
+        return generate_json_response(payload, data)
+
+    # 4. Executa a query SQL (resultado colunar, compartilhado por todos os formatos)
+    data = await fetch_result_set(db, intent.statement if intent else ai_response.sql_query, params=query_params)
     
     # 5. Verifica se é um relatório e retorna o arquivo apropriado
     if ai_response.visualization_type == "report":
-        
-        report_title = ai_response.message if ai_response.message else user_question
 
-        # Lógica de relatórios (CSV, PDF, XLSX) é mantida
-        if ai_response.report_type == "csv":
-            return await asyncio.to_thread(generate_csv_response, data)
-        
-        elif ai_response.report_type == "pdf":
-            return await asyncio.to_thread(generate_pdf_response, data, report_title)
-        
-        elif ai_response.report_type == "xlsx":
-            return await asyncio.to_thread(generate_xlsx_response, data, report_title)
+        # CSV, PDF e XLSX são renderizados no pool de processos (Parquet/Arrow tratados acima).
+        # Com a chave de cache, o arquivo é gravado direto no cache e servido de lá
+        if ai_response.report_type in ("csv", "pdf", "xlsx"):
+            if cache_key is not None:
+                write = functools.partial(render_report, data, ai_response.report_type, report_title)
+                return await render_to_cache(cache_key, ai_response.report_type, report_title, write)
+            return await generate_report_response(data, ai_response.report_type, report_title)
         
         # Se a IA pediu um relatório, mas o formato não é reconhecido, retorna JSON com os dados
-        return {
+        return generate_json_response({
             "message": f"Formato de relatório '{ai_response.report_type}' não suportado. Dados brutos retornados.",
             "query": ai_response.sql_query,
             "data": data,
             "visualization_type": "table",
             "x_axis": None, "y_axis": None, "label": None, "value": None,
-        }
+            "session_id": body.session_id,
+        }, data)
         
-    # 6. Se não for relatório (gráfico/tabela), retorna o JSON para o front-end
-    return {
+    # 6. Se não for relatório (gráfico/tabela), retorna o JSON para o front-end.
+    # Gráficos de linha/barra/pizza são reduzidos a algumas centenas de pontos antes da serialização
+    data, downsampling = downsample_chart(
+        data, ai_response.visualization_type, ai_response.x_axis, ai_response.y_axis, ai_response.label, ai_response.value
+    )
+    payload = {
         "message": ai_response.message,
         "query": ai_response.sql_query,
         "data": data,
@@ -593,4 +347,72 @@ async def analyze_data(body: QueryRequest, db: AsyncSession = Depends(get_db)):
         "y_axis": ai_response.y_axis,
         "label": ai_response.label,
         "value": ai_response.value,
+        "session_id": body.session_id,
     }
+    if downsampling is not None:
+        payload["downsampling"] = downsampling
+    if ai_response.token_usage is not None:
+        payload["token_usage"] = ai_response.token_usage
+    return generate_json_response(payload, data)
+
+
+## 📄 Páginas e downloads de resultados grandes (cursor assinado devolvido pelo /analyze)
+@router.get("/analyze/page")
+async def analyze_page(cursor: str, db: AsyncSession = Depends(get_read_db)):
+    """Próxima página de um resultado paginado; next_cursor é null na última."""
+    state = read_cursor(cursor)
+    data, next_cursor = await fetch_page(db, state)
+    return generate_json_response({
+        "query": state["sql"],
+        "data": data,
+        "offset": state["offset"],
+        "rows": len(data),
+        "total_rows": state["rows"],
+        "next_cursor": next_cursor,
+    }, data)
+
+
+@router.get("/analyze/download")
+async def analyze_download(cursor: str, format: str = Query("csv", pattern="^(csv|parquet|arrow|pdf|xlsx)$"),
+                           db: AsyncSession = Depends(get_read_db)):
+    """
+    Resultado completo do cursor como arquivo. CSV sai em fluxo direto do cursor do
+    banco; Parquet/Arrow em record batches; PDF/XLSX só para resultados pequenos.
+    """
+    state = read_cursor(cursor)
+    title = state["title"] or "resultado"
+    if format == "csv":
+        # Conexão própria: o fluxo continua depois que as dependências da rota já fecharam
+        partitions = stream_query_partitions(None, state["sql"], settings.EXPORT_BATCH_ROWS)
+        media_type, disposition = report_headers("csv", title)
+        return StreamingResponse(iter_csv_partitions(partitions), media_type=media_type, headers={"Content-Disposition": disposition})
+    if format in COLUMNAR_EXPORT_FORMATS:
+        partitions = stream_query_partitions(db, state["sql"], settings.EXPORT_BATCH_ROWS)
+        return await generate_columnar_export_response(partitions, format, title)
+    if state["rows"] is None or state["rows"] > settings.RESULT_INLINE_MAX_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Resultado grande demais para PDF/XLSX. Use CSV ou Parquet."
+        )
+    data = await fetch_result_set(db, state["sql"])
+    return await generate_report_response(data, format, title)
+
+
+## 📦 Rota de Análise em Lote
+@router.post("/analyze/batch")
+async def analyze_batch(body: BatchQueryRequest):
+    """
+    Executa várias perguntas em uma única requisição: deduplica, roda IA e SQL com
+    paralelismo limitado e devolve resultados (ou erros) por item. Com stream=true,
+    responde em NDJSON à medida que cada pergunta termina.
+    """
+    if len(body.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"O lote aceita no máximo {settings.BATCH_MAX_ITEMS} perguntas."
+        )
+
+    questions = [item.user_question for item in body.items]
+    if body.stream:
+        return StreamingResponse(iter_batch_ndjson(questions), media_type="application/x-ndjson")
+    return await run_batch(questions)
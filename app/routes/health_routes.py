@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import time
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.services.health_service import HEALTH_STATE
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+
+@router.get("/live")
+async def liveness():
+    """Liveness: o processo esta de pe e o event loop responde."""
+    return {"status": "alive", "uptime_s": round(time.time() - HEALTH_STATE["started_at"], 1)}
+
+
+@router.get("/ready")
+async def readiness():
+    """
+    Readiness: 200 somente depois do warm-up (pool, esquema, prompt e IA) e
+    enquanto as verificacoes em cache estiverem ok; caso contrario 503.
+    """
+    body = {
+        "status": "ready" if HEALTH_STATE["ready"] else "not_ready",
+        "warm_up_done": HEALTH_STATE["warm_up_done"],
+        "refreshed_at": HEALTH_STATE["refreshed_at"],
+        "checks": HEALTH_STATE["checks"],
+    }
+    return JSONResponse(body, status_code=200 if HEALTH_STATE["ready"] else 503)
+
+
+@router.get("/db")
+async def health_db():
+    """Estado do banco (primary) e de cada alvo do registro a partir do cache, sem adquirir conexao."""
+    check = HEALTH_STATE["checks"].get("database")
+    return {
+        "db": bool(check and check["ok"]),
+        "checked_at": check["checked_at"] if check else None,
+        "targets": HEALTH_STATE["targets"],
+    }
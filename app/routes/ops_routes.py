@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.responses import FileResponse
+from app.core import executors, profiling
+from app.core.config import settings
+from app.core.tenancy import DEFAULT_TENANT, REQUIRE_TOKEN, TENANTS
+from app.services import db_service, query_log, rollup_service
+from app.services.artifact_cache import get_cache_stats
+from app.services.chat_classifier import get_chat_stats
+from app.services.intent_service import get_intent_stats
+from app.services.llm_resilience import get_llm_stats
+from app.services.result_mode import get_result_mode_stats
+from app.services.timeseries_service import get_timeseries_stats
+from app.services.token_budget import get_token_stats
+
+router = APIRouter(prefix="/ops", tags=["ops"])
+
+
+@router.get("/intents")
+async def intent_stats():
+    """
+    Taxa de acerto do atalho de intencoes e das respostas prontas do
+    classificador de conversa (mensagens respondidas sem chamar a IA), por worker.
+    """
+    return {**get_intent_stats(), "chat": get_chat_stats()}
+
+
+@router.get("/llm")
+async def llm_stats():
+    """Estado do circuit breaker, latencias recentes, tentativas, hedges e fallbacks das chamadas a IA."""
+    return get_llm_stats()
+
+
+@router.get("/tokens")
+async def token_stats(recent: int = Query(20, ge=0, le=200)):
+    """Tokens de entrada/saida por classe de requisicao e provedor, cortes do orcamento e as ultimas chamadas."""
+    return get_token_stats(recent)
+
+
+@router.get("/result-modes")
+async def result_mode_stats():
+    """Quantas respostas do /analyze sairam inline, paginadas ou como download, e os limites em uso."""
+    return get_result_mode_stats()
+
+
+@router.get("/executors")
+async def executor_stats():
+    """Configuracao e contadores dos pools de IO e de renderizacao deste worker."""
+    return executors.get_executor_stats()
+
+
+@router.get("/rollups")
+async def rollup_status():
+    """Estado das tabelas pre-agregadas de cada tenant: marca d'agua e resultado da ultima atualizacao."""
+    return rollup_service.ROLLUP_STATE
+
+
+@router.get("/timeseries")
+async def timeseries_status():
+    """Series temporais incrementais deste worker: marca d'agua, dias em memoria e a ultima atualizacao de cada tenant."""
+    return get_timeseries_stats()
+
+
+@router.post("/rollups/refresh")
+async def refresh_rollups(request: Request, full: bool = False):
+    """
+    Atualiza os rollups do tenant da requisicao agora; full=true reconstroi todo o
+    historico. Exige o token de admin (roda DDL e DELETE/INSERT no primary) e
+    ROLLUPS_ENABLED.
+    """
+    _require_admin(request)
+    if not settings.ROLLUPS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Rollups desativados (ROLLUPS_ENABLED=false).")
+    return await rollup_service.refresh_now(full)
+
+
+@router.get("/tenants")
+async def tenant_status(request: Request):
+    """
+    Tenants configurados com schema, limites e conexoes em uso de cada pool neste
+    worker. Exige o token de admin (a lista de ids facilitaria trocar de tenant).
+    """
+    _require_admin(request)
+    tenants = []
+    for tenant in TENANTS.values():
+        registry = db_service.tenant_registry(tenant)
+        tenants.append({
+            "id": tenant.id,
+            "schema": tenant.schema,
+            "default": tenant is DEFAULT_TENANT,
+            "dedicated_database": tenant.dedicated_database,
+            "pool_size": tenant.pool_size,
+            "max_overflow": tenant.max_overflow,
+            "schema_digest_loaded": tenant.id in db_service.SCHEMA_DIGESTS,
+            "targets": registry.status()["targets"],
+        })
+    return {
+        "header": settings.TENANT_HEADER,
+        "token_header": settings.TENANT_TOKEN_HEADER,
+        "require_token": REQUIRE_TOKEN,
+        "tenants": tenants,
+    }
+
+
+@router.get("/artifacts")
+async def artifact_cache_stats():
+    """Acertos, gravacoes e ocupacao do cache de relatorios em disco (diretorio compartilhado)."""
+    return get_cache_stats()
+
+
+def _require_admin(request: Request):
+    """403 sem o token de admin no cabecalho PROFILE_HEADER (o mesmo que ativa o profiling)."""
+    if not profiling.is_admin(request.headers.get(settings.PROFILE_HEADER, "")):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Token de admin ausente ou invalido.")
+
+
+@router.get("/profiles")
+async def list_profiles(request: Request):
+    """Perfis gravados neste host (mais recentes primeiro). Exige o token de admin."""
+    _require_admin(request)
+    return profiling.list_profiles()
+
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(request: Request, profile_id: str):
+    """Baixa o perfil em formato folded (flamegraph.pl, speedscope, inferno)."""
+    _require_admin(request)
+    path = profiling.profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Perfil nao encontrado.")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.folded")
+
+
+@router.get("/slow-queries")
+async def slow_queries(request: Request, limit: int = Query(20, ge=1, le=500), order: str = Query("total", pattern="^(total|max|mean)$")):
+    """
+    Piores consultas de todos os workers deste host agrupadas por fingerprint
+    (SQL sem literais), ordenadas por tempo total, maximo ou medio no banco.
+    Exige o token de admin (o resultado traz perguntas e SQL dos usuarios).
+    """
+    _require_admin(request)
+    return await asyncio.to_thread(query_log.slow_query_report, limit, order)
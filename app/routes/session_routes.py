@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from fastapi import APIRouter, HTTPException, status
+from app.core.config import settings
+from app.services import session_service
+
+router = APIRouter(prefix="/sessions", tags=["sessions"])
+
+
+@router.post("")
+async def create_session():
+    """Cria uma sessao de conversa; envie o session_id no /analyze para perguntas de continuacao."""
+    session = await session_service.create_session()
+    return {"session_id": session.session_id, "ttl_seconds": settings.SESSION_TTL_SECONDS}
+
+
+@router.get("/{session_id}")
+async def get_session(session_id: str):
+    session = await session_service.get_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sessao nao encontrada ou expirada.")
+    return session.to_dict()
+
+
+@router.delete("/{session_id}")
+async def delete_session(session_id: str):
+    if not await session_service.delete_session(session_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sessao nao encontrada ou expirada.")
+    return {"session_id": session_id, "deleted": True}
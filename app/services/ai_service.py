@@ -1,14 +1,21 @@
 # -*- coding: latin-1 -*-
-import google.generativeai as genai
 import json
+import math
 import re
+import unicodedata
+from functools import lru_cache
 from typing import Optional
 from pydantic import BaseModel
 from app.core.config import settings
 from fastapi import HTTPException
-from google.generativeai.types import HarmBlockThreshold, HarmCategory
 
 from app.models.request_models import AIResponseSchema
+from app.services.llm_providers import get_provider
+from app.services.llm_resilience import LLMUnavailable, call_with_resilience, fallback_response, remember_response
+from app.services.token_budget import (
+    PromptPlan, calibration, estimate_tokens, join_schema, record_rejected, record_usage,
+    split_schema, table_drop_order, template_tokens,
+)
 
 # NOTE: Você precisa adicionar o campo 'message' ao seu modelo Pydantic AIResponseSchema
 # no arquivo 'app/models/request_models.py' para que este código funcione corretamente.
@@ -22,31 +29,34 @@ from app.models.request_models import AIResponseSchema
 #     label: Optional[str] = None
 #     value: Optional[str] = None
 
-# Configuração da API
-genai.configure(api_key=settings.GOOGLE_API_KEY)
-
-# Configurações do modelo
-generation_config = {
-    "temperature": 0.2,
-    "max_output_tokens": 2048,
-}
-
-# Adicionando configurações de segurança para evitar bloqueios inesperados
-safety_settings = {
-    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+# O provedor (Gemini, stub local ou endpoint compativel com OpenAI) e escolhido
+# por configuracao e, opcionalmente, por classe de requisicao (llm_providers).
+# O SDK do Gemini continua sendo importado apenas no primeiro uso.
+SMALL_TALK_WORDS = {
+    "oi", "ola", "bom", "boa", "dia", "tarde", "noite", "tudo", "bem", "obrigado",
+    "obrigada", "valeu", "tchau", "ate", "logo", "e", "ai", "opa", "beleza",
 }
 
-model = genai.GenerativeModel("gemini-2.5-flash", generation_config=generation_config, safety_settings=safety_settings)
-
-def generate_ai_response(user_question: str, db_schema: str) -> AIResponseSchema:
-    """ 
-    Gera a resposta da IA com a consulta SQL e o tipo de visualização.
-    A resposta agora inclui uma mensagem amigável antes do JSON.
-    """
-    prompt = f"""
+def request_class(user_question: str) -> str:
+    """Classe da requisicao para o roteamento de modelos: 'small' para saudacoes e agradecimentos."""
+    ascii_question = unicodedata.normalize("NFKD", user_question.lower()).encode("ascii", "ignore").decode()
+    words = re.findall(r"\w+", ascii_question)
+    if words and all(word in SMALL_TALK_WORDS for word in words):
+        return "small"
+    return "default"
+
+def get_model():
+    """Modelo Gemini do provedor padrao (mantido para chamadas diretas ao SDK)."""
+    return get_provider().get_model()
+
+def warm_up_imports():
+    """Prepara o provedor padrao (no Gemini, importa o SDK e instancia o modelo)."""
+    get_provider().warm_up()
+
+# Template do prompt montado uma unica vez na importacao do modulo (antes do fork
+# dos workers do gunicorn). Os campos {db_schema} e {user_question} sao
+# preenchidos por build_prompt().
+PROMPT_TEMPLATE = """
     Você é um Cientista de Dados e Engenheiro de Dados SQL. Sua principal tarefa é traduzir perguntas de usuários sobre dados em consultas SQL **performativas e seguras**, e determinar o melhor formato para visualizar os resultados.
 
     Sua resposta deve ser uma **mensagem curta e amigável seguida por um único bloco de código JSON**, sem nenhum outro texto. A mensagem deve apresentar os resultados de forma humana e profissional.
@@ -67,7 +77,7 @@ def generate_ai_response(user_question: str, db_schema: str) -> AIResponseSchema
         "message": "Uma breve e amigável mensagem para o usuário.",
         "sql_query": "A consulta SQL gerada, rigorosamente seguindo as regras acima.",
         "visualization_type": "O tipo de visualização ('bar', 'pie', 'line', 'table', ou 'report').",
-        "report_type": "O formato do relatório ('csv', 'pdf', 'xlsx'), ou null se não for um relatório.",
+        "report_type": "O formato do relatório ('csv', 'pdf', 'xlsx', 'parquet', 'arrow'), ou null se não for um relatório. Use 'parquet' ou 'arrow' quando o usuário pedir esses formatos (ex.: para carregar no pandas).",
         "x_axis": "Nome da coluna para o eixo X, ou null.",
         "y_axis": "Nome da coluna para o eixo Y, ou null.",
         "label": "Nome da coluna para os rótulos de um gráfico de pizza, ou null.",
@@ -85,7 +95,7 @@ def generate_ai_response(user_question: str, db_schema: str) -> AIResponseSchema
 
     {{
     "message": "Preparando seu relatório Excel com os produtos que precisam de reposição de estoque.",
-    "sql_query": "SELECT p.NomeProduto, p.SKU, cp.NomeCategoria, e.Quantidade FROM unit.Produtos AS p JOIN unit.Estoques AS e ON p.ProdutoID = e.ProdutoID JOIN unit.CategoriasProdutos AS cp ON p.CategoriaID = cp.CategoriaID WHERE e.Quantidade < 50 ORDER BY e.Quantidade ASC",
+    "sql_query": "SELECT p.NomeProduto, p.SKU, cp.NomeCategoria, e.Quantidade FROM Produtos AS p JOIN Estoques AS e ON p.ProdutoID = e.ProdutoID JOIN CategoriasProdutos AS cp ON p.CategoriaID = cp.CategoriaID WHERE e.Quantidade < 50 ORDER BY e.Quantidade ASC",
     "visualization_type": "report",
     "report_type": "xlsx",
     "x_axis": null,
@@ -103,7 +113,7 @@ def generate_ai_response(user_question: str, db_schema: str) -> AIResponseSchema
 
     {{
     "message": "Certo, gerando o relatório completo dos pedidos do último trimestre em formato Excel.",
-    "sql_query": "SELECT pv.PedidoID, c.Nome || ' ' || c.Sobrenome AS Cliente, pv.DataPedido, pv.ValorTotal, pv.StatusPedido FROM unit.PedidosVenda AS pv JOIN unit.Clientes AS c ON pv.ClienteID = c.ClienteID WHERE pv.DataPedido >= NOW() - INTERVAL '3 months' ORDER BY pv.DataPedido DESC",
+    "sql_query": "SELECT pv.PedidoID, c.Nome || ' ' || c.Sobrenome AS Cliente, pv.DataPedido, pv.ValorTotal, pv.StatusPedido FROM PedidosVenda AS pv JOIN Clientes AS c ON pv.ClienteID = c.ClienteID WHERE pv.DataPedido >= NOW() - INTERVAL '3 months' ORDER BY pv.DataPedido DESC",
     "visualization_type": "report",
     "report_type": "xlsx",
     "x_axis": null,
@@ -509,12 +519,208 @@ def generate_ai_response(user_question: str, db_schema: str) -> AIResponseSchema
     **Pergunta do usuÃ¡rio:** '{user_question}'
     
     """
-    
+
+_PROMPT_HEAD, _PROMPT_TAIL = PROMPT_TEMPLATE.split("{user_question}")
+
+# Exemplos do template, um por item (cada um termina no fechamento do seu JSON), para
+# que o orcamento de tokens possa cortar exemplos sem mexer no resto do prompt
+_EXAMPLES_START = _PROMPT_HEAD.index("### Exemplos:\n") + len("### Exemplos:\n")
+_EXAMPLES_END = _PROMPT_HEAD.rindex("}}\n") + len("}}\n")
+_HEAD_BEFORE_EXAMPLES = _PROMPT_HEAD[:_EXAMPLES_START]
+_HEAD_AFTER_EXAMPLES = _PROMPT_HEAD[_EXAMPLES_END:]
+PROMPT_EXAMPLES = [e for e in re.split(r"(?<=\}\}\n)", _PROMPT_HEAD[_EXAMPLES_START:_EXAMPLES_END]) if e.strip()]
+
+def _example_drop_order() -> list:
+    """
+    Ordem de corte dos exemplos: primeiro os de conversa (sem SQL; o classificador
+    local ja responde a maioria), depois os de SQL do fim para o inicio, mantendo
+    os LLM_PROMPT_MIN_EXAMPLES primeiros.
+    """
+    chat = [i for i, e in enumerate(PROMPT_EXAMPLES) if '"sql_query": null' in e]
+    sql = [i for i, e in enumerate(PROMPT_EXAMPLES) if i not in chat]
+    return chat[::-1] + sql[settings.LLM_PROMPT_MIN_EXAMPLES:][::-1]
+
+_EXAMPLE_DROP_ORDER = _example_drop_order()
+
+@lru_cache(maxsize=32)
+def get_prompt_prefix(db_schema: str, examples: tuple = None) -> str:
+    """
+    Retorna a parte fixa do prompt (instrucoes, esquema e exemplos) ja formatada.
+    examples: indices de PROMPT_EXAMPLES a manter (None = todos).
+    """
+    if examples is None:
+        return _PROMPT_HEAD.format(db_schema=db_schema)
+    head = _HEAD_BEFORE_EXAMPLES + "".join(PROMPT_EXAMPLES[i] for i in examples) + _HEAD_AFTER_EXAMPLES
+    return head.format(db_schema=db_schema)
+
+def build_prompt(user_question: str, db_schema: str) -> str:
+    """Monta o prompt final reaproveitando o prefixo ja formatado para o esquema."""
+    return get_prompt_prefix(db_schema) + user_question + _PROMPT_TAIL
+
+def _over_budget(budget: int):
+    record_rejected()
+    raise HTTPException(
+        status_code=413,
+        detail=f"A pergunta excede o limite de {budget} tokens do prompt, mesmo com exemplos e esquema reduzidos.",
+    )
+
+def plan_prompt(user_question: str, db_schema: str, provider) -> PromptPlan:
+    """
+    Prompt completo se couber em LLM_PROMPT_TOKEN_BUDGET; senao, corta exemplos
+    (_EXAMPLE_DROP_ORDER) e depois as tabelas menos relevantes para a pergunta.
+    O prefixo completo e contado uma vez por template (token_budget); os cortes
+    usam a estimativa local calibrada por essa contagem.
+    """
+    budget = settings.LLM_PROMPT_TOKEN_BUDGET
+    prefix = get_prompt_prefix(db_schema)
+    ratio = calibration(provider, prefix)
+    variable = user_question + _PROMPT_TAIL
+    tokens = template_tokens(provider, prefix) + math.ceil(estimate_tokens(variable) * ratio)
+    if budget <= 0 or tokens <= budget:
+        return PromptPlan(prefix + variable, tokens, budget)
+
+    hints, tables = split_schema(db_schema)
+    fixed = estimate_tokens(_HEAD_BEFORE_EXAMPLES + _HEAD_AFTER_EXAMPLES + variable)
+    example_sizes = [estimate_tokens(e) for e in PROMPT_EXAMPLES]
+    table_sizes = [estimate_tokens(t) + 1 for t in tables]
+    hint_size = sum(estimate_tokens(h) + 1 for h in hints)
+    kept_examples = set(range(len(PROMPT_EXAMPLES)))
+    kept_tables = set(range(len(tables)))
+
+    def estimate() -> int:
+        schema = hint_size + sum(table_sizes[i] for i in kept_tables)
+        # O esquema aparece duas vezes no template
+        return math.ceil((fixed + sum(example_sizes[i] for i in kept_examples) + 2 * schema) * ratio)
+
+    for i in _EXAMPLE_DROP_ORDER:
+        if estimate() <= budget:
+            break
+        kept_examples.discard(i)
+    dropped_tables = []
+    for i in table_drop_order(tables, user_question):
+        if estimate() <= budget or len(kept_tables) <= 1:
+            break
+        kept_tables.discard(i)
+        dropped_tables.append(tables[i].partition("(")[0])
+
+    schema = join_schema(hints, [tables[i] for i in sorted(kept_tables)])
+    prompt = get_prompt_prefix(schema, tuple(sorted(kept_examples))) + variable
+    tokens = math.ceil(estimate_tokens(prompt) * ratio)
+    if tokens > budget:
+        _over_budget(budget)
+    return PromptPlan(prompt, tokens, budget, len(PROMPT_EXAMPLES) - len(kept_examples), dropped_tables)
+
+# Prompt compacto para perguntas de continuacao em uma sessao. Em vez dos exemplos
+# completos, envia apenas as regras, o esquema, as ultimas trocas (pergunta -> SQL)
+# e a consulta anterior, que serve de base para refinamentos.
+FOLLOWUP_PROMPT_TEMPLATE = """
+    Voce e um Engenheiro de Dados SQL (PostgreSQL) continuando uma conversa com o usuario.
+    Gere apenas consultas SELECT, usando somente tabelas e colunas do esquema abaixo.
+    Responda com uma mensagem curta e amigavel seguida de um unico bloco ```json com as chaves:
+    message, sql_query, visualization_type ('bar', 'pie', 'line', 'table', 'report' ou null),
+    report_type ('csv', 'pdf', 'xlsx', 'parquet', 'arrow' ou null), x_axis, y_axis, label, value.
+
+    Se a nova pergunta refinar a anterior (outro periodo, filtro, ordenacao, limite ou formato),
+    parta da consulta anterior e altere somente o necessario. Se for um assunto novo, ignore o historico.
+
+    **Esquema do Banco de Dados:**
+    ```sql
+    {db_schema}
+    ```
+
+    **Conversa ate agora:**
+{history}
+
+    **Consulta anterior (base para refinamento):**
+    ```sql
+    {previous_sql}
+    ```
+
+    **Nova pergunta do usuario:** '{user_question}'
+    """
+
+def build_followup_prompt(user_question: str, db_schema: str, history: list) -> str:
+    """Monta o prompt de continuacao com as trocas mais recentes da sessao."""
+    lines = []
+    previous_sql = "-- nenhuma"
+    for turn in history:
+        lines.append(f"    - Usuario: {turn['question']}")
+        if turn.get("sql"):
+            lines.append(f"      SQL: {turn['sql']}")
+            previous_sql = turn["sql"]
+        elif turn.get("message"):
+            lines.append(f"      Resposta: {turn['message']}")
+    return FOLLOWUP_PROMPT_TEMPLATE.format(
+        db_schema=db_schema,
+        history="\n".join(lines) or "    - (sem historico)",
+        previous_sql=previous_sql,
+        user_question=user_question,
+    )
+
+def plan_followup_prompt(user_question: str, db_schema: str, history: list, provider) -> PromptPlan:
+    """Prompt de continuacao no orcamento: aqui so o esquema e cortado (nao ha exemplos)."""
+    budget = settings.LLM_PROMPT_TOKEN_BUDGET
+    ratio = calibration(provider, FOLLOWUP_PROMPT_TEMPLATE)
+    prompt = build_followup_prompt(user_question, db_schema, history)
+    tokens = math.ceil(estimate_tokens(prompt) * ratio)
+    if budget <= 0 or tokens <= budget:
+        return PromptPlan(prompt, tokens, budget)
+
+    hints, tables = split_schema(db_schema)
+    kept = list(range(len(tables)))
+    dropped_tables = []
+    # A relevancia considera tambem as perguntas e o SQL anteriores que a continuacao refina
+    context = " ".join([user_question] + [f"{t['question']} {t.get('sql') or ''}" for t in history])
+    for i in table_drop_order(tables, context):
+        if tokens <= budget or len(kept) <= 1:
+            break
+        kept.remove(i)
+        dropped_tables.append(tables[i].partition("(")[0])
+        prompt = build_followup_prompt(user_question, join_schema(hints, [tables[k] for k in kept]), history)
+        tokens = math.ceil(estimate_tokens(prompt) * ratio)
+    if tokens > budget:
+        _over_budget(budget)
+    return PromptPlan(prompt, tokens, budget, 0, dropped_tables)
+
+def generate_ai_response(user_question: str, db_schema: str) -> AIResponseSchema:
+    """ 
+    Gera a resposta da IA com a consulta SQL e o tipo de visualização.
+    A resposta agora inclui uma mensagem amigável antes do JSON.
+    """
+    cls = request_class(user_question)
+    plan = plan_prompt(user_question, db_schema, get_provider(cls))
+    return _generate_from_prompt(plan, cls)
+
+def generate_followup_response(user_question: str, db_schema: str, history: list) -> AIResponseSchema:
+    """
+    Resposta para uma pergunta de continuacao dentro de uma sessao: usa o prompt
+    compacto com as ultimas trocas e a consulta anterior como base.
+    """
+    plan = plan_followup_prompt(user_question, db_schema, history, get_provider("followup"))
+    return _generate_from_prompt(plan, "followup")
+
+def _record_tokens(provider, request_class: str, plan: PromptPlan, response) -> dict:
+    """Registra o uso (os numeros do provedor quando ele os informa) e devolve o resumo da requisicao."""
+    input_tokens = response.input_tokens or plan.input_tokens
+    output_tokens = response.output_tokens or (estimate_tokens(response.text) if response.text else 0)
+    record_usage(provider.key, request_class, plan, input_tokens, output_tokens)
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "budget": plan.budget or None,
+        "examples_dropped": plan.examples_dropped,
+        "tables_dropped": plan.tables_dropped,
+    }
+
+def _generate_from_prompt(plan: PromptPlan, request_class: str = "default") -> AIResponseSchema:
+    """Envia o prompt ao provedor da classe e converte a resposta (mensagem + JSON) em AIResponseSchema."""
+    provider = get_provider(request_class)
+    prompt = plan.prompt
     try:
-        response = model.generate_content(prompt)
+        response = call_with_resilience(lambda timeout: provider.generate(prompt, timeout), provider.key)
+        token_usage = _record_tokens(provider, request_class, plan, response)
 
-        if response.prompt_feedback:
-            reason = response.prompt_feedback.block_reason
+        if response.blocked:
             return AIResponseSchema(
                 message="A sua pergunta foi bloqueada por razÃµes de seguranÃ§a. Por favor, reformule sua pergunta.",
                 sql_query="-- A IA bloqueou a pergunta do usuÃ¡rio. NÃ£o foi possÃ­vel gerar a consulta.",
@@ -553,8 +759,18 @@ def generate_ai_response(user_question: str, db_schema: str) -> AIResponseSchema
         data['message'] = message_text
         
         # Retorna o objeto validado pelo Pydantic
-        return AIResponseSchema(**data)
+        data['token_usage'] = token_usage
+        ai_response = AIResponseSchema(**data)
+        if ai_response.sql_query:
+            remember_response(prompt, ai_response)
+        return ai_response
     
+    except LLMUnavailable as e:
+        # Provedor degradado: usa a ultima resposta boa para o mesmo prompt, se houver
+        cached = fallback_response(prompt)
+        if cached is not None:
+            return cached.model_copy(update={"token_usage": None})
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except json.JSONDecodeError as e:
         # Se a IA retornou um JSON invÃ¡lido, criamos uma resposta de erro estruturada.
         print(f"Erro ao decodificar JSON da IA: {e}. Resposta recebida: {full_response}")
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Cache em disco dos arquivos de relatorio (CSV, PDF, XLSX, Parquet, Arrow).
+
+A chave e o hash do SQL normalizado + formato (+ titulo no PDF, + compressao no
+Parquet/Arrow) + versao dos dados (app.services.data_version): quando os dados
+mudam a chave muda e o arquivo antigo simplesmente deixa de ser usado. A chave
+leva o id do tenant como prefixo (namespace), entao tenants com o mesmo SQL
+nunca compartilham arquivos. O
+diretorio e compartilhado pelos workers; cada arquivo e gravado num temporario e
+renomeado atomicamente. O tamanho total e limitado por ARTIFACT_CACHE_MAX_MB,
+removendo os arquivos usados ha mais tempo (o acesso atualiza o mtime). Os
+acertos sao servidos com FileResponse, que usa envio direto do arquivo quando
+o servidor ASGI suporta (extensao pathsend) e leitura em blocos caso contrario.
+"""
+import asyncio
+import hashlib
+import inspect
+import os
+import re
+import tempfile
+import threading
+import uuid
+from fastapi.responses import FileResponse
+from app.core.config import settings
+from app.core.profiling import run_blocking
+from app.core.tenancy import current_tenant
+from app.services.data_version import get_data_version
+from app.services.report_service import REPORT_FORMATS, report_headers
+
+_STRING_LITERAL_RE = re.compile(r"('(?:[^']|'')*')")
+_evict_lock = threading.Lock()
+
+CACHE_STATS = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+
+def cache_dir() -> str:
+    path = settings.ARTIFACT_CACHE_DIR or os.path.join(tempfile.gettempdir(), "bi_report_cache")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def normalize_sql(sql: str) -> str:
+    """Colapsa espacos fora dos literais de texto e remove o ';' final."""
+    parts = _STRING_LITERAL_RE.split(sql.strip().rstrip(";").strip())
+    return "".join(part if i % 2 else " ".join(part.split()) for i, part in enumerate(parts))
+
+
+async def report_cache_key(sql: str, report_type: str, title: str, compression: str = None) -> str | None:
+    """Chave do relatorio ou None quando o cache esta desligado ou a versao dos dados e desconhecida."""
+    if not settings.ARTIFACT_CACHE_ENABLED or report_type not in REPORT_FORMATS:
+        return None
+    version = await get_data_version()
+    if version is None:
+        return None
+    parts = [normalize_sql(sql), report_type, version]
+    if report_type == "pdf":
+        parts.append(title or "")
+    if compression:
+        parts.append(compression.lower())
+    return f"{current_tenant().id}-" + hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def _path(key: str, report_type: str) -> str:
+    return os.path.join(cache_dir(), f"{key}.{REPORT_FORMATS[report_type][1]}")
+
+
+def _file_response(path: str, report_type: str, title: str) -> FileResponse:
+    media_type, disposition = report_headers(report_type, title)
+    return FileResponse(path, media_type=media_type, headers={"Content-Disposition": disposition})
+
+
+def cached_report_response(key: str, report_type: str, title: str) -> FileResponse | None:
+    """Resposta com o arquivo em cache, se existir (e marca o acesso para o LRU)."""
+    path = _path(key, report_type)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        CACHE_STATS["misses"] += 1
+        return None
+    CACHE_STATS["hits"] += 1
+    return _file_response(path, report_type, title)
+
+
+def _evict(keep: str = None):
+    """
+    Remove os arquivos menos usados ate o diretorio caber em ARTIFACT_CACHE_MAX_MB
+    (nunca o arquivo 'keep', que acabou de ser gravado e ainda sera enviado).
+    """
+    limit = settings.ARTIFACT_CACHE_MAX_MB * 1024 * 1024
+    with _evict_lock:
+        entries = []
+        total = 0
+        with os.scandir(cache_dir()) as it:
+            for entry in it:
+                if not entry.is_file() or ".tmp-" in entry.name or entry.path == keep:
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+                CACHE_STATS["evictions"] += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+async def render_to_cache(key: str, report_type: str, title: str, write) -> FileResponse:
+    """
+    Grava o relatorio no cache com write(fh) -- funcao sincrona (executada em
+    thread) ou assincrona -- e responde com o arquivo gravado.
+    """
+    path = _path(key, report_type)
+    tmp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+    try:
+        with open(tmp_path, "wb") as fh:
+            if inspect.iscoroutinefunction(write):
+                await write(fh)
+            else:
+                await run_blocking(write, fh)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    CACHE_STATS["stores"] += 1
+    await asyncio.to_thread(_evict, path)
+    return _file_response(path, report_type, title)
+
+
+def get_cache_stats() -> dict:
+    size = 0
+    files = 0
+    with os.scandir(cache_dir()) as it:
+        for entry in it:
+            if entry.is_file() and ".tmp-" not in entry.name:
+                files += 1
+                size += entry.stat().st_size
+    return {**CACHE_STATS, "files": files, "bytes": size, "max_bytes": settings.ARTIFACT_CACHE_MAX_MB * 1024 * 1024}
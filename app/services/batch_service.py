@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Execucao em lote do fluxo do /analyze (pergunta -> IA -> SQL -> dados).
+
+Perguntas repetidas sao deduplicadas (texto normalizado) e executadas uma vez;
+as chamadas a IA e as consultas SQL rodam com paralelismo limitado por
+semaforos separados, usando conexoes do pool do tenant. Perguntas reconhecidas
+pelo atalho de intencoes (intent_service) nao passam pela IA. Cada item retorna o
+resultado ou o erro correspondente, sem derrubar o lote inteiro.
+
+Relatorios (csv/pdf/xlsx/parquet/arrow) nao geram arquivo no lote: os dados
+voltam em JSON com o report_type indicado. Tabelas e relatorios passam pela
+mesma escolha de modo do /analyze (app.services.result_mode): ate
+RESULT_INLINE_MAX_ROWS linhas inline; acima disso so a primeira pagina, com
+next_cursor e links de download em response_mode. Graficos continuam inteiros,
+reduzidos pelo chart_service. Os itens sao processados sem contexto de sessao.
+"""
+import asyncio
+import json
+import re
+import time
+from fastapi import HTTPException
+from app.core.config import settings
+from app.core.profiling import run_blocking
+from app.core.tenancy import current_tenant
+from app.services.ai_service import generate_ai_response
+from app.services.db_service import fetch_result_set, get_schema_digest, tenant_registry
+from app.services.chart_service import downsample_chart
+from app.services.chat_classifier import classify_chat
+from app.services.intent_service import match_intent
+from app.services import query_log
+from app.services.result_mode import choose_table_mode
+from app.services.result_set import json_default
+
+CHART_TYPES = ("line", "bar", "pie")
+
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question).strip().casefold()
+
+
+async def _analyze_question(key: str, question: str, db_schema: str, llm_limit: asyncio.Semaphore, sql_limit: asyncio.Semaphore) -> tuple[str, dict]:
+    start = time.perf_counter()
+    query_log.set_question(question)
+    try:
+        intent = match_intent(question)
+        canned = classify_chat(question) if intent is None else None
+        if intent is not None:
+            ai_response = intent.ai_response
+        elif canned is not None:
+            ai_response = canned
+        else:
+            async with llm_limit:
+                ai_response = await run_blocking(generate_ai_response, question, db_schema)
+
+        item = {
+            "status": "ok",
+            "message": ai_response.message,
+            "query": ai_response.sql_query,
+            "data": None,
+            "visualization_type": ai_response.visualization_type if ai_response.sql_query else "text",
+            "report_type": ai_response.report_type,
+            "x_axis": ai_response.x_axis,
+            "y_axis": ai_response.y_axis,
+            "label": ai_response.label,
+            "value": ai_response.value,
+        }
+        if ai_response.token_usage is not None:
+            item["token_usage"] = ai_response.token_usage
+        if ai_response.sql_query and settings.RESULT_MODE_ENABLED and ai_response.visualization_type not in CHART_TYPES:
+            # Tabelas/relatorios grandes: so a primeira pagina no item, o resto por cursor
+            sql = str(intent.statement) if intent is not None else ai_response.sql_query
+            async with sql_limit:
+                async with tenant_registry().connect_reader() as db:
+                    mode = await choose_table_mode(
+                        db, sql, intent.params if intent is not None else None, ai_response.sql_query, question
+                    )
+            item["row_count"] = mode.counted_rows if mode.counted_rows is not None else mode.estimated_rows
+            item["response_mode"] = mode.describe()
+            item["data"] = mode.data.to_records()
+        elif ai_response.sql_query:
+            async with sql_limit:
+                if intent is not None:
+                    result = await fetch_result_set(None, intent.statement, params=intent.params)
+                else:
+                    result = await fetch_result_set(None, ai_response.sql_query)
+            item["row_count"] = len(result)
+            result, downsampling = downsample_chart(
+                result, ai_response.visualization_type, ai_response.x_axis, ai_response.y_axis, ai_response.label, ai_response.value
+            )
+            if downsampling is not None:
+                item["downsampling"] = downsampling
+            item["data"] = result.to_records()
+    except HTTPException as e:
+        item = {"status": "error", "error": e.detail}
+    except Exception as e:
+        item = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+
+    item["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return key, item
+
+
+def _plan(questions: list) -> tuple[list, dict]:
+    """Retorna as perguntas unicas (na ordem) e o mapa pergunta_normalizada -> indices."""
+    unique, indexes = [], {}
+    for i, question in enumerate(questions):
+        key = normalize_question(question)
+        if key not in indexes:
+            indexes[key] = []
+            unique.append((key, question))
+        indexes[key].append(i)
+    return unique, indexes
+
+
+async def _start(questions: list):
+    unique, indexes = _plan(questions)
+    db_schema = await get_schema_digest()
+    llm_limit = asyncio.Semaphore(settings.BATCH_LLM_CONCURRENCY)
+    tenant = current_tenant()
+    sql_limit = asyncio.Semaphore(min(settings.BATCH_SQL_CONCURRENCY, tenant.pool_size + tenant.max_overflow))
+    tasks = [
+        asyncio.ensure_future(_analyze_question(key, question, db_schema, llm_limit, sql_limit))
+        for key, question in unique
+    ]
+    return unique, indexes, tasks
+
+
+async def run_batch(questions: list) -> dict:
+    """Executa o lote e devolve todos os resultados na ordem original."""
+    unique, indexes, tasks = await _start(questions)
+
+    results = [None] * len(questions)
+    for key, item in await asyncio.gather(*tasks):
+        for i in indexes[key]:
+            results[i] = {"index": i, "question": questions[i], **item}
+    return {"count": len(questions), "unique": len(unique), "results": results}
+
+
+async def iter_batch_ndjson(questions: list):
+    """Gera uma linha NDJSON por item assim que cada pergunta unica termina."""
+    unique, indexes, tasks = await _start(questions)
+    try:
+        for future in asyncio.as_completed(tasks):
+            key, item = await future
+            for i in indexes[key]:
+                line = {"index": i, "question": questions[i], **item}
+                yield json.dumps(line, ensure_ascii=False, default=json_default) + "\n"
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Reducao dos dados de graficos antes da serializacao, para que o payload fique
+limitado a algumas centenas de pontos independentemente do tamanho do resultado.
+
+- line: LTTB (Largest-Triangle-Three-Buckets) sobre x_axis/y_axis, preservando
+  picos e vales; as linhas escolhidas sao mantidas inteiras.
+- bar com eixo x continuo (datas/horarios, ou numeros float/NUMERIC): agrupa
+  linhas consecutivas em CHART_MAX_POINTS faixas somando y (rotulo = primeiro x
+  da faixa).
+- bar categorico e pie: mantem as CHART_MAX_CATEGORIES / CHART_PIE_MAX_SLICES
+  maiores e soma o restante numa categoria "Outros". Eixos inteiros entram aqui:
+  em geral sao identificadores (clienteid, produtoid), e somar faixas de ids
+  vizinhos nao tem significado.
+
+Tudo com operacoes vetorizadas do NumPy sobre as colunas do ResultSet; o
+NumPy e importado dentro das funcoes, como em result_set, para nao pesar na
+importacao de app.main. Colunas NUMERIC (listas de Decimal) sao convertidas
+para float64 so para escolher os pontos; as somas das faixas e de "Outros" sao
+feitas em Decimal, exatas. Quando o eixo informado pela IA nao existe ou nao e
+numerico, os dados seguem inalterados.
+"""
+import datetime
+import decimal
+import math
+from app.core.config import settings
+from app.services.result_set import ResultSet
+
+
+def _column_index(result: ResultSet, name: str) -> int | None:
+    if not name:
+        return None
+    lowered = name.lower()
+    for i, column in enumerate(result.columns):
+        if column.lower() == lowered:
+            return i
+    return None
+
+
+def _numeric(array) -> "np.ndarray | None":
+    """Coluna como float64 (NaN para nulos) ou None se nao for numerica."""
+    import numpy as np
+
+    if isinstance(array, np.ndarray):
+        return array.astype(np.float64, copy=False)
+    out = np.empty(len(array), dtype=np.float64)
+    for i, v in enumerate(array):
+        if v is None:
+            out[i] = math.nan
+        elif isinstance(v, (int, float, decimal.Decimal)) and not isinstance(v, bool):
+            out[i] = float(v)
+        else:
+            return None
+    return out
+
+
+def _is_integer(array) -> bool:
+    import numpy as np
+
+    if isinstance(array, np.ndarray):
+        return array.dtype.kind in "iu"
+    return all(v is None or (isinstance(v, int) and not isinstance(v, bool)) for v in array)
+
+
+def _ordinal(array) -> "np.ndarray | None":
+    """
+    Eixo x continuo como float64: datas/horarios em segundos ou numeros nao
+    inteiros; None se categorico (texto ou inteiros, tratados como identificadores).
+    """
+    import numpy as np
+
+    if _is_integer(array):
+        return None
+    values = _numeric(array)
+    if values is not None:
+        return values
+    out = np.empty(len(array), dtype=np.float64)
+    for i, v in enumerate(array):
+        if isinstance(v, datetime.datetime):
+            out[i] = v.timestamp()
+        elif isinstance(v, datetime.date):
+            out[i] = v.toordinal() * 86400.0
+        elif v is None:
+            out[i] = math.nan
+        else:
+            return None
+    return out
+
+
+def lttb_indices(x: "np.ndarray", y: "np.ndarray", threshold: int) -> "np.ndarray":
+    """Indices escolhidos pelo LTTB (x crescente, sem NaN); sempre inclui o primeiro e o ultimo."""
+    import numpy as np
+
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def _segment_sums(array, order: "np.ndarray", starts: "np.ndarray"):
+    """
+    Soma de cada faixa de linhas (order reordena, starts marca o inicio de cada
+    faixa), no tipo da coluna: inteiros continuam inteiros e Decimal e somado exato.
+    """
+    import numpy as np
+
+    if isinstance(array, np.ndarray):
+        values = array[order]
+        if array.dtype.kind == "f":
+            values = np.nan_to_num(values)
+        return np.add.reduceat(values, starts)
+    bounds = starts.tolist() + [len(order)]
+    indices = order.tolist()
+    return [
+        sum((array[i] for i in indices[a:b] if array[i] is not None), 0)
+        for a, b in zip(bounds, bounds[1:])
+    ]
+
+
+def _take(array, indices: "np.ndarray"):
+    import numpy as np
+
+    if isinstance(array, np.ndarray):
+        return array[indices]
+    return [array[i] for i in indices.tolist()]
+
+
+def _subset(result: ResultSet, indices: "np.ndarray") -> ResultSet:
+    return ResultSet(result.columns, [_take(a, indices) for a in result.arrays], result.scales)
+
+
+def _downsample_line(result: ResultSet, xi: int, yi: int, limit: int):
+    import numpy as np
+
+    y = _numeric(result.arrays[yi])
+    if y is None:
+        return None
+    # Numa linha o eixo inteiro (ex.: dia do mes) ainda define a ordem dos pontos
+    x = _ordinal(result.arrays[xi])
+    if x is None and _is_integer(result.arrays[xi]):
+        x = _numeric(result.arrays[xi])
+    if x is None:
+        x = np.arange(len(y), dtype=np.float64)
+    valid = np.flatnonzero(~(np.isnan(x) | np.isnan(y)))
+    order = valid[np.argsort(x[valid], kind="stable")]
+    chosen = order[lttb_indices(x[order], y[order], limit)]
+    return _subset(result, chosen), "lttb"
+
+
+def _bucket_bars(result: ResultSet, x: "np.ndarray", xi: int, yi: int, limit: int):
+    import numpy as np
+
+    y = _numeric(result.arrays[yi])
+    if y is None:
+        return None
+    order = np.argsort(x, kind="stable")
+    starts = np.linspace(0, len(order), limit, endpoint=False).astype(np.int64)
+    sums = _segment_sums(result.arrays[yi], order, starts)
+    labels = _take(result.arrays[xi], order[starts])
+    columns = [result.columns[xi], result.columns[yi]]
+    return ResultSet(columns, [labels, sums], [None, result.scales[yi]]), "buckets"
+
+
+def _top_n_with_others(result: ResultSet, ci: int, vi: int, limit: int):
+    import numpy as np
+
+    values = _numeric(result.arrays[vi])
+    if values is None:
+        return None
+    filled = np.nan_to_num(values)
+    # As maiores categorias, na ordem original do resultado (respeita o ORDER BY da consulta)
+    top = np.sort(np.argsort(-filled, kind="stable")[: limit - 1])
+    rest = np.ones(len(filled), dtype=bool)
+    rest[top] = False
+    labels = _take(result.arrays[ci], top)
+    labels = (labels.tolist() if isinstance(labels, np.ndarray) else labels) + [settings.CHART_OTHERS_LABEL]
+    # Cada categoria do topo e uma faixa de uma linha; "Outros" e a faixa com o restante
+    # (chamado so com mais linhas que o limite, entao "Outros" nunca fica vazia)
+    order = np.concatenate([top, np.flatnonzero(rest)])
+    totals = _segment_sums(result.arrays[vi], order, np.arange(len(top) + 1))
+    columns = [result.columns[ci], result.columns[vi]]
+    return ResultSet(columns, [labels, totals], [None, result.scales[vi]]), "top_n"
+
+
+def downsample_chart(result: ResultSet, visualization_type: str, x_axis: str = None, y_axis: str = None,
+                     label: str = None, value: str = None) -> tuple[ResultSet, dict | None]:
+    """Retorna (resultado reduzido, descricao da reducao) ou (resultado original, None)."""
+    if not settings.CHART_DOWNSAMPLING_ENABLED or result.empty:
+        return result, None
+
+    if visualization_type == "pie":
+        ci, vi = _column_index(result, label), _column_index(result, value)
+    elif visualization_type in ("line", "bar"):
+        ci, vi = _column_index(result, x_axis), _column_index(result, y_axis)
+    else:
+        return result, None
+    if ci is None or vi is None:
+        return result, None
+
+    reduced = None
+    rows = len(result)
+    if visualization_type == "line":
+        if rows > settings.CHART_MAX_POINTS:
+            reduced = _downsample_line(result, ci, vi, settings.CHART_MAX_POINTS)
+    elif visualization_type == "bar":
+        x = _ordinal(result.arrays[ci])
+        if x is not None:
+            if rows > settings.CHART_MAX_POINTS:
+                reduced = _bucket_bars(result, x, ci, vi, settings.CHART_MAX_POINTS)
+        elif rows > settings.CHART_MAX_CATEGORIES:
+            reduced = _top_n_with_others(result, ci, vi, settings.CHART_MAX_CATEGORIES)
+    elif rows > settings.CHART_PIE_MAX_SLICES:
+        reduced = _top_n_with_others(result, ci, vi, settings.CHART_PIE_MAX_SLICES)
+    if reduced is None:
+        return result, None
+
+    data, method = reduced
+    return data, {"method": method, "original_rows": len(result), "rows": len(data)}
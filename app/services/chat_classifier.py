@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Classificador local (Naive Bayes multinomial sobre unigramas e bigramas) para
+mensagens que nao sao perguntas sobre dados: saudacoes, agradecimentos,
+despedidas, perguntas sobre as capacidades do assistente e pedidos fora de
+escopo. Essas mensagens recebem uma resposta pronta, sem chamar a IA.
+
+O modelo e treinado na importacao com os exemplos abaixo (os mesmos cenarios
+do prompt da IA e variacoes); uma frase identica a um exemplo usa a classe dele
+diretamente. Por seguranca a resposta pronta so e usada quando:
+- a classe prevista nao e "dados" e a confianca passa de CHAT_CLASSIFIER_MIN_CONFIDENCE;
+- a maior parte das palavras e conhecida pelo modelo;
+- nenhuma palavra e exclusiva das perguntas sobre dados nos exemplos de treino;
+- nenhuma palavra pertence ao vocabulario de dados (DATA_VOCABULARY_STEMS:
+  vendas, clientes, faturamento, produtos...), mantido a parte dos exemplos,
+  ja que termos como "vendas" tambem aparecem em classes que nao sao de dados
+  ("envie por email o ultimo relatorio de vendas").
+Nos demais casos a mensagem segue para a IA normalmente.
+"""
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from app.core.config import settings
+from app.models.request_models import AIResponseSchema
+
+TRAINING_EXAMPLES = {
+    "saudacao": [
+        "oi", "oi tudo bem", "ola", "ola tudo bem", "bom dia", "boa tarde", "boa noite",
+        "e ai", "opa", "oi bom dia", "ola boa tarde", "oi como vai", "tudo bem com voce",
+        "oi assistente", "hey", "hello", "oi tudo certo", "bom dia tudo bem",
+    ],
+    "agradecimento": [
+        "obrigado", "obrigada", "muito obrigado", "valeu", "obrigado pela ajuda",
+        "valeu pela ajuda", "agradeco", "perfeito obrigado", "otimo obrigado", "show valeu",
+        "beleza obrigado", "legal obrigado", "ajudou muito obrigado",
+    ],
+    "despedida": [
+        "tchau", "ate logo", "ate mais", "ate amanha", "falou", "tchau obrigado",
+        "por hoje e so", "era so isso", "so isso mesmo", "encerrar",
+    ],
+    "capacidades": [
+        "o que voce pode fazer", "o que voce faz", "como voce funciona", "quem e voce",
+        "como pode me ajudar", "quais sao suas funcoes", "o que voce sabe fazer",
+        "para que serve voce", "como usar voce", "quais perguntas posso fazer",
+        "me ajuda", "ajuda", "o que eu posso perguntar", "voce e um robo",
+    ],
+    "fora_de_escopo": [
+        "qual a previsao do tempo para amanha", "vai chover hoje", "qual a temperatura agora",
+        "quem ganhou o jogo ontem", "me conta uma piada", "qual a capital da franca",
+        "qual a cotacao do dolar", "qual sua opiniao sobre politica", "escreva um poema",
+        "quem descobriu o brasil", "qual o sentido da vida", "traduza para o ingles",
+        "como esta o transito", "qual o resultado do futebol",
+    ],
+    "acao_externa": [
+        "voce pode enviar o relatorio por email", "envie o relatorio por email para a diretoria",
+        "mande por email", "envia no whatsapp", "manda esse arquivo para meu chefe",
+        "agende uma reuniao", "imprima o relatorio", "compartilhe no teams",
+        "envie por email o ultimo relatorio de vendas",
+    ],
+    "dados": [
+        "quais sao os top 3 vendedores que mais venderam no mes de julho",
+        "qual a proporcao de vendas por categoria de produto",
+        "quais sao os 5 produtos mais vendidos em uma tabela",
+        "liste todas as contas a receber com status a vencer",
+        "gere um relatorio em pdf com todos os pedidos do ultimo trimestre",
+        "quero um arquivo csv com todos os clientes cadastrados",
+        "quero ver o faturamento total por mes em um grafico de linhas",
+        "liste os clientes de sao paulo em uma tabela",
+        "gere um relatorio em excel com o detalhe dos itens vendidos",
+        "preciso de um resumo financeiro em pdf do primeiro semestre",
+        "exporte para csv a lista de produtos com estoque baixo",
+        "mostre em um grafico de barras o total faturado por cliente",
+        "qual o status dos nossos pedidos",
+        "qual foi o ticket medio por pedido",
+        "como foram as vendas", "me mostre os top 5", "quanto vendemos hoje",
+        "quantos clientes temos", "faturamento do mes", "vendas por vendedor",
+        "estoque atual dos produtos", "notas fiscais emitidas", "parcelas pagas e pendentes",
+        "maiores clientes do ano", "pedidos cancelados", "receita por regiao",
+    ],
+}
+
+CANNED_MESSAGES = {
+    "saudacao": "Olá! Tudo bem por aqui. Sou uma IA assistente de dados. Como posso ajudar com as informações do banco de dados `Atos_IA` hoje?",
+    "agradecimento": "De nada! Se precisar de mais alguma análise ou relatório, é só pedir.",
+    "despedida": "Até logo! Quando precisar de uma nova análise ou relatório, é só chamar.",
+    "capacidades": (
+        "Eu posso acessar o banco de dados `Atos_IA` para responder perguntas sobre Vendas, Produtos, "
+        "Clientes e Finanças. Você pode me pedir para:\n- Criar tabelas com dados específicos.\n"
+        "- Gerar gráficos de barras, pizza e linhas.\n- Exportar relatórios nos formatos PDF, CSV, Excel, "
+        "Parquet e Arrow.\nO que você gostaria de analisar?"
+    ),
+    "fora_de_escopo": (
+        "Essa informação está fora do meu alcance. Minha especialidade é fornecer insights e relatórios "
+        "sobre os dados internos da empresa, como vendas, clientes e estoque."
+    ),
+    "acao_externa": (
+        "Eu posso gerar o relatório para você em formato PDF ou Excel, mas não tenho a capacidade de enviar "
+        "e-mails ou mensagens. Você pode baixar o arquivo que eu gerar e enviá-lo em seguida."
+    ),
+}
+
+DATA_LABEL = "dados"
+
+# Radicais do vocabulario do banco: qualquer palavra que comece com um deles
+# veta a resposta pronta ("previsao de vendas" e pergunta sobre dados)
+DATA_VOCABULARY_STEMS = (
+    "vend", "fatur", "client", "produt", "pedid", "estoq", "receit", "lucr", "ticket",
+    "categori", "fornecedor", "compra", "pagament", "parcel", "financ", "fiscal", "item", "itens",
+    "contas", "tabela", "grafico",
+)
+
+_stats_lock = threading.Lock()
+CHAT_STATS = {"total": 0, "answered": 0, "by_label": {label: 0 for label in CANNED_MESSAGES}}
+
+
+def _tokens(text: str) -> list:
+    text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode()
+    return re.findall(r"[a-z0-9]+", text)
+
+
+def _features(tokens: list) -> list:
+    return tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def has_data_vocabulary(tokens: list) -> bool:
+    return any(token.startswith(DATA_VOCABULARY_STEMS) for token in tokens)
+
+
+class NaiveBayesClassifier:
+    """Naive Bayes multinomial com suavizacao de Laplace."""
+
+    def __init__(self, examples: dict, alpha: float = 1.0):
+        self.alpha = alpha
+        self.counts = {label: Counter() for label in examples}
+        total_examples = sum(len(texts) for texts in examples.values())
+        self.log_priors = {label: math.log(len(texts) / total_examples) for label, texts in examples.items()}
+        self.words = {label: set() for label in examples}
+        for label, texts in examples.items():
+            for sample in texts:
+                tokens = _tokens(sample)
+                self.words[label].update(tokens)
+                self.counts[label].update(_features(tokens))
+        # Frases de treino exatas (normalizadas) decidem sem depender das probabilidades
+        self.exact = {" ".join(_tokens(sample)): label for label, texts in examples.items() for sample in texts}
+        self.vocabulary = set().union(*self.counts.values())
+        self.totals = {label: sum(counter.values()) for label, counter in self.counts.items()}
+        other_words = set().union(*(words for label, words in self.words.items() if label != DATA_LABEL))
+        # Palavras que so aparecem nas perguntas sobre dados: vetam a resposta pronta
+        self.data_only_words = self.words[DATA_LABEL] - other_words
+
+    def predict(self, text: str) -> tuple[str, float, float, list]:
+        """Retorna (classe, probabilidade, fracao de palavras conhecidas, tokens)."""
+        tokens = _tokens(text)
+        if " ".join(tokens) in self.exact:
+            return self.exact[" ".join(tokens)], 1.0, 1.0, tokens
+        features = [f for f in _features(tokens) if f in self.vocabulary]
+        known = sum(1 for t in tokens if t in self.vocabulary) / len(tokens) if tokens else 0.0
+        size = len(self.vocabulary)
+        scores = {}
+        for label, counter in self.counts.items():
+            denominator = self.totals[label] + self.alpha * size
+            scores[label] = self.log_priors[label] + sum(
+                math.log((counter[f] + self.alpha) / denominator) for f in features
+            )
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1.0 / norm, known, tokens
+
+
+CLASSIFIER = NaiveBayesClassifier(TRAINING_EXAMPLES)
+
+
+def classify_chat(question: str) -> AIResponseSchema | None:
+    """Resposta pronta para conversa/meta/fora de escopo, ou None para seguir o fluxo normal."""
+    if not settings.CHAT_CLASSIFIER_ENABLED:
+        return None
+    label, probability, known, tokens = CLASSIFIER.predict(question)
+    answered = (
+        label != DATA_LABEL
+        and 0 < len(tokens) <= settings.CHAT_CLASSIFIER_MAX_WORDS
+        and probability >= settings.CHAT_CLASSIFIER_MIN_CONFIDENCE
+        and known >= 0.5
+        and not CLASSIFIER.data_only_words.intersection(tokens)
+        and not has_data_vocabulary(tokens)
+        and not any(t.isdigit() for t in tokens)
+    )
+    with _stats_lock:
+        CHAT_STATS["total"] += 1
+        if answered:
+            CHAT_STATS["answered"] += 1
+            CHAT_STATS["by_label"][label] += 1
+    if not answered:
+        return None
+    return AIResponseSchema(message=CANNED_MESSAGES[label], sql_query=None, visualization_type=None)
+
+
+def get_chat_stats() -> dict:
+    with _stats_lock:
+        total, answered = CHAT_STATS["total"], CHAT_STATS["answered"]
+        return {
+            "total": total,
+            "answered": answered,
+            "answer_rate": round(answered / total, 4) if total else 0.0,
+            "by_label": dict(CHAT_STATS["by_label"]),
+        }
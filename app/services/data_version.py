@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Versao barata dos dados, usada para ETag/Last-Modified das rotas estaticas
+(e como parte da chave de caches derivados dos dados).
+
+A versao combina a data corrente (as consultas estaticas dependem do mes/ano
+atuais) com a soma dos contadores de insert/update/delete do pg_stat_user_tables
+do schema, sem os rollups e as sessoes de conversa (escritas pela propria
+aplicacao, nao sao mudancas nos dados). A consulta roda sempre no primary: nas replicas esses contadores nao
+sao atualizados pela replicacao. O valor fica em cache por DATA_VERSION_TTL_SECONDS,
+separado por tenant (cada um com o seu schema/banco).
+"""
+import datetime
+import email.utils
+import hashlib
+import time
+from fastapi import Request, Response
+from sqlalchemy import text
+from app.core.config import settings
+from app.core.tenancy import TENANTS, current_tenant
+from app.services import db_service
+
+DATA_VERSION_QUERY = text(r"""
+    SELECT COALESCE(SUM(n_tup_ins + n_tup_upd + n_tup_del), 0)
+    FROM pg_stat_user_tables
+    WHERE schemaname = :schema AND relname NOT LIKE 'rollup\_%' AND relname <> 'conversa_sessoes'
+""")
+
+# Ultima versao vista neste worker e o instante em que ela mudou (Last-Modified), por tenant
+_VERSIONS = {}
+
+
+def _version_state(tenant_id: str) -> dict:
+    return _VERSIONS.setdefault(tenant_id, {"value": None, "checked_at": 0.0, "changed_at": time.time()})
+
+
+async def get_data_version() -> str | None:
+    """Versao atual dos dados do tenant ou None se nao for possivel obte-la (sem cache HTTP)."""
+    tenant = current_tenant()
+    state = _version_state(tenant.id)
+    now = time.time()
+    if state["value"] is not None and now - state["checked_at"] < settings.DATA_VERSION_TTL_SECONDS:
+        return state["value"]
+
+    engine = db_service.primary_engine(tenant)
+    if engine is None:
+        return None
+    try:
+        async with engine.connect() as connection:
+            counter = (await connection.execute(DATA_VERSION_QUERY, {"schema": tenant.schema})).scalar()
+    except Exception as e:
+        print(f"Erro ao obter a versao dos dados: {e}")
+        return None
+
+    version = f"{datetime.date.today().isoformat()}:{counter}"
+    if version != state["value"]:
+        state["changed_at"] = now
+    state["value"] = version
+    state["checked_at"] = now
+    return version
+
+
+def _etag(scope: str, version: str) -> str:
+    return 'W/"' + hashlib.sha1(f"{scope}|{version}".encode()).hexdigest()[:20] + '"'
+
+
+async def conditional_headers(request: Request, scope: str) -> tuple[dict, bool]:
+    """
+    Monta ETag/Last-Modified para o recurso 'scope' e diz se o cliente ja tem a
+    versao atual (If-None-Match, ou If-Modified-Since na falta dele).
+    """
+    version = await get_data_version()
+    if version is None:
+        return {}, False
+
+    tenant = current_tenant()
+    etag = _etag(f"{tenant.id}|{scope}", version)
+    last_modified = int(_version_state(tenant.id)["changed_at"])
+    headers = {
+        "ETag": etag,
+        "Last-Modified": email.utils.formatdate(last_modified, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+    if len(TENANTS) > 1:
+        # A mesma URL responde dados diferentes por tenant
+        headers["Vary"] = f"{settings.TENANT_HEADER}, {settings.TENANT_TOKEN_HEADER}"
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {t.strip() for t in if_none_match.split(",")}
+        return headers, "*" in tags or etag in tags or etag[2:] in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return headers, False
+        return headers, last_modified <= since
+    return headers, False
+
+
+def not_modified_response(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
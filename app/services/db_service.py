@@ -2,98 +2,329 @@
 from fastapi import HTTPException, status
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy import text, inspect
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.engine.base import Engine
 import os
+import re
+import time
 from dotenv import load_dotenv
+from app.core import db_connector
+from app.core.config import settings
+from app.core.db_registry import DatabaseRegistry
+from app.core.tenancy import DEFAULT_TENANT, TENANTS, Tenant, current_tenant
+from app.services import query_log
+from app.services.result_set import ResultSet
+from app.services.sql_params import parameterize_literals
 
 # 1. Carrega a URL do banco (necessario se o db_service for inicializado primeiro)
 load_dotenv()
-db_connection_string = os.getenv("DATABASE_URL")
 
+def _async_url(url: str) -> str:
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql+asyncpg://", 1)
+    return url
+
+db_connection_string = os.getenv("DATABASE_URL")
 if db_connection_string:
-    if db_connection_string.startswith("postgresql://"):
-        db_connection_string = db_connection_string.replace("postgresql://", "postgresql+asyncpg://", 1)
-    elif db_connection_string.startswith("postgres://"):
-        db_connection_string = db_connection_string.replace("postgres://", "postgresql+asyncpg://", 1)
-
-# 2. CRIACAO DO ENGINE GLOBAL ASSINCRONO
-try:
-    if db_connection_string:
-        GLOBAL_ASYNC_ENGINE = create_async_engine(
-            db_connection_string,
-            pool_size=5,
-            max_overflow=10,
-            connect_args={
-                "server_settings": {"search_path": "unit"}
-            }
-        )
-    else:
-        GLOBAL_ASYNC_ENGINE = None
-except Exception as e:
-    GLOBAL_ASYNC_ENGINE = None
-    print(f"ERRO CRITICO NA INICIALIZACAO DO ENGINE ASSINCRONO: {e}")
+    db_connection_string = _async_url(db_connection_string)
+
+def create_pg_engine(url: str, pool_size: int, schema: str = None, max_overflow: int = None):
+    """Engine assincrono com o pool, o search_path e o cache de statements configurados."""
+    return create_async_engine(
+        url,
+        pool_size=pool_size,
+        max_overflow=settings.DB_MAX_OVERFLOW if max_overflow is None else max_overflow,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        connect_args={
+            "server_settings": {"search_path": schema or settings.DB_SCHEMA},
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        }
+    )
+
+# 2. CRIACAO DOS ENGINES ASSINCRONOS E DO REGISTRO DE BANCOS DE CADA TENANT
+# Cada tenant (app.core.tenancy) tem pools proprios, com o search_path no seu schema:
+# um tenant que esgota as conexoes nao bloqueia os demais.
+def _build_registry(tenant: Tenant) -> DatabaseRegistry:
+    registry = DatabaseRegistry(settings.DB_READ_ROUTING, settings.DB_REPLICA_FALLBACK_TO_PRIMARY)
+    url = _async_url(tenant.database_url) if tenant.dedicated_database else db_connection_string
+    try:
+        if url:
+            engine = create_pg_engine(url, tenant.pool_size, tenant.schema, tenant.max_overflow)
+            registry.register("primary", "primary", engine)
+    except Exception as e:
+        print(f"ERRO CRITICO NA INICIALIZACAO DO ENGINE ASSINCRONO (tenant {tenant.id}): {e}")
+
+    # Tenants em banco proprio nao usam as replicas do banco compartilhado
+    if not tenant.dedicated_database:
+        for i, replica_url in enumerate(settings.DATABASE_REPLICA_URLS, start=1):
+            try:
+                engine = create_pg_engine(_async_url(replica_url), tenant.replica_pool_size, tenant.schema, tenant.max_overflow)
+                registry.register(f"replica{i}", "replica", engine)
+            except Exception as e:
+                print(f"ERRO NA INICIALIZACAO DA REPLICA {i} (tenant {tenant.id}): {e}")
+    return registry
+
+TENANT_REGISTRIES = {tenant.id: _build_registry(tenant) for tenant in TENANTS.values()}
+
+# Registro e engine do tenant padrao (usados fora de requisicoes: health, gunicorn)
+DB_REGISTRY = TENANT_REGISTRIES[DEFAULT_TENANT.id]
+GLOBAL_ASYNC_ENGINE = DB_REGISTRY.primary.engine if DB_REGISTRY.primary is not None else None
+
+if db_connector.engine is not None:
+    DB_REGISTRY.register("mssql", "mssql", db_connector.engine, is_async=False)
+
+def tenant_registry(tenant: Tenant = None) -> DatabaseRegistry:
+    """Registro de bancos do tenant (por padrao, o da requisicao atual)."""
+    return TENANT_REGISTRIES[(tenant or current_tenant()).id]
+
+def primary_engine(tenant: Tenant = None):
+    """Engine do primary do tenant ou None se nao foi inicializado."""
+    primary = tenant_registry(tenant).primary
+    return primary.engine if primary is not None else None
 
 # 3. FUNCOES DE SERVICO AGORA SAO ASSINCRONAS
 
-async def get_database_schema(db_url: str) -> str:
+# Resumo do esquema (tabelas e colunas) enviado no prompt da IA, por tenant. E carregado
+# uma unica vez (no master do gunicorn quando preload_app esta ativo) e herdado pelos workers.
+SCHEMA_DIGESTS = {}
+SCHEMA_DIGEST_FALLBACK = "Esquema de BD em PostgreSQL com driver asyncpg."
+
+ROLLUP_TABLE_PREFIX = "rollup_"
+ROLLUP_WATERMARK_TABLE = "rollup_watermark"
+# Tabelas internas da aplicacao: fora do resumo enviado a IA e recusadas no SQL gerado
+SESSION_TABLE_NAME = "conversa_sessoes"
+INTERNAL_SQL_NAMES = re.compile(
+    rf"\b({re.escape(settings.SESSION_SCHEMA)}|{SESSION_TABLE_NAME}|{ROLLUP_WATERMARK_TABLE})\b", re.IGNORECASE
+)
+ROLLUP_DIGEST_HINT = (
+    "-- Tabelas rollup_* sao pre-agregadas a partir de pedidosvenda/itenspedidovenda "
+    "(vendas: dia|mes, clienteid, vendedorid, statuspedido, pedidos, valor_total; "
+    "itens: dia|mes, produtoid, categoriaid, vendedorid, quantidade, valor_total, pedidos). "
+    "Prefira-as para totais, contagens e rankings por periodo, cliente, vendedor, status, "
+    "produto ou categoria; use as tabelas brutas apenas para detalhes por pedido."
+)
+
+SCHEMA_DIGEST_QUERY = text("""
+    SELECT table_name, column_name, data_type
+    FROM information_schema.columns
+    WHERE table_schema = :schema
+    ORDER BY table_name, ordinal_position
+""")
+
+async def load_schema_digest(tenant: Tenant = None) -> str:
     """
-    Extrai e formata o esquema do banco de dados usando SQLAlchemy (Assincrono).
-    Compativel com PostgreSQL/Supabase.
+    Le as tabelas e colunas do schema do tenant e monta um resumo compacto
+    no formato 'tabela(coluna tipo, ...)', uma tabela por linha.
     """
-    if GLOBAL_ASYNC_ENGINE is None:
+    tenant = tenant or current_tenant()
+    engine = primary_engine(tenant)
+    if engine is None:
         raise Exception("O motor do banco de dados nao foi inicializado corretamente.")
-        
-    try:
-        # Usa o motor assincrono para conectar
-        async with GLOBAL_ASYNC_ENGINE.connect() as connection:
-            # NOTA: A introspeccao no SQLAlchemy Assincrono e um pouco mais complexa e
-            # requer o uso de run_in_threadpool ou funcoes especificas de introspeccao.
-            # Para este erro, vamos simplificar a conexao para a execucao de queries.
-            
-            # Vamos usar uma query SQL nativa para introspeccao simples se necessario
-            # mas mantemos o codigo original mais proximo para esta correcao.
-            
-            # A introspeccao nao e nativamente assincrona, mas o core.run_sync pode ajudar.
-            # No entanto, para fins de correcao de erro de execucao, a funcao nao sera mais chamada.
-            # Se for chamada, tera que ser envolvida pelo run_in_threadpool na rota.
-            pass
-
-        # Deixamos o retorno do esquema como esta, mas o fetch sera feito na rota
-        # ou a IA se baseara na string de conexao se voce nao quiser fazer introspeccao.
-        # Retornamos uma string placeholder para evitar erros por enquanto.
-        return "Esquema de BD em PostgreSQL com driver asyncpg."
 
+    async with engine.connect() as connection:
+        result = await connection.execute(SCHEMA_DIGEST_QUERY, {"schema": tenant.schema})
+        tables = {}
+        for table_name, column_name, data_type in result.all():
+            tables.setdefault(table_name, []).append(f"{column_name} {data_type}")
+
+    # Rollups (pre-agregados) vem primeiro, com a dica de uso; a marca d'agua e interna
+    tables.pop(ROLLUP_WATERMARK_TABLE, None)
+    tables.pop(SESSION_TABLE_NAME, None)
+    rollups = [name for name in tables if name.startswith(ROLLUP_TABLE_PREFIX)]
+    ordered = rollups + [name for name in tables if name not in rollups]
+    lines = [f"{tenant.schema}.{name}({', '.join(tables[name])})" for name in ordered]
+    if rollups:
+        lines.insert(0, ROLLUP_DIGEST_HINT)
+    digest = "\n".join(lines) if lines else SCHEMA_DIGEST_FALLBACK
+    SCHEMA_DIGESTS[tenant.id] = digest
+    return digest
+
+async def get_schema_digest(tenant: Tenant = None) -> str:
+    """Retorna o resumo do esquema do tenant em cache, carregando-o na primeira chamada."""
+    tenant = tenant or current_tenant()
+    if tenant.id in SCHEMA_DIGESTS:
+        return SCHEMA_DIGESTS[tenant.id]
+    try:
+        return await load_schema_digest(tenant)
     except Exception as e:
-        raise Exception(f"Erro de conexao ou ao extrair o esquema: {e}") 
+        print(f"Erro ao extrair o esquema do banco de dados: {e}")
+        return SCHEMA_DIGEST_FALLBACK
+
+async def get_database_schema(db_url: str) -> str:
+    """
+    Extrai e formata o esquema do banco de dados usando SQLAlchemy (Assincrono).
+    Compativel com PostgreSQL/Supabase. Mantida por compatibilidade; use get_schema_digest.
+    """
+    return await get_schema_digest()
+
+def _as_statement(sql_query):
+    """Aceita o SQL como texto (vindo da IA) ou como text() ja compilado (templates)."""
+    return text(sql_query) if isinstance(sql_query, str) else sql_query
+
+FORBIDDEN_SQL_KEYWORDS = ["INSERT", "UPDATE", "DELETE", "DROP", "ALTER", "CREATE"]
 
-async def execute_sql_query(conn, sql_query: str) -> list:
+def check_read_only(sql_query):
+    """Validacao de seguranca aplicada antes de executar qualquer SQL vindo da IA ou de um cursor."""
+    sql = str(_as_statement(sql_query))
+    if any(keyword in sql.upper() for keyword in FORBIDDEN_SQL_KEYWORDS):
+        raise ValueError("Comandos nao permitidos na consulta SQL.")
+    if INTERNAL_SQL_NAMES.search(sql):
+        raise ValueError("A consulta SQL cita tabelas internas da aplicacao.")
+
+async def execute_sql_query(conn, sql_query) -> list:
     """
     Executa a consulta SQL assincrona e retorna os dados como uma lista de dicionarios.
+    Aceita texto ou um text() compilado no nivel do modulo (rotas estaticas).
     """
-    if GLOBAL_ASYNC_ENGINE is None:
+    if primary_engine() is None:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="O motor do banco de dados nao foi inicializado corretamente.")
         
     try:
+        statement = _as_statement(sql_query)
         # A validacao de seguranca e mantida aqui
-        if any(keyword in sql_query.upper() for keyword in ["INSERT", "UPDATE", "DELETE", "DROP", "ALTER", "CREATE"]):
-            raise ValueError("Comandos nao permitidos na consulta SQL.")
+        check_read_only(statement)
 
         # Execute usando a AsyncConnection fornecida; caso contrario, abra uma nova
+        # no banco de leitura escolhido pelo registro do tenant (replica ou primary)
         if conn is None:
-            async with GLOBAL_ASYNC_ENGINE.connect() as connection:
-                result = await connection.execute(text(sql_query))
+            async with tenant_registry().connect_reader() as connection:
+                result = await connection.execute(statement)
                 columns = result.keys()
                 rows = [dict(zip(columns, row)) for row in result.all()]
                 return rows
         else:
-            result = await conn.execute(text(sql_query))
+            result = await conn.execute(statement)
             columns = result.keys()
             rows = [dict(zip(columns, row)) for row in result.all()]
             return rows
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Erro ao executar a consulta SQL: {e}")
 
+class QueryColumns(list):
+    """
+    Nomes das colunas do resultado (uma lista comum para quem so precisa deles)
+    com os OIDs dos tipos PostgreSQL informados pelo driver em type_oids (None
+    se o driver nao os expuser). A exportacao Parquet/Arrow monta o schema por eles.
+    """
+
+    def __init__(self, names, type_oids: list | None = None):
+        super().__init__(names)
+        self.type_oids = type_oids
+
+
+def _result_columns(result) -> QueryColumns:
+    try:
+        description = result._real_result.cursor.description
+        type_oids = [column[1] if isinstance(column[1], int) else None for column in description]
+    except (AttributeError, IndexError, TypeError):
+        type_oids = None
+    return QueryColumns(result.keys(), type_oids)
+
+async def _open_stream(connection, sql_query, statement, params):
+    """
+    Abre o cursor. Para SQL em texto sem params (gerado pela IA), tenta antes a
+    versao com literais trocados por binds dentro de um savepoint; se o banco
+    rejeitar (ex.: tipo do bind incompativel), volta para o SQL original.
+    Retorna (resultado, savepoint_ou_None).
+    """
+    if params is None and isinstance(sql_query, str) and settings.DB_PARAMETERIZE_SQL:
+        bound_sql, bound_params = parameterize_literals(sql_query)
+        if bound_params:
+            savepoint = await connection.begin_nested()
+            try:
+                return await connection.stream(text(bound_sql), bound_params), savepoint
+            except DBAPIError as e:
+                await savepoint.rollback()
+                print(f"Consulta parametrizada rejeitada, usando SQL original: {e.orig!r}")
+    return await connection.stream(statement, params or {}), None
+
+async def stream_query_partitions(conn, sql_query, chunk_rows: int = 5000, params: dict = None):
+    """
+    Executa a consulta com cursor no servidor e gera (colunas, linhas) em lotes
+    de chunk_rows, sem carregar o resultado inteiro na memoria. params preenche
+    os binds (:nome) de consultas parametrizadas. colunas e um QueryColumns.
+    """
+    if primary_engine() is None:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="O motor do banco de dados nao foi inicializado corretamente.")
+
+    try:
+        statement = _as_statement(sql_query)
+        check_read_only(statement)
+
+        async def _stream(connection):
+            # Mede apenas o tempo esperando o banco (nao o consumo dos lotes) para o log de consultas
+            db_seconds, row_count, error = 0.0, 0, None
+            started = time.perf_counter()
+            try:
+                result, savepoint = await _open_stream(connection, sql_query, statement, params)
+                db_seconds += time.perf_counter() - started
+                columns = _result_columns(result)
+                partitions = result.partitions(chunk_rows).__aiter__()
+                empty = True
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        rows = await partitions.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        db_seconds += time.perf_counter() - started
+                    empty = False
+                    row_count += len(rows)
+                    yield columns, rows
+                if empty:
+                    yield columns, []
+                if savepoint is not None:
+                    await savepoint.commit()
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                query_log.record_query(str(statement), params, db_seconds * 1000, row_count, error)
+
+        if conn is None:
+            async with tenant_registry().connect_reader() as connection:
+                async for partition in _stream(connection):
+                    yield partition
+        else:
+            async for partition in _stream(conn):
+                yield partition
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Erro ao executar a consulta SQL: {e}")
+
+async def fetch_result_set(conn, sql_query, chunk_rows: int = 5000, params: dict = None) -> ResultSet:
+    """
+    Executa a consulta e monta o resultado em formato colunar (ResultSet),
+    acumulando cada lote direto nas listas por coluna.
+    """
+    columns, buffers = [], []
+    async for columns, rows in stream_query_partitions(conn, sql_query, chunk_rows, params):
+        if not buffers:
+            buffers = [[] for _ in columns]
+        for buffer, values in zip(buffers, zip(*rows)):
+            buffer.extend(values)
+    if not buffers:
+        buffers = [[] for _ in columns]
+    return ResultSet.from_columns(columns, buffers)
+
 def get_db_session():
     """Dependencia para obter uma sessao assincrona, se necessario."""
     # Embora nao esteja sendo usada na rota 'analyze', e o padrao de FastAPI.
-    return GLOBAL_ASYNC_ENGINE.begin()
+    return primary_engine().begin()
+
+def dispose_engine_after_fork():
+    """
+    Descarta as conexoes herdadas do processo pai apos o fork de um worker
+    (primary, replicas e MSSQL de todos os tenants).
+    Com close=False o worker nao fecha os sockets do pai, apenas passa a abrir
+    conexoes proprias no seu event loop.
+    """
+    for registry in TENANT_REGISTRIES.values():
+        registry.dispose_after_fork()
+
+async def dispose_all():
+    """Fecha os pools de todos os tenants."""
+    for registry in TENANT_REGISTRIES.values():
+        await registry.dispose()
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Estado de saude da instancia (liveness/readiness).
+
+No startup o warm-up preenche o pool de conexoes, carrega o resumo do esquema,
+monta o prefixo do prompt e verifica a conectividade com a IA. Depois disso um
+laco em segundo plano revalida os bancos (primary, replicas e MSSQL) periodicamente. As rotas de health apenas
+leem o estado em cache, sem abrir conexoes por requisicao.
+
+Com varios tenants, os pools e o esquema de todos sao aquecidos e revalidados,
+mas a prontidao depende apenas do tenant padrao: um banco de tenant fora do ar
+aparece em "tenants" sem tirar a instancia do balanceador.
+"""
+import asyncio
+import time
+from sqlalchemy import text
+from app.core.config import settings
+from app.core.tenancy import DEFAULT_TENANT, TENANTS
+from app.services import db_service
+
+HEALTH_STATE = {
+    "started_at": time.time(),
+    "warm_up_done": False,
+    "ready": False,
+    "refreshed_at": None,
+    "checks": {},
+    "targets": None,
+    "tenants": None,
+}
+
+_refresh_task = None
+
+
+def _set_check(name: str, ok: bool, detail: str = None, elapsed_ms: float = None):
+    HEALTH_STATE["checks"][name] = {
+        "ok": ok,
+        "detail": detail,
+        "elapsed_ms": round(elapsed_ms, 1) if elapsed_ms is not None else None,
+        "checked_at": time.time(),
+    }
+    _update_ready()
+
+
+def _update_ready():
+    HEALTH_STATE["ready"] = HEALTH_STATE["warm_up_done"] and all(
+        c["ok"] for c in HEALTH_STATE["checks"].values()
+    )
+
+
+async def _timed(name: str, coro):
+    """Executa uma verificacao com timeout e registra o resultado no estado."""
+    start = time.perf_counter()
+    try:
+        detail = await asyncio.wait_for(coro, timeout=settings.HEALTH_CHECK_TIMEOUT)
+        _set_check(name, True, detail, (time.perf_counter() - start) * 1000)
+    except Exception as e:
+        _set_check(name, False, f"{type(e).__name__}: {e}", (time.perf_counter() - start) * 1000)
+
+
+def _update_targets():
+    HEALTH_STATE["targets"] = db_service.DB_REGISTRY.status()
+    if len(TENANTS) > 1:
+        HEALTH_STATE["tenants"] = {
+            tenant_id: registry.status() for tenant_id, registry in db_service.TENANT_REGISTRIES.items()
+        }
+
+
+async def _prefill_pool() -> str:
+    """
+    Abre pool_size conexoes simultaneas em cada banco assincrono do registro
+    de cada tenant (primary e replicas) e as devolve ao pool ja autenticadas.
+    """
+    if db_service.GLOBAL_ASYNC_ENGINE is None:
+        raise Exception("O motor do banco de dados nao foi inicializado corretamente.")
+
+    async def _prefill(tenant, target):
+        size = tenant.pool_size if target.role == "primary" else tenant.replica_pool_size
+        connections = [target.engine.connect() for _ in range(size)]
+        try:
+            await asyncio.gather(*(conn.start() for conn in connections))
+            await asyncio.gather(*(conn.execute(text("SELECT 1")) for conn in connections))
+            target.mark(True)
+        except Exception as e:
+            target.mark(False, e)
+            if target.role == "primary" and tenant is DEFAULT_TENANT:
+                raise
+        finally:
+            await asyncio.gather(*(conn.close() for conn in connections), return_exceptions=True)
+
+    targets = [
+        (tenant, target)
+        for tenant in TENANTS.values()
+        for target in db_service.tenant_registry(tenant).targets.values() if target.is_async
+    ]
+    await asyncio.gather(*(_prefill(tenant, target) for tenant, target in targets))
+    _update_targets()
+    return f"{DEFAULT_TENANT.pool_size} conexoes no pool ({len(targets)} bancos, {len(TENANTS)} tenants)"
+
+
+async def _check_database() -> str:
+    """Revalida os bancos de todos os tenants; a prontidao depende apenas do primary do tenant padrao."""
+    registry = db_service.DB_REGISTRY
+    if registry.primary is None:
+        raise Exception("O motor do banco de dados nao foi inicializado corretamente.")
+    await asyncio.gather(*(r.check_all(settings.HEALTH_CHECK_TIMEOUT) for r in db_service.TENANT_REGISTRIES.values()))
+    _update_targets()
+    if not registry.primary.healthy:
+        raise Exception(registry.primary.last_error)
+    return "ok"
+
+
+async def _load_schema_and_prompt() -> str:
+    from app.services.ai_service import get_prompt_prefix
+
+    failed = []
+    for tenant in TENANTS.values():
+        try:
+            digest = await db_service.load_schema_digest(tenant)
+        except Exception as e:
+            if tenant is DEFAULT_TENANT:
+                raise
+            failed.append(f"{tenant.id}: {type(e).__name__}: {e}")
+            continue
+        prefix = get_prompt_prefix(digest)
+        if tenant is DEFAULT_TENANT:
+            detail = f"{digest.count(chr(10)) + 1} tabelas, prompt com {len(prefix)} caracteres"
+    if failed:
+        detail += f"; falhou em {len(failed)} tenant(s): " + "; ".join(failed)
+    return detail
+
+
+async def _check_llm() -> str:
+    """
+    'stub': apenas prepara o provedor padrao (sem rede).
+    'real': faz uma contagem de tokens no provedor, sem gerar conteudo.
+    """
+    from app.services.llm_providers import get_provider
+
+    provider = get_provider()
+    await asyncio.to_thread(provider.warm_up)
+    if settings.HEALTH_LLM_CHECK == "real":
+        await asyncio.to_thread(provider.count_tokens, "ping")
+        return f"{provider.key} acessivel"
+    return f"{provider.key} instanciado (stub)"
+
+
+async def warm_up():
+    """Fase de aquecimento executada uma vez no startup de cada worker."""
+    await _timed("database", _prefill_pool())
+    await _timed("schema", _load_schema_and_prompt())
+    if settings.HEALTH_LLM_CHECK != "off":
+        await _timed("llm", _check_llm())
+    HEALTH_STATE["warm_up_done"] = True
+    HEALTH_STATE["refreshed_at"] = time.time()
+    _update_ready()
+
+
+async def _refresh_loop():
+    await warm_up()
+    while True:
+        await asyncio.sleep(settings.HEALTH_REFRESH_SECONDS)
+        await _timed("database", _check_database())
+        # Se o esquema falhou no warm-up (ex.: banco indisponivel), tenta de novo
+        if not HEALTH_STATE["checks"].get("schema", {}).get("ok"):
+            await _timed("schema", _load_schema_and_prompt())
+        HEALTH_STATE["refreshed_at"] = time.time()
+
+
+def start():
+    """Agenda o warm-up e a revalidacao periodica no event loop atual."""
+    global _refresh_task
+    if _refresh_task is None:
+        _refresh_task = asyncio.get_running_loop().create_task(_refresh_loop())
+
+
+async def stop():
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        try:
+            await _refresh_task
+        except asyncio.CancelledError:
+            pass
+        _refresh_task = None
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+Atalho (fast-path) para as perguntas mais frequentes do /analyze.
+
+Reconhece um conjunto pequeno de intencoes -- top N vendedores, faturamento
+mensal e status dos pedidos -- extraindo os parametros (N, mes, ano, formato)
+e renderizando uma consulta parametrizada ja validada, sem chamar a IA. Se a
+pergunta tiver qualquer termo fora do vocabulario conhecido (ex.: um filtro por
+estado ou categoria), o atalho nao e usado e a pergunta segue para a IA.
+"""
+import datetime
+import re
+import threading
+import unicodedata
+from sqlalchemy import text
+from app.models.request_models import AIResponseSchema
+
+MONTHS = {
+    "janeiro": 1, "jan": 1, "fevereiro": 2, "fev": 2, "marco": 3, "mar": 3,
+    "abril": 4, "abr": 4, "maio": 5, "mai": 5, "junho": 6, "jun": 6,
+    "julho": 7, "jul": 7, "agosto": 8, "ago": 8, "setembro": 9, "set": 9,
+    "outubro": 10, "out": 10, "novembro": 11, "nov": 11, "dezembro": 12, "dez": 12,
+}
+MONTH_NAMES = ["", "janeiro", "fevereiro", "março", "abril", "maio", "junho", "julho",
+               "agosto", "setembro", "outubro", "novembro", "dezembro"]
+NUMBER_WORDS = {
+    "um": 1, "uma": 1, "dois": 2, "duas": 2, "tres": 3, "quatro": 4, "cinco": 5,
+    "seis": 6, "sete": 7, "oito": 8, "nove": 9, "dez": 10, "quinze": 15, "vinte": 20,
+}
+
+# formato pedido -> (visualization_type, report_type)
+FORMATS = {
+    "pdf": ("report", "pdf"), "excel": ("report", "xlsx"), "xlsx": ("report", "xlsx"),
+    "planilha": ("report", "xlsx"), "csv": ("report", "csv"), "parquet": ("report", "parquet"),
+    "arrow": ("report", "arrow"), "pizza": ("pie", None), "barra": ("bar", None),
+    "barras": ("bar", None), "linha": ("line", None), "linhas": ("line", None),
+    "tabela": ("table", None),
+}
+
+STOPWORDS = set("""
+a o as os de da do das dos em no na nos nas um uma uns umas e ou que qual quais quanto
+quantos quantas com por para pra pelo pela pelos pelas me mim meu minha nos nosso nossa
+nossos nossas ao aos se ja foi foram sao eh e ser esta estao este esta esse essa isso
+mostre mostra mostrar liste lista listar quero queria gostaria ver veja exiba exibir
+gere gerar gera traga trazer preciso favor por favor poderia pode voce relatorio
+arquivo grafico formato formado em durante ate mes ano periodo todos todas tudo cada
+atual passado corrente neste nesse deste desse ultimo vez agora qual quais sobre
+""".split())
+
+# Vocabulario aceito por intencao (alem de STOPWORDS, meses, numeros e formatos)
+INTENTS = {
+    "top_vendedores": {
+        "required": [{"vendedor", "vendedores", "vendedora", "vendedoras"},
+                     {"top", "melhores", "maiores", "mais", "ranking"}],
+        "vocabulary": {"top", "melhores", "maiores", "mais", "venderam", "vendeu", "vendas",
+                       "venda", "vendido", "vendidos", "volume", "ranking", "faturaram",
+                       "faturamento", "total", "valor"},
+    },
+    "faturamento_mensal": {
+        "required": [{"faturamento", "faturado", "vendas", "receita"},
+                     {"mensal", "mes", "meses", "mensais"}],
+        "vocabulary": {"total", "totais", "evolucao", "por", "valor", "mensal", "mensais",
+                       "meses", "vendido", "faturado", "receita"},
+    },
+    "status_pedidos": {
+        "required": [{"status", "situacao"}, {"pedido", "pedidos"}],
+        "vocabulary": {"contagem", "quantidade", "distribuicao", "nossos", "cada", "total",
+                       "numero", "atual"},
+    },
+}
+
+TOP_SELLERS_SQL = text("""
+    SELECT v.nomecompleto AS vendedor, SUM(iv.valortotalitem) AS total_vendas
+    FROM vendedores AS v
+    JOIN pedidosvenda AS pv ON v.vendedorid = pv.vendedorid
+    JOIN itenspedidovenda AS iv ON pv.pedidoid = iv.pedidoid
+    WHERE pv.datapedido >= :inicio AND pv.datapedido < :fim
+    GROUP BY v.nomecompleto
+    ORDER BY total_vendas DESC
+    LIMIT :n
+""")
+
+MONTHLY_REVENUE_SQL = text("""
+    SELECT DATE_TRUNC('month', datapedido)::date AS mes_venda, SUM(valortotal) AS faturamento_total
+    FROM pedidosvenda
+    WHERE datapedido >= :inicio AND datapedido < :fim
+    GROUP BY mes_venda
+    ORDER BY mes_venda ASC
+""")
+
+ORDER_STATUS_SQL = text("""
+    SELECT statuspedido, COUNT(pedidoid) AS quantidade
+    FROM pedidosvenda
+    WHERE datapedido >= :inicio AND datapedido < :fim
+    GROUP BY statuspedido
+    ORDER BY quantidade DESC
+""")
+
+ORDER_STATUS_ALL_SQL = text("""
+    SELECT statuspedido, COUNT(pedidoid) AS quantidade
+    FROM pedidosvenda
+    GROUP BY statuspedido
+    ORDER BY quantidade DESC
+""")
+
+MAX_TOP_N = 100
+
+_stats_lock = threading.Lock()
+INTENT_STATS = {"total": 0, "hits": 0, "by_intent": {name: 0 for name in INTENTS}}
+
+
+class IntentMatch:
+    """Intencao reconhecida: consulta parametrizada + resposta no formato da IA."""
+    __slots__ = ("intent", "statement", "params", "ai_response")
+
+    def __init__(self, intent: str, statement, params: dict, ai_response: AIResponseSchema):
+        self.intent = intent
+        self.statement = statement
+        self.params = params
+        self.ai_response = ai_response
+
+
+def _normalize(question: str) -> str:
+    text_ = unicodedata.normalize("NFKD", question.lower())
+    text_ = "".join(c for c in text_ if not unicodedata.combining(c))
+    return re.sub(r"[^\w/]+", " ", text_).strip()
+
+
+class _AmbiguousPeriod(Exception):
+    """Mais de um mes ou ano na pergunta ("de janeiro a marco", "2023 e 2024"): fica com a IA."""
+
+
+def _extract_period(tokens: list, normalized: str, today: datetime.date):
+    """
+    Retorna (mes, ano, tokens_consumidos) a partir de nomes de mes, 'mm/aaaa' e
+    termos relativos. Levanta _AmbiguousPeriod se houver mais de um mes ou ano:
+    o atalho so responde um periodo e nao pode descartar os outros em silencio.
+    """
+    used = set()
+    months, years = [], []
+
+    for i, token in enumerate(tokens):
+        following = tokens[i + 1] if i + 1 < len(tokens) else ""
+        if token in MONTHS and (len(token) > 3 or re.fullmatch(r"20\d{2}", following)):
+            # Abreviacoes ("dez", "set", "out") so contam seguidas do ano: "dez 2024"
+            months.append(MONTHS[token])
+            used.add(token)
+        elif re.fullmatch(r"20\d{2}", token):
+            years.append(int(token))
+            used.add(token)
+        elif re.fullmatch(r"\d{1,2}/20\d{2}", token):
+            m, y = token.split("/")
+            if 1 <= int(m) <= 12:
+                months.append(int(m))
+                years.append(int(y))
+                used.add(token)
+    relative_month = "mes passado" in normalized or re.search(
+        r"\b(este|neste|nesse|deste|desse) mes\b|\bmes (atual|corrente)\b", normalized)
+    relative_year = "ano passado" in normalized or re.search(
+        r"\b(este|neste|nesse|deste|desse) ano\b|\bano (atual|corrente)\b", normalized)
+    if len(months) + bool(relative_month) > 1 or len(years) + bool(relative_year) > 1:
+        raise _AmbiguousPeriod()
+    month = months[0] if months else None
+    year = years[0] if years else None
+
+    if "mes passado" in normalized:
+        first = today.replace(day=1) - datetime.timedelta(days=1)
+        month, year = first.month, first.year
+    elif relative_month:
+        month, year = today.month, today.year
+    if "ano passado" in normalized:
+        year = today.year - 1
+    elif relative_year:
+        year = today.year
+
+    if month is not None and year is None:
+        year = today.year
+    return month, year, used
+
+
+def _extract_top_n(tokens: list):
+    for i, token in enumerate(tokens):
+        if token.isdigit() and not re.fullmatch(r"20\d{2}", token):
+            return max(1, min(int(token), MAX_TOP_N)), {token}
+        if token in NUMBER_WORDS and (i + 1 < len(tokens) and tokens[i + 1].startswith("vendedor")
+                                      or i > 0 and tokens[i - 1] == "top"):
+            return NUMBER_WORDS[token], {token}
+    return None, set()
+
+
+def _extract_format(tokens: list):
+    for token in tokens:
+        if token in FORMATS:
+            return FORMATS[token], {token}
+    return None, set()
+
+
+def _period_range(month, year):
+    """Intervalo [inicio, fim) como datetime (funciona para colunas date e timestamp)."""
+    if year is None:
+        return None, None
+    if month is None:
+        return datetime.datetime(year, 1, 1), datetime.datetime(year + 1, 1, 1)
+    start = datetime.datetime(year, month, 1)
+    end = datetime.datetime(year + (month == 12), month % 12 + 1, 1)
+    return start, end
+
+
+def _period_label(month, year) -> str:
+    if month is not None:
+        return f"{MONTH_NAMES[month]} de {year}"
+    return f"{year}"
+
+
+def _literal(value) -> str:
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return f"'{value:%Y-%m-%d}'"
+    return str(value)
+
+
+def display_sql(statement, params: dict) -> str:
+    """SQL com os valores dos parametros no lugar dos binds, apenas para exibicao/historico."""
+    sql = str(statement)
+    for name, value in params.items():
+        sql = re.sub(rf":{name}\b", _literal(value), sql)
+    return " ".join(sql.split())
+
+
+def _record(intent: str = None):
+    with _stats_lock:
+        INTENT_STATS["total"] += 1
+        if intent is not None:
+            INTENT_STATS["hits"] += 1
+            INTENT_STATS["by_intent"][intent] += 1
+
+
+def get_intent_stats() -> dict:
+    with _stats_lock:
+        total, hits = INTENT_STATS["total"], INTENT_STATS["hits"]
+        return {
+            "total": total,
+            "hits": hits,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "by_intent": dict(INTENT_STATS["by_intent"]),
+        }
+
+
+def match_intent(question: str, today: datetime.date = None) -> IntentMatch | None:
+    """Tenta reconhecer a pergunta; retorna None para seguir pelo fluxo da IA."""
+    today = today or datetime.date.today()
+    normalized = _normalize(question)
+    tokens = normalized.split()
+    match = None
+
+    for intent, spec in INTENTS.items():
+        if not all(any(t in group for t in tokens) for group in spec["required"]):
+            continue
+
+        try:
+            month, year, used = _extract_period(tokens, normalized, today)
+        except _AmbiguousPeriod:
+            break
+        fmt, fmt_used = _extract_format(tokens)
+        n, n_used = _extract_top_n(tokens) if intent == "top_vendedores" else (None, set())
+        required_words = set().union(*spec["required"])
+        allowed = STOPWORDS | spec["vocabulary"] | required_words | used | fmt_used | n_used
+        if any(t not in allowed for t in tokens):
+            continue
+
+        match = _build(intent, month, year, n, fmt, today)
+        break
+
+    _record(match.intent if match else None)
+    return match
+
+
+def _build(intent: str, month, year, n, fmt, today: datetime.date) -> IntentMatch | None:
+    visualization, report_type = fmt or (None, None)
+
+    if intent == "top_vendedores":
+        n = n or 5
+        year = year or today.year
+        start, end = _period_range(month, year)
+        params = {"inicio": start, "fim": end, "n": n}
+        statement = TOP_SELLERS_SQL
+        message = f"Aqui estão os {n} vendedores com o maior volume de vendas em {_period_label(month, year)}."
+        axes = {"x_axis": "vendedor", "y_axis": "total_vendas"}
+        default_visualization = "bar"
+    elif intent == "faturamento_mensal":
+        if month is not None:
+            return None
+        year = year or today.year
+        start, end = _period_range(None, year)
+        params = {"inicio": start, "fim": end}
+        statement = MONTHLY_REVENUE_SQL
+        message = f"Aqui está a evolução do faturamento mensal em {year}."
+        axes = {"x_axis": "mes_venda", "y_axis": "faturamento_total"}
+        default_visualization = "line"
+    else:
+        start, end = _period_range(month, year)
+        if start is None:
+            params, statement = {}, ORDER_STATUS_ALL_SQL
+            message = "Claro, aqui está a distribuição atual dos status de todos os pedidos."
+        else:
+            params, statement = {"inicio": start, "fim": end}, ORDER_STATUS_SQL
+            message = f"Claro, aqui está a distribuição dos status dos pedidos em {_period_label(month, year)}."
+        axes = {"label": "statuspedido", "value": "quantidade"}
+        default_visualization = "pie"
+
+    visualization = visualization or default_visualization
+    if visualization == "pie" and "label" not in axes:
+        axes = {"label": axes["x_axis"], "value": axes["y_axis"]}
+    elif visualization in ("bar", "line") and "x_axis" not in axes:
+        axes = {"x_axis": axes["label"], "y_axis": axes["value"]}
+    elif visualization in ("table", "report"):
+        axes = {}
+
+    ai_response = AIResponseSchema(
+        message=message,
+        sql_query=display_sql(statement, params),
+        visualization_type=visualization,
+        report_type=report_type,
+        **axes,
+    )
+    return IntentMatch(intent, statement, params, ai_response)
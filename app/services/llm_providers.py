@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Provedores de modelo de linguagem atras de uma interface unica:
+generate(prompt, timeout), stream(prompt, timeout) e count_tokens(prompt).
+
+- "gemini": SDK google.generativeai (importado no primeiro uso);
+- "stub": deterministico e local, sem rede (testes de carga e uso offline);
+- "openai": endpoint HTTP compativel com /v1/chat/completions (vLLM, llama.cpp,
+  Ollama, LM Studio...), chamado com urllib.
+
+O provedor padrao vem de LLM_PROVIDER/LLM_MODEL; LLM_ROUTES permite mandar
+classes de requisicao para outro provedor/modelo, ex.:
+"small=openai:qwen2.5-7b-instruct,followup=gemini:gemini-2.5-flash-lite".
+Cada provedor tem circuit breaker e latencias proprios (llm_resilience).
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from dataclasses import dataclass
+from app.core.config import settings
+
+# Configuracoes de geracao comuns aos provedores
+generation_config = {
+    "temperature": 0.2,
+    "max_output_tokens": 2048,
+}
+
+
+@dataclass
+class LLMResult:
+    text: str
+    blocked: bool = False
+    # Uso informado pelo provedor (None quando ele nao informa; o ai_service estima)
+    input_tokens: int | None = None
+    output_tokens: int | None = None
+
+
+class LLMProvider:
+    name = "base"
+
+    def __init__(self, model: str):
+        self.model = model
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}:{self.model}"
+
+    def warm_up(self):
+        """Prepara o cliente (imports, configuracao) sem gerar conteudo."""
+
+    def generate(self, prompt: str, timeout: float) -> LLMResult:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, timeout: float):
+        """Gera o texto em pedacos; por padrao, um unico pedaco com a resposta completa."""
+        yield self.generate(prompt, timeout).text
+
+    def count_tokens(self, prompt: str) -> int:
+        """Estimativa local (~4 caracteres por token) para provedores sem contagem exata."""
+        return max(1, len(prompt) // 4)
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self, model: str):
+        super().__init__(model)
+        self._model = None
+        self._lock = threading.Lock()
+
+    def get_model(self):
+        """Retorna o modelo Gemini, criando-o (e configurando a API) no primeiro uso."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    from google.generativeai.types import HarmBlockThreshold, HarmCategory
+
+                    genai.configure(api_key=settings.GOOGLE_API_KEY)
+
+                    # Configuracoes de seguranca para evitar bloqueios inesperados
+                    safety_settings = {
+                        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+                        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+                        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+                        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+                    }
+                    self._model = genai.GenerativeModel(self.model, generation_config=generation_config, safety_settings=safety_settings)
+        return self._model
+
+    def warm_up(self):
+        self.get_model()
+
+    def generate(self, prompt: str, timeout: float) -> LLMResult:
+        response = self.get_model().generate_content(prompt, request_options={"timeout": timeout})
+        usage = getattr(response, "usage_metadata", None)
+        input_tokens = getattr(usage, "prompt_token_count", None) or None
+        output_tokens = getattr(usage, "candidates_token_count", None) or None
+        if response.prompt_feedback and response.prompt_feedback.block_reason:
+            return LLMResult(text="", blocked=True, input_tokens=input_tokens)
+        return LLMResult(text=response.text, input_tokens=input_tokens, output_tokens=output_tokens)
+
+    def stream(self, prompt: str, timeout: float):
+        for chunk in self.get_model().generate_content(prompt, stream=True, request_options={"timeout": timeout}):
+            if chunk.parts:
+                yield chunk.text
+
+    def count_tokens(self, prompt: str) -> int:
+        return self.get_model().count_tokens(prompt).total_tokens
+
+
+class StubProvider(LLMProvider):
+    """
+    Resposta deterministica por pergunta, sem rede: perguntas reconhecidas pelo
+    atalho de intencoes recebem o SQL do template; as demais, uma contagem de
+    pedidos. LLM_STUB_LATENCY_MS simula a latencia do provedor.
+    """
+    name = "stub"
+    _QUESTION_RE = re.compile(r"'([^']*)'\s*$")
+
+    def generate(self, prompt: str, timeout: float) -> LLMResult:
+        from app.services.intent_service import display_sql, match_intent
+
+        if settings.LLM_STUB_LATENCY_MS:
+            time.sleep(min(timeout, settings.LLM_STUB_LATENCY_MS / 1000))
+        found = self._QUESTION_RE.search(prompt.strip())
+        question = found.group(1) if found else prompt.strip().splitlines()[-1]
+
+        intent = match_intent(question)
+        if intent is not None:
+            data = intent.ai_response.model_dump(exclude={"token_usage"})
+            data["sql_query"] = display_sql(intent.statement, intent.params)
+        else:
+            digest = hashlib.sha1(question.encode("utf-8")).hexdigest()[:8]
+            data = {
+                "sql_query": "SELECT COUNT(*) AS total_pedidos FROM pedidosvenda",
+                "visualization_type": "table",
+                "report_type": None,
+                "x_axis": None, "y_axis": None, "label": None, "value": None,
+            }
+            data["message"] = f"Resposta de teste ({digest})."
+        message = data.pop("message", None) or "Resposta de teste."
+        return LLMResult(text=f"{message}\n```json\n{json.dumps(data, ensure_ascii=False)}\n```")
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """Endpoint /chat/completions no formato da OpenAI (servidor local ou remoto)."""
+    name = "openai"
+
+    def _request(self, prompt: str, stream: bool, timeout: float):
+        body = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": generation_config["temperature"],
+            "max_tokens": generation_config["max_output_tokens"],
+            "stream": stream,
+        }
+        headers = {"Content-Type": "application/json"}
+        if settings.LLM_OPENAI_API_KEY:
+            headers["Authorization"] = f"Bearer {settings.LLM_OPENAI_API_KEY}"
+        request = urllib.request.Request(
+            settings.LLM_OPENAI_BASE_URL.rstrip("/") + "/chat/completions",
+            data=json.dumps(body).encode("utf-8"),
+            headers=headers,
+            method="POST",
+        )
+        try:
+            return urllib.request.urlopen(request, timeout=timeout)
+        except urllib.error.HTTPError:
+            raise
+        except urllib.error.URLError as e:
+            # Falhas de rede viram erros transitorios para a camada de resiliencia
+            if isinstance(e.reason, TimeoutError):
+                raise TimeoutError(str(e.reason)) from e
+            raise ConnectionError(str(e.reason)) from e
+
+    def generate(self, prompt: str, timeout: float) -> LLMResult:
+        with self._request(prompt, False, timeout) as response:
+            payload = json.load(response)
+        choice = payload["choices"][0]
+        usage = payload.get("usage") or {}
+        if choice.get("finish_reason") == "content_filter":
+            return LLMResult(text="", blocked=True, input_tokens=usage.get("prompt_tokens"))
+        return LLMResult(
+            text=choice["message"].get("content") or "",
+            input_tokens=usage.get("prompt_tokens"),
+            output_tokens=usage.get("completion_tokens"),
+        )
+
+    def stream(self, prompt: str, timeout: float):
+        with self._request(prompt, True, timeout) as response:
+            for raw in response:
+                line = raw.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+
+PROVIDERS = {
+    "gemini": GeminiProvider,
+    "stub": StubProvider,
+    "openai": OpenAICompatibleProvider,
+}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def _parse_routes(value: str) -> dict:
+    routes = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            request_class, target = item.split("=", 1)
+            routes[request_class.strip()] = target.strip()
+    return routes
+
+
+LLM_ROUTES = _parse_routes(settings.LLM_ROUTES)
+
+
+def get_provider(request_class: str = "default") -> LLMProvider:
+    """Provedor configurado para a classe de requisicao (instancia unica por provedor:modelo)."""
+    target = LLM_ROUTES.get(request_class) or f"{settings.LLM_PROVIDER}:{settings.LLM_MODEL}"
+    name, _, model = target.partition(":")
+    if name not in PROVIDERS:
+        raise ValueError(f"Provedor de IA desconhecido: {name!r}")
+    key = f"{name}:{model}"
+    if key not in _instances:
+        with _instances_lock:
+            if key not in _instances:
+                _instances[key] = PROVIDERS[name](model or settings.LLM_MODEL)
+    return _instances[key]
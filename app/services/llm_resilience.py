@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+Camada de resiliencia das chamadas ao modelo de linguagem.
+
+Cada chamada passa por:
+- circuit breaker: apos LLM_BREAKER_FAILURES falhas seguidas o circuito abre e
+  as chamadas falham na hora (LLMUnavailable) por LLM_BREAKER_RESET_SECONDS;
+  depois uma unica chamada de teste decide se ele fecha de novo;
+- timeout por tentativa (repassado ao SDK) e um prazo total para a chamada;
+- novas tentativas com backoff exponencial e jitter ("full jitter"), apenas
+  para erros transitorios (timeout, conexao, 429/5xx);
+- hedge opcional: se a primeira tentativa passar do p95 das latencias recentes,
+  uma segunda identica e disparada e vale a que responder primeiro.
+
+O breaker e as latencias sao mantidos por provedor (chave "provedor:modelo").
+Respostas boas ficam num cache pequeno por tenant e prompt, usado como ultimo recurso
+quando o provedor esta degradado (ver ai_service._generate_from_prompt).
+
+As funcoes sao sincronas: rodam na thread de trabalho que ja chama o modelo
+(run_blocking). Cada tentativa roda numa thread daemon propria, para permitir
+timeout e hedge. Uma tentativa que estoura o prazo ou perde o hedge e
+abandonada: deixa de ocupar uma das LLM_MAX_CONCURRENCY vagas de tentativas
+ativas e termina sozinha no timeout repassado ao SDK/HTTP. As abandonadas ainda
+em execucao sao contadas em /ops/llm e limitadas por LLM_MAX_ORPHANS; acima
+disso novas tentativas falham na hora (erro transitorio, que conta para o breaker).
+
+Erros nao transitorios (ex.: 400) nao mexem no breaker: nem zeram as falhas
+acumuladas nem contam como falha; so liberam a chamada de teste do half_open.
+"""
+import hashlib
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from app.core.config import settings
+from app.core.tenancy import current_tenant
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {
+    "ServiceUnavailable", "TooManyRequests", "ResourceExhausted", "DeadlineExceeded",
+    "InternalServerError", "BadGateway", "GatewayTimeout", "Aborted",
+}
+
+LLM_STATS = {
+    "calls": 0, "attempts": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "timeouts": 0,
+    "short_circuited": 0, "fallback_hits": 0, "orphaned": 0, "orphan_limit_hits": 0,
+}
+
+# Vagas de tentativas ativas; tentativas abandonadas devolvem a vaga na hora
+_live_slots = threading.BoundedSemaphore(settings.LLM_MAX_CONCURRENCY)
+_orphans_lock = threading.Lock()
+_orphans_running = 0
+
+
+class LLMUnavailable(Exception):
+    """O provedor esta indisponivel (circuito aberto ou tentativas esgotadas)."""
+
+    def __init__(self, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+            if self.state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def retry_after(self) -> int:
+        remaining = self.reset_seconds - (time.monotonic() - self.opened_at)
+        return max(1, int(remaining + 0.999))
+
+    def record_success(self):
+        with self.lock:
+            self.state = "closed"
+            self.failures = 0
+            self.probing = False
+
+    def release_probe(self):
+        """Erro nao transitorio: nao fecha nem abre o circuito, so libera a chamada de teste."""
+        with self.lock:
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+    def to_dict(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.failures, "retry_after": self.retry_after() if self.state != "closed" else None}
+
+
+class LatencyWindow:
+    """Latencias (s) das ultimas tentativas bem-sucedidas, para o p95 do hedge."""
+
+    def __init__(self, size: int = 200):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, p: float) -> float | None:
+        with self.lock:
+            values = sorted(self.samples)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(p * len(values)))]
+
+
+_breakers = {}
+_latencies = {}
+_state_lock = threading.Lock()
+
+_fallback = OrderedDict()
+_fallback_lock = threading.Lock()
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    code = getattr(exc, "code", None)
+    if isinstance(code, int) and code in RETRYABLE_STATUS:
+        return True
+    return type(exc).__name__ in RETRYABLE_ERRORS
+
+
+def _state(key: str) -> tuple[CircuitBreaker, LatencyWindow]:
+    with _state_lock:
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker(settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_RESET_SECONDS)
+            _latencies[key] = LatencyWindow()
+        return _breakers[key], _latencies[key]
+
+
+def _hedge_delay(latency: LatencyWindow) -> float | None:
+    if not settings.LLM_HEDGE_ENABLED or len(latency.samples) < settings.LLM_HEDGE_MIN_SAMPLES:
+        return None
+    return max(settings.LLM_HEDGE_MIN_MS / 1000, latency.percentile(0.95))
+
+
+def _timed(call, timeout: float):
+    start = time.perf_counter()
+    result = call(timeout)
+    return result, time.perf_counter() - start
+
+
+class _AttemptThread:
+    """Tentativa numa thread daemon propria, que pode ser abandonada sem segurar a vaga."""
+
+    def __init__(self, call, timeout: float):
+        self.future = Future()
+        self._lock = threading.Lock()
+        self._finished = False
+        self._abandoned = False
+        threading.Thread(target=self._run, args=(call, timeout), name="llm-attempt", daemon=True).start()
+
+    def _run(self, call, timeout: float):
+        global _orphans_running
+        try:
+            self.future.set_result(_timed(call, timeout))
+        except BaseException as e:
+            self.future.set_exception(e)
+        finally:
+            with self._lock:
+                self._finished = True
+                abandoned = self._abandoned
+            if abandoned:
+                with _orphans_lock:
+                    _orphans_running -= 1
+            else:
+                _live_slots.release()
+
+    def abandon(self):
+        """Desiste da tentativa: a vaga volta na hora e a thread vira orfa ate o timeout do SDK."""
+        global _orphans_running
+        with self._lock:
+            if self._finished or self._abandoned:
+                return
+            self._abandoned = True
+        with _orphans_lock:
+            _orphans_running += 1
+        LLM_STATS["orphaned"] += 1
+        _live_slots.release()
+
+
+def _start_attempt(call, timeout: float, deadline: float) -> _AttemptThread:
+    if _orphans_running >= settings.LLM_MAX_ORPHANS:
+        LLM_STATS["orphan_limit_hits"] += 1
+        raise TimeoutError(f"{_orphans_running} chamadas abandonadas ao modelo ainda em execucao.")
+    if not _live_slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+        raise TimeoutError("Sem vaga para chamar o modelo dentro do prazo.")
+    return _AttemptThread(call, timeout)
+
+
+def _attempt(call, timeout: float, latency: LatencyWindow):
+    """Uma tentativa (com hedge opcional); levanta TimeoutError se ninguem responder a tempo."""
+    deadline = time.monotonic() + timeout
+    attempts = [_start_attempt(call, timeout, deadline)]
+    LLM_STATS["attempts"] += 1
+    try:
+        delay = _hedge_delay(latency)
+        if delay is not None and delay < timeout:
+            done, _ = wait([attempts[0].future], timeout=delay)
+            if not done:
+                try:
+                    attempts.append(_start_attempt(call, max(0.1, deadline - time.monotonic()), deadline))
+                    LLM_STATS["hedges"] += 1
+                except TimeoutError:
+                    pass  # sem vaga para o hedge: segue so com a primeira
+
+        error = None
+        pending = [a.future for a in attempts]
+        while pending:
+            done, _ = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                pending.remove(future)
+                if future.exception() is None:
+                    result, elapsed = future.result()
+                    latency.add(elapsed)
+                    if future is not attempts[0].future:
+                        LLM_STATS["hedge_wins"] += 1
+                    return result
+                error = future.exception()
+        if error is not None and not pending:
+            raise error
+        LLM_STATS["timeouts"] += 1
+        raise TimeoutError(f"O modelo nao respondeu em {timeout:.0f}s.")
+    finally:
+        # Perdedoras do hedge e tentativas que estouraram o prazo
+        for attempt in attempts:
+            attempt.abandon()
+
+
+def call_with_resilience(call, key: str = "default"):
+    """
+    Executa call(timeout) -- uma chamada ao provedor 'key' com o timeout em
+    segundos -- com circuit breaker, novas tentativas e hedge. Erros nao
+    transitorios sobem como estao; falhas transitorias esgotadas viram LLMUnavailable.
+    """
+    breaker, latency = _state(key)
+    LLM_STATS["calls"] += 1
+    if not breaker.allow():
+        LLM_STATS["short_circuited"] += 1
+        raise LLMUnavailable("O servico de IA esta temporariamente indisponivel.", breaker.retry_after())
+
+    deadline = time.monotonic() + settings.LLM_TOTAL_TIMEOUT_SECONDS
+    attempt = 0
+    while True:
+        timeout = max(1.0, min(settings.LLM_TIMEOUT_SECONDS, deadline - time.monotonic()))
+        try:
+            result = _attempt(call, timeout, latency)
+        except Exception as e:
+            if not is_retryable(e):
+                # Resposta do provedor (ex.: 400), nem sucesso nem falha: o contador de falhas fica como esta
+                breaker.release_probe()
+                raise
+            attempt += 1
+            backoff = random.uniform(0, min(settings.LLM_RETRY_MAX_MS, settings.LLM_RETRY_BASE_MS * 2 ** attempt)) / 1000
+            if attempt >= settings.LLM_MAX_ATTEMPTS or time.monotonic() + backoff + 1 >= deadline:
+                breaker.record_failure()
+                raise LLMUnavailable(f"O servico de IA nao respondeu: {type(e).__name__}: {e}", breaker.retry_after() if breaker.state == "open" else 1) from e
+            LLM_STATS["retries"] += 1
+            time.sleep(backoff)
+            continue
+        breaker.record_success()
+        return result
+
+
+# --- Cache de respostas para modo degradado ---
+
+def _prompt_key(prompt: str) -> str:
+    # Separado por tenant: o mesmo prompt pode valer para bancos diferentes
+    return hashlib.sha1(f"{current_tenant().id}\x1f{prompt}".encode("utf-8")).hexdigest()
+
+
+def remember_response(prompt: str, response):
+    if settings.LLM_FALLBACK_CACHE_SIZE <= 0:
+        return
+    key = _prompt_key(prompt)
+    with _fallback_lock:
+        _fallback[key] = response
+        _fallback.move_to_end(key)
+        while len(_fallback) > settings.LLM_FALLBACK_CACHE_SIZE:
+            _fallback.popitem(last=False)
+
+
+def fallback_response(prompt: str):
+    with _fallback_lock:
+        response = _fallback.get(_prompt_key(prompt))
+    if response is not None:
+        LLM_STATS["fallback_hits"] += 1
+    return response
+
+
+def get_llm_stats() -> dict:
+    providers = {}
+    for key in list(_breakers):
+        breaker, latency = _state(key)
+        p50, p95 = latency.percentile(0.5), latency.percentile(0.95)
+        delay = _hedge_delay(latency)
+        providers[key] = {
+            "breaker": breaker.to_dict(),
+            "latency_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "latency_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "hedge_delay_ms": round(delay * 1000, 1) if delay is not None else None,
+        }
+    return {
+        **LLM_STATS,
+        "orphans_running": _orphans_running,
+        "max_orphans": settings.LLM_MAX_ORPHANS,
+        "providers": providers,
+        "fallback_entries": len(_fallback),
+    }
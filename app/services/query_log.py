@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+Log de consultas lentas do SQL executado pelo /analyze (IA, atalhos e lote).
+
+Cada execucao registra pergunta, SQL, tempo gasto no banco, linhas e erro numa
+fila em memoria; uma task em segundo plano consome a fila, captura o EXPLAIN
+(FORMAT JSON) das consultas acima de SLOW_QUERY_EXPLAIN_MS e grava uma linha
+JSON por consulta acima de SLOW_QUERY_MS num arquivo com rotacao. Nada disso
+fica no caminho da requisicao: se a fila encher, o registro e descartado.
+
+Todas as execucoes tambem alimentam um agregado por "fingerprint" (SQL com os
+literais trocados por '?') e tenant, usado para listar os piores ofensores.
+
+Com varios workers (gunicorn), cada um ocupa um slot estavel no host: o menor
+slot-N.lock livre em QUERY_LOG_DIR, preso com flock enquanto o processo vive.
+Um worker reciclado (max_requests) ou morto libera o slot e o substituto o
+reaproveita, entao o log (slow_queries-N.jsonl) e os agregados
+(query_stats-N.json) nao se acumulam por pid. Cada worker grava os seus
+agregados a cada QUERY_STATS_FLUSH_SECONDS e os recarrega ao assumir o slot;
+/ops/slow-queries soma os arquivos de todos os slots (e os agregados em memoria
+do worker que responde).
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import re
+import tempfile
+import threading
+import time
+try:
+    import fcntl
+except ImportError:  # Windows: sem flock, cada processo usa o proprio pid como slot
+    fcntl = None
+from sqlalchemy import text
+from app.core.config import settings
+from app.core.tenancy import current_tenant, get_tenant
+
+_current_question = contextvars.ContextVar("current_question", default=None)
+
+_queue = None
+_writer_task = None
+_flush_task = None
+_logger = None
+_slot = None
+_slot_fd = None
+_stats_lock = threading.Lock()
+QUERY_STATS = {}
+LOG_STATS = {"recorded": 0, "written": 0, "explained": 0, "dropped": 0}
+
+_FINGERPRINT_RES = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"(?<![:\w]):[a-zA-Z_]\w*"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(?)"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+def set_question(question: str):
+    """Associa a pergunta do usuario as consultas executadas no contexto atual."""
+    _current_question.set(question)
+
+
+def fingerprint(sql: str) -> str:
+    normalized = sql.strip().rstrip(";")
+    for pattern, replacement in _FINGERPRINT_RES:
+        normalized = pattern.sub(replacement, normalized)
+    return normalized.strip().lower()
+
+
+def record_query(sql: str, params: dict, elapsed_ms: float, row_count: int, error: str = None):
+    """Registra uma execucao (chamado pelo db_service; nao bloqueia)."""
+    if not settings.QUERY_LOG_ENABLED:
+        return
+    shape = fingerprint(sql)
+    fp = hashlib.sha1(shape.encode("utf-8")).hexdigest()[:12]
+    question = _current_question.get()
+    tenant_id = current_tenant().id
+    _aggregate(tenant_id, fp, shape, sql, question, elapsed_ms, row_count, error)
+
+    LOG_STATS["recorded"] += 1
+    if elapsed_ms < settings.SLOW_QUERY_MS or _queue is None:
+        return
+    entry = {
+        "ts": time.time(),
+        "tenant": tenant_id,
+        "fingerprint": fp,
+        "question": question,
+        "sql": sql,
+        "params": {k: str(v) for k, v in (params or {}).items()},
+        "elapsed_ms": round(elapsed_ms, 1),
+        "rows": row_count,
+        "error": error,
+        "_bind_params": dict(params) if params else None,
+    }
+    try:
+        _queue.put_nowait(entry)
+    except asyncio.QueueFull:
+        LOG_STATS["dropped"] += 1
+
+
+def _aggregate(tenant_id, fp, shape, sql, question, elapsed_ms, row_count, error):
+    key = f"{tenant_id}:{fp}"
+    with _stats_lock:
+        stat = QUERY_STATS.get(key)
+        if stat is None:
+            if len(QUERY_STATS) >= settings.QUERY_STATS_MAX:
+                # descarta o fingerprint de menor custo acumulado
+                del QUERY_STATS[min(QUERY_STATS, key=lambda k: QUERY_STATS[k]["total_ms"])]
+            stat = QUERY_STATS[key] = {
+                "tenant": tenant_id, "fingerprint": fp, "shape": shape, "count": 0, "errors": 0,
+                "total_ms": 0.0, "max_ms": 0.0, "total_rows": 0,
+                "last_sql": None, "last_question": None, "last_seen": None,
+            }
+        stat["count"] += 1
+        stat["errors"] += 1 if error else 0
+        stat["total_ms"] += elapsed_ms
+        stat["max_ms"] = max(stat["max_ms"], elapsed_ms)
+        stat["total_rows"] += row_count
+        stat["last_sql"] = sql
+        stat["last_question"] = question or stat["last_question"]
+        stat["last_seen"] = time.time()
+
+
+# --- Slot do worker e agregados compartilhados entre os workers do host ---
+
+def log_dir() -> str:
+    path = settings.QUERY_LOG_DIR or os.path.join(tempfile.gettempdir(), "bi_query_log")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def worker_slot() -> str:
+    """Slot estavel deste processo no host (o menor slot-N.lock que ele conseguiu travar)."""
+    global _slot, _slot_fd
+    if _slot is not None:
+        return _slot
+    if fcntl is None:
+        _slot = str(os.getpid())
+        return _slot
+    n = 0
+    while True:
+        fd = os.open(os.path.join(log_dir(), f"slot-{n}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            n += 1
+            continue
+        # O descritor fica aberto ate o processo terminar: o sistema libera o lock sozinho
+        _slot, _slot_fd = str(n), fd
+        return _slot
+
+
+def _stats_path(slot: str) -> str:
+    return os.path.join(log_dir(), f"query_stats-{slot}.json")
+
+
+def _read_snapshot(path: str) -> dict | None:
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def save_stats():
+    """Grava os agregados deste worker no arquivo do slot (temporario + rename atomico)."""
+    with _stats_lock:
+        snapshot = {"saved_at": time.time(), "log": dict(LOG_STATS), "stats": {k: dict(s) for k, s in QUERY_STATS.items()}}
+    path = _stats_path(worker_slot())
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(snapshot, fh, ensure_ascii=False, default=str)
+    os.replace(tmp, path)
+
+
+def load_stats():
+    """Retoma os agregados do slot deixados pelo worker anterior que o ocupou."""
+    snapshot = _read_snapshot(_stats_path(worker_slot()))
+    if not snapshot:
+        return
+    with _stats_lock:
+        for key, stat in snapshot.get("stats", {}).items():
+            QUERY_STATS.setdefault(key, stat)
+        for key, value in snapshot.get("log", {}).items():
+            if key in LOG_STATS:
+                LOG_STATS[key] += value
+
+
+def _merge(target: dict, stat: dict):
+    for field in ("count", "errors", "total_ms", "total_rows"):
+        target[field] += stat[field]
+    target["max_ms"] = max(target["max_ms"], stat["max_ms"])
+    if (stat["last_seen"] or 0) > (target["last_seen"] or 0):
+        target["last_sql"], target["last_seen"] = stat["last_sql"], stat["last_seen"]
+        target["last_question"] = stat["last_question"] or target["last_question"]
+
+
+def _host_snapshots() -> list:
+    """Agregados de todos os slots do host; o deste worker vem da memoria (mais recente que o arquivo)."""
+    own = _stats_path(worker_slot())
+    snapshots = []
+    for name in os.listdir(log_dir()):
+        path = os.path.join(log_dir(), name)
+        if name.startswith("query_stats-") and name.endswith(".json") and path != own:
+            snapshot = _read_snapshot(path)
+            if snapshot:
+                snapshots.append(snapshot)
+    with _stats_lock:
+        snapshots.append({"log": dict(LOG_STATS), "stats": {k: dict(s) for k, s in QUERY_STATS.items()}})
+    return snapshots
+
+
+def slow_query_report(limit: int = 20, order: str = "total") -> dict:
+    """Contadores do log e piores fingerprints somando todos os workers do host (le arquivos: rode em thread)."""
+    snapshots = _host_snapshots()
+    log = {key: sum(s.get("log", {}).get(key, 0) for s in snapshots) for key in LOG_STATS}
+    merged = {}
+    for snapshot in snapshots:
+        for key, stat in snapshot.get("stats", {}).items():
+            if key in merged:
+                _merge(merged[key], stat)
+            else:
+                merged[key] = dict(stat)
+    return {"workers": len(snapshots), "log": log, "queries": worst_queries(limit, order, merged.values())}
+
+
+def worst_queries(limit: int = 20, order: str = "total", stats=None) -> list:
+    """Fingerprints ordenados por tempo total, maximo ou medio (deste worker, ou de stats)."""
+    keys = {
+        "total": lambda s: s["total_ms"],
+        "max": lambda s: s["max_ms"],
+        "mean": lambda s: s["total_ms"] / s["count"],
+    }
+    if stats is None:
+        with _stats_lock:
+            stats = [dict(s) for s in QUERY_STATS.values()]
+    else:
+        stats = [dict(s) for s in stats]
+    stats.sort(key=keys.get(order, keys["total"]), reverse=True)
+    for s in stats:
+        s["mean_ms"] = round(s["total_ms"] / s["count"], 1)
+        s["total_ms"] = round(s["total_ms"], 1)
+        s["max_ms"] = round(s["max_ms"], 1)
+    return stats[:limit]
+
+
+# --- Gravacao assincrona ---
+
+def _get_logger() -> logging.Logger:
+    global _logger
+    if _logger is None:
+        # Um arquivo por slot de worker: a rotacao do RotatingFileHandler nao e segura entre processos
+        path = settings.QUERY_LOG_FILE or os.path.join(log_dir(), "slow_queries-{slot}.jsonl")
+        path = path.replace("{slot}", worker_slot()).replace("{pid}", worker_slot())
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=settings.QUERY_LOG_MAX_BYTES, backupCount=settings.QUERY_LOG_BACKUPS, encoding="utf-8"
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _logger = logging.getLogger("bi.slow_queries")
+        _logger.propagate = False
+        _logger.setLevel(logging.INFO)
+        _logger.addHandler(handler)
+    return _logger
+
+
+async def _explain(entry: dict):
+    """EXPLAIN (sem ANALYZE, nao reexecuta a consulta) no banco de leitura, com timeout."""
+    from app.services.db_service import tenant_registry
+
+    sql = entry["sql"].strip().rstrip(";")
+    if not re.match(r"(?is)^\s*(select|with)\b", sql):
+        return None
+    async with tenant_registry(get_tenant(entry["tenant"])).connect_reader() as connection:
+        await connection.execute(text(f"SET LOCAL statement_timeout = {int(settings.SLOW_QUERY_EXPLAIN_TIMEOUT_MS)}"))
+        result = await connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), entry.pop("_bind_params", None) or {})
+        plan = result.scalar()
+    return json.loads(plan) if isinstance(plan, str) else plan
+
+
+async def _writer_loop():
+    logger = await asyncio.to_thread(_get_logger)
+    while True:
+        entry = await _queue.get()
+        try:
+            if entry["elapsed_ms"] >= settings.SLOW_QUERY_EXPLAIN_MS and entry["error"] is None:
+                try:
+                    entry["plan"] = await _explain(entry)
+                    LOG_STATS["explained"] += 1
+                except Exception as e:
+                    entry["plan_error"] = f"{type(e).__name__}: {e}"
+            entry.pop("_bind_params", None)
+            line = json.dumps(entry, ensure_ascii=False, default=str)
+            await asyncio.to_thread(logger.info, line)
+            LOG_STATS["written"] += 1
+        except Exception as e:
+            print(f"Erro ao gravar o log de consultas lentas: {e}")
+        finally:
+            _queue.task_done()
+
+
+async def _flush_loop():
+    while True:
+        await asyncio.sleep(settings.QUERY_STATS_FLUSH_SECONDS)
+        try:
+            await asyncio.to_thread(save_stats)
+        except Exception as e:
+            print(f"Erro ao gravar os agregados de consultas: {e}")
+
+
+def start():
+    """Assume o slot do worker, retoma os agregados dele e cria a fila e as tasks de gravacao."""
+    global _queue, _writer_task, _flush_task
+    if settings.QUERY_LOG_ENABLED and _writer_task is None:
+        try:
+            load_stats()
+        except Exception as e:
+            print(f"Erro ao carregar os agregados de consultas: {e}")
+        _queue = asyncio.Queue(maxsize=settings.QUERY_LOG_QUEUE_SIZE)
+        loop = asyncio.get_running_loop()
+        _writer_task = loop.create_task(_writer_loop())
+        _flush_task = loop.create_task(_flush_loop())
+
+
+async def stop():
+    """Grava o que ainda estiver na fila (com limite de tempo) e os agregados, e encerra as tasks."""
+    global _queue, _writer_task, _flush_task
+    if _writer_task is None:
+        return
+    try:
+        await asyncio.wait_for(_queue.join(), timeout=5)
+    except asyncio.TimeoutError:
+        pass
+    for task in (_writer_task, _flush_task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    try:
+        await asyncio.to_thread(save_stats)
+    except Exception as e:
+        print(f"Erro ao gravar os agregados de consultas: {e}")
+    _writer_task = _flush_task = None
+    _queue = None
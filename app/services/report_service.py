@@ -0,0 +1,569 @@
+# -*- coding: utf-8 -*-
+"""
+Geracao dos arquivos de relatorio (JSON, CSV, PDF, XLSX, Parquet, Arrow).
+
+Todos os formatos consomem o mesmo ResultSet colunar (app.services.result_set)
+linha a linha, sem DataFrames intermediarios. Os arquivos sao escritos em um
+SpooledTemporaryFile (memoria ate REPORT_SPOOL_MAX_BYTES, depois disco) e
+enviados em blocos. Parquet e Arrow IPC sao escritos direto dos lotes do cursor
+do banco (record batches), sem passar pelo ResultSet.
+
+reportlab, openpyxl e pyarrow sao importados apenas no primeiro uso (ou pelo
+aquecimento em segundo plano de warm_up_imports) para nao pesar na
+importacao de app.main.
+"""
+import csv
+import datetime
+import decimal
+import io
+import json
+import re
+import tempfile
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from app.core.config import settings
+from app.core.executors import RenderTimeout, get_render_executor, run_render
+from app.core.profiling import run_blocking
+from app.services.result_set import ResultSet, json_default
+
+REPORT_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+RESPONSE_CHUNK_BYTES = 64 * 1024
+JSON_ROWS_PER_CHUNK = 1000
+EMPTY_MESSAGE = "Nenhum dado encontrado para a consulta."
+
+
+# --- FUNÇÃO AUXILIAR NECESSÁRIA PARA O PDF ---
+def _safe_filename(text: str) -> str:
+    """Garante que o nome do arquivo seja seguro."""
+    text = text.replace(" ", "_")
+    # Usa o módulo 're' para remover caracteres inválidos
+    return re.sub(r'[^\w\-_\.]', '', text)[:50]
+# -----------------------------------------------------------------
+
+
+def _new_spool():
+    return tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_MAX_BYTES, mode="w+b")
+
+
+def _iter_file(fh):
+    """Le o arquivo em blocos e o fecha ao final (ou se o cliente desconectar)."""
+    try:
+        fh.seek(0)
+        while True:
+            chunk = fh.read(RESPONSE_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fh.close()
+
+
+def _file_response(fh, media_type: str, content_disposition: str) -> StreamingResponse:
+    return StreamingResponse(
+        _iter_file(fh),
+        media_type=media_type,
+        headers={"Content-Disposition": content_disposition}
+    )
+
+
+# --- JSON ---
+
+def _dumps(value) -> bytes:
+    # Mesmos parametros do JSONResponse do Starlette
+    return json.dumps(
+        value, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=json_default
+    ).encode("utf-8")
+
+
+def iter_json(payload: dict, result: ResultSet):
+    """
+    Serializa o payload em blocos. O valor que for o proprio ResultSet e emitido
+    como lista de objetos, em lotes de JSON_ROWS_PER_CHUNK linhas.
+    """
+    yield b"{"
+    for i, (key, value) in enumerate(payload.items()):
+        yield (b"," if i else b"") + _dumps(key) + b":"
+        if value is not result:
+            yield _dumps(value)
+            continue
+
+        columns = result.columns
+        yield b"["
+        batch = []
+        first = True
+        for row in result.iter_rows():
+            batch.append(_dumps(dict(zip(columns, row))))
+            if len(batch) >= JSON_ROWS_PER_CHUNK:
+                yield (b"" if first else b",") + b",".join(batch)
+                first = False
+                batch = []
+        if batch:
+            yield (b"" if first else b",") + b",".join(batch)
+        yield b"]"
+    yield b"}"
+
+
+def generate_json_response(payload: dict, result: ResultSet) -> StreamingResponse:
+    """Resposta JSON montada direto do ResultSet (ver iter_json)."""
+    return StreamingResponse(iter_json(payload, result), media_type="application/json")
+
+
+# --- Funções Auxiliares (Geração de Arquivo) ---
+
+def write_csv(result: ResultSet, fh):
+    """Escreve o CSV (UTF-8, cabecalho + linhas) no arquivo binario fh."""
+    text_fh = io.TextIOWrapper(fh, encoding="utf-8", newline="")
+    writer = csv.writer(text_fh, lineterminator="\n")
+    if result.columns:
+        writer.writerow(result.columns)
+    writer.writerows(result.iter_text_rows())
+    text_fh.flush()
+    text_fh.detach()
+
+
+async def iter_csv_partitions(partitions):
+    """CSV gerado em fluxo a partir dos lotes (colunas, linhas) do cursor, sem montar o resultado."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    header = True
+    async for columns, rows in partitions:
+        if header:
+            writer.writerow(columns)
+            header = False
+        writer.writerows(["" if v is None else str(v) for v in row] for row in rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def generate_csv_response(result: ResultSet) -> StreamingResponse:
+    """Converte o resultado em um arquivo CSV e retorna um StreamingResponse."""
+    fh = _new_spool()
+    write_csv(result, fh)
+    return _file_response(fh, *report_headers("csv", None))
+
+
+def write_pdf(result: ResultSet, title: str, fh):
+    """Gera um PDF robusto no arquivo binario fh."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import inch
+
+    # Página e margens
+    page_size = A4
+    left, right, top, bottom = 24, 24, 36, 36
+
+    def _new_doc():
+        return SimpleDocTemplate(
+            fh,
+            pagesize=page_size,
+            leftMargin=left,
+            rightMargin=right,
+            topMargin=top,
+            bottomMargin=bottom
+        )
+
+    doc = _new_doc()
+
+    styles = getSampleStyleSheet()
+    title_style = styles["Title"]
+    normal_style = styles["Normal"]
+
+    elements = []
+
+    # Título
+    title_text = title or "Relatório BI"
+    elements.append(Paragraph(title_text, title_style))
+    elements.append(Spacer(1, 0.25 * inch))
+
+    # Dataset vazio
+    if result.empty:
+        elements.append(Paragraph(EMPTY_MESSAGE, normal_style))
+        doc.build(elements)
+        return
+
+    # Construção dos dados para a tabela (tudo como string, direto das colunas)
+    headers = list(result.columns)
+    rows = list(result.iter_text_rows())
+    table_data = [headers] + rows
+
+    # Cálculo de larguras de coluna para caber na página
+    available_width = page_size[0] - left - right
+    font_size_body = 8
+    avg_char_width = font_size_body * 0.55
+
+    max_chars_per_col = []
+    sample_rows = rows[:1000]
+    for j in range(len(headers)):
+        max_len = len(headers[j])
+        for r in sample_rows:
+            if j < len(r):
+                l = len(r[j] or "")
+                if l > max_len:
+                    max_len = l
+        max_chars_per_col.append(min(max_len, 40))
+
+    raw_widths = [max(50, m * avg_char_width + 12) for m in max_chars_per_col]
+    scale = min(1.0, available_width / sum(raw_widths))
+    col_widths = [w * scale for w in raw_widths]
+
+    table = Table(table_data, colWidths=col_widths, repeatRows=1, splitByRow=1)
+
+    table_style = TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, 0), 9),
+        ("BOTTOMPADDING", (0, 0), (-1, 0), 8),
+        ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
+        ("FONTSIZE", (0, 1), (-1, -1), font_size_body),
+        ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+        ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f7f7f7")]),
+        ("LEFTPADDING", (0, 0), (-1, -1), 4),
+        ("RIGHTPADDING", (0, 0), (-1, -1), 4),
+        ("TOPPADDING", (0, 0), (-1, -1), 3),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), 3),
+    ])
+    table.setStyle(table_style)
+
+    elements.append(table)
+
+    # Constrói o PDF
+    try:
+        doc.build(elements)
+    except Exception as e:
+        # Fallback: se der erro de layout, gera um PDF com mensagem
+        fh.seek(0)
+        fh.truncate()
+        doc = _new_doc()
+        elements = [
+            Paragraph(title_text, title_style),
+            Spacer(1, 0.25 * inch),
+            Paragraph(f"Falha ao renderizar a tabela: {str(e)}", normal_style)
+        ]
+        doc.build(elements)
+
+
+def generate_pdf_response(result: ResultSet, title: str) -> StreamingResponse:
+    fh = _new_spool()
+    write_pdf(result, title, fh)
+    return _file_response(fh, *report_headers("pdf", title))
+
+
+def _excel_value(value):
+    # Excel nao aceita datas com fuso horario
+    if isinstance(value, (datetime.datetime, datetime.time)) and value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    return value
+
+
+def write_xlsx(result: ResultSet, title: str, fh):
+    """Gera um XLSX com largura de coluna ajustada e cabeçalho congelado no arquivo fh."""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Report")
+    ws.freeze_panes = "A2"
+
+    if result.empty:
+        columns = ["Mensagem"]
+        rows = iter([(EMPTY_MESSAGE,)])
+        sample = [[EMPTY_MESSAGE]]
+    else:
+        columns = result.columns
+        rows = result.iter_rows()
+        sample = list(result.iter_text_rows(0, 1000))
+
+    # Ajusta largura das colunas (amostra das primeiras linhas)
+    for col_idx, column in enumerate(columns, start=1):
+        max_len = max([len(r[col_idx - 1]) for r in sample] + [len(str(column))])
+        ws.column_dimensions[get_column_letter(col_idx)].width = min(max_len + 2, 50)
+
+    header_font = Font(bold=True)
+    header = []
+    for column in columns:
+        cell = WriteOnlyCell(ws, value=column)
+        cell.font = header_font
+        header.append(cell)
+    ws.append(header)
+
+    for row in rows:
+        ws.append([_excel_value(v) for v in row])
+
+    wb.save(fh)
+
+
+def generate_xlsx_response(result: ResultSet, title: str) -> StreamingResponse:
+    fh = _new_spool()
+    write_xlsx(result, title, fh)
+    return _file_response(fh, *report_headers("xlsx", title))
+
+
+# --- Parquet / Arrow IPC (escrita incremental a partir do cursor) ---
+
+COLUMNAR_EXPORT_FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.file", "arrow"),
+}
+PARQUET_CODECS = {"snappy", "gzip", "brotli", "zstd", "lz4", "none"}
+ARROW_CODECS = {"lz4", "zstd", "none"}
+
+
+def _resolve_compression(report_type: str, compression: str = None) -> str:
+    if report_type == "parquet":
+        codec, allowed = (compression or settings.PARQUET_COMPRESSION).lower(), PARQUET_CODECS
+    else:
+        codec, allowed = (compression or settings.ARROW_COMPRESSION).lower(), ARROW_CODECS
+    if codec not in allowed:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Compressao '{codec}' nao suportada para {report_type}. Opcoes: {', '.join(sorted(allowed))}."
+        )
+    return codec
+
+
+# Tipos PostgreSQL (OID) -> tipo Arrow; NUMERIC (1700) e os demais OIDs sao inferidos dos dados
+PG_ARROW_TYPES = {
+    16: "bool_", 20: "int64", 21: "int16", 23: "int32", 26: "int64",
+    700: "float32", 701: "float64",
+    19: "string", 25: "string", 1042: "string", 1043: "string", 114: "string", 3802: "string", 2950: "string",
+    17: "binary", 1082: "date32",
+}
+PG_NUMERIC_OID = 1700
+# Linhas guardadas antes de abrir o arquivo enquanto algum tipo ainda e desconhecido (so NULLs ate ali)
+SCHEMA_SAMPLE_ROWS = 100_000
+NUMERIC_FALLBACK_SCALE = 6
+
+
+def _pg_arrow_type(pa, oid):
+    if oid in PG_ARROW_TYPES:
+        return getattr(pa, PG_ARROW_TYPES[oid])()
+    if oid == 1114:
+        return pa.timestamp("us")
+    if oid == 1184:
+        return pa.timestamp("us", tz="UTC")
+    if oid == 1083:
+        return pa.time64("us")
+    return None
+
+
+def _decimal_scale(values) -> int | None:
+    scales = [
+        max(-v.as_tuple().exponent, 0) for v in values
+        if isinstance(v, decimal.Decimal) and isinstance(v.as_tuple().exponent, int)
+    ]
+    return max(scales) if scales else None
+
+
+def _arrow_field_type(pa, oid, values: list, final: bool):
+    """
+    Tipo Arrow da coluna: pelo OID do cursor quando conhecido; NUMERIC com a
+    maior escala vista na amostra; o resto inferido dos dados. None enquanto a
+    amostra so tiver NULLs (e final=False); com final=True, string.
+    """
+    arrow_type = _pg_arrow_type(pa, oid)
+    if arrow_type is not None:
+        return arrow_type
+    if oid == PG_NUMERIC_OID or any(isinstance(v, decimal.Decimal) for v in values):
+        scale = _decimal_scale(values)
+        if scale is None:
+            # NUMERIC so com NULLs na amostra inteira
+            return pa.decimal128(38, NUMERIC_FALLBACK_SCALE) if final else None
+        return pa.decimal128(38, scale)
+    inferred = pa.array(values).type if values else pa.null()
+    if pa.types.is_null(inferred):
+        return pa.string() if final else None
+    return inferred
+
+
+def _infer_arrow_schema(pa, columns: list, rows: list, final: bool = True):
+    """
+    Schema do arquivo a partir dos tipos do cursor (columns.type_oids) e da
+    amostra rows. Com final=False, retorna None se algum tipo ainda depender de
+    mais linhas (coluna so com NULLs ate aqui).
+    """
+    type_oids = getattr(columns, "type_oids", None) or [None] * len(columns)
+    fields = []
+    for j, name in enumerate(columns):
+        arrow_type = _arrow_field_type(pa, type_oids[j], [row[j] for row in rows if row[j] is not None], final)
+        if arrow_type is None:
+            return None
+        fields.append(pa.field(str(name), arrow_type))
+    return pa.schema(fields)
+
+
+def _column_array(pa, values: list, arrow_type, name: str = None):
+    if pa.types.is_decimal(arrow_type):
+        # Nunca arredonda: um valor com mais casas que o schema interrompe a exportacao
+        scale = _decimal_scale(values)
+        if scale is not None and scale > arrow_type.scale:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Coluna '{name}' tem valores com {scale} casas decimais, mais que as "
+                       f"{arrow_type.scale} usadas no arquivo; exporte em CSV."
+            )
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+        if pa.types.is_string(arrow_type):
+            return pa.array([None if v is None else str(v) for v in values], type=arrow_type)
+        raise
+
+
+def _write_record_batch(pa, writer, schema, rows: list):
+    arrays = [
+        _column_array(pa, [row[j] for row in rows], field.type, field.name)
+        for j, field in enumerate(schema)
+    ]
+    writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+
+
+def _open_columnar_writer(report_type: str, fh, schema, codec: str):
+    import pyarrow as pa
+
+    if report_type == "parquet":
+        import pyarrow.parquet as pq
+
+        return pq.ParquetWriter(
+            fh, schema,
+            compression=None if codec == "none" else codec,
+            compression_level=settings.PARQUET_COMPRESSION_LEVEL,
+        )
+    options = pa.ipc.IpcWriteOptions(compression=None if codec == "none" else codec)
+    return pa.ipc.new_file(fh, schema, options=options)
+
+
+async def write_columnar_export(partitions, report_type: str, fh, compression: str = None):
+    """
+    Consome os lotes (colunas, linhas) vindos do cursor e grava cada um como
+    record batch no arquivo Parquet/Arrow fh. A conversao e a escrita rodam em
+    thread para nao bloquear o event loop.
+
+    O schema vem dos tipos do cursor (OIDs do PostgreSQL); o que eles nao
+    resolvem (escala de NUMERIC, drivers sem OID) sai dos dados. Enquanto uma
+    dessas colunas so tiver NULLs, os lotes ficam guardados (ate
+    SCHEMA_SAMPLE_ROWS linhas) antes de abrir o arquivo. Valores NUMERIC com mais
+    casas que o schema respondem 422 em vez de serem arredondados.
+    """
+    import pyarrow as pa
+
+    codec = _resolve_compression(report_type, compression)
+    writer = schema = None
+    pending, columns = [], []
+    try:
+        async for columns, rows in partitions:
+            if writer is None:
+                pending.extend(rows)
+                schema = _infer_arrow_schema(pa, columns, pending, final=len(pending) >= SCHEMA_SAMPLE_ROWS)
+                if schema is None:
+                    continue
+                writer = _open_columnar_writer(report_type, fh, schema, codec)
+                rows, pending = pending, []
+            if rows:
+                await run_blocking(_write_record_batch, pa, writer, schema, rows)
+        if writer is None:
+            schema = _infer_arrow_schema(pa, columns, pending)
+            writer = _open_columnar_writer(report_type, fh, schema, codec)
+            if pending:
+                await run_blocking(_write_record_batch, pa, writer, schema, pending)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def generate_columnar_export_response(partitions, report_type: str, title: str, compression: str = None) -> StreamingResponse:
+    media_type, disposition = report_headers(report_type, title)
+    fh = _new_spool()
+    try:
+        await write_columnar_export(partitions, report_type, fh, compression)
+    except BaseException:
+        fh.close()
+        raise
+    return _file_response(fh, media_type, disposition)
+
+
+# --- Formatos de arquivo: tipo de midia e nome do download ---
+
+REPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "pdf": ("application/pdf", "pdf"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    **COLUMNAR_EXPORT_FORMATS,
+}
+
+
+def report_headers(report_type: str, title: str) -> tuple[str, str]:
+    """(media_type, Content-Disposition) usados no download de cada formato."""
+    media_type, extension = REPORT_FORMATS[report_type]
+    if report_type == "csv":
+        return media_type, "attachment;filename=report.csv"
+    if report_type == "pdf":
+        title = title or "Relatório BI"
+    return media_type, f"attachment; filename={_safe_filename(title)}.{extension}"
+
+
+def write_report(result: ResultSet, report_type: str, title: str, fh):
+    """Escreve o relatorio csv/pdf/xlsx do ResultSet no arquivo binario fh."""
+    if report_type == "csv":
+        write_csv(result, fh)
+    elif report_type == "pdf":
+        write_pdf(result, title, fh)
+    else:
+        write_xlsx(result, title, fh)
+
+
+def _render_to_path(payload: tuple, report_type: str, title: str, path: str):
+    """Executado no processo de renderizacao: reconstroi o ResultSet e grava o arquivo."""
+    with open(path, "wb") as fh:
+        write_report(ResultSet.from_payload(payload), report_type, title, fh)
+
+
+async def render_report(result: ResultSet, report_type: str, title: str, fh):
+    """
+    Escreve o relatorio csv/pdf/xlsx em fh fora do event loop: no pool de
+    processos de renderizacao (que grava no arquivo fh.name, portanto fh precisa
+    ser um arquivo com nome) ou, sem pool, numa thread de IO.
+    """
+    if get_render_executor() is None:
+        await run_blocking(write_report, result, report_type, title, fh)
+        return
+    try:
+        await run_render(_render_to_path, result.to_payload(), report_type, title, fh.name)
+    except RenderTimeout:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"A geração do relatório passou de {settings.RENDER_TIMEOUT_SECONDS:.0f}s. Tente um período menor ou o formato CSV/Parquet.",
+        )
+    except MemoryError:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="O relatório é grande demais para este formato. Tente um período menor ou o formato CSV/Parquet.",
+        )
+
+
+async def generate_report_response(result: ResultSet, report_type: str, title: str) -> StreamingResponse:
+    """Relatorio csv/pdf/xlsx renderizado fora do event loop, num temporario removido apos o envio."""
+    fh = tempfile.NamedTemporaryFile(mode="w+b")
+    try:
+        await render_report(result, report_type, title, fh)
+    except BaseException:
+        fh.close()
+        raise
+    return _file_response(fh, *report_headers(report_type, title))
+
+
+def warm_up_imports():
+    """Importa antecipadamente as bibliotecas de relatorio (numpy, reportlab, openpyxl)."""
+    import numpy  # noqa: F401
+    import openpyxl  # noqa: F401
+    import reportlab.platypus  # noqa: F401
+    from reportlab.lib.styles import getSampleStyleSheet
+
+    getSampleStyleSheet()
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+Modo de resposta do /analyze escolhido pelo tamanho do resultado, antes de
+trazer as linhas para a memoria.
+
+- inline: ate RESULT_INLINE_MAX_ROWS linhas, no JSON como antes.
+- paginated: ate RESULT_DOWNLOAD_MIN_ROWS; o JSON traz a primeira pagina
+  (RESULT_PAGE_ROWS linhas), um next_cursor para GET /analyze/page e os links
+  de download.
+- download: acima disso; o JSON traz so uma amostra (a primeira pagina) e os
+  links para GET /analyze/download (CSV, Parquet ou Arrow gerados em fluxo a
+  partir do cursor do banco).
+
+A estimativa vem do EXPLAIN (linhas previstas pelo planejador). Como o
+planejador erra em joins e agrupamentos, a decisao inline e confirmada lendo no
+maximo RESULT_INLINE_MAX_ROWS + 1 linhas; se passar, um COUNT limitado a
+RESULT_DOWNLOAD_MIN_ROWS + 1 (com RESULT_COUNT_TIMEOUT_MS) decide entre
+paginated e download. Relatorios PDF/XLSX pequenos (ate
+RESULT_REPORT_INLINE_MAX_ROWS) voltam como tabela com o link do arquivo, e os
+enormes viram download em CSV/Parquet em vez de passar pela renderizacao.
+
+Os cursores levam o SQL, o tenant e o deslocamento, assinados com HMAC-SHA256
+com RESULT_CURSOR_SECRET. Sem ele, a chave e aleatoria, gerada na importacao:
+com o preload do gunicorn ela e criada no master e herdada por todos os
+workers, mas os cursores deixam de valer num restart e nao servem entre hosts
+(defina RESULT_CURSOR_SECRET nesses casos). A chave nunca e derivada de
+configuracao previsivel, ja que o cursor leva SQL executado pelas rotas de
+pagina e download.
+
+Paginas (e a amostra/primeira pagina) precisam de uma ordem estavel entre
+requisicoes. Quando a consulta termina em ORDER BY (com ou sem LIMIT/OFFSET
+proprios), o LIMIT/OFFSET da pagina vai na propria consulta, combinado com os
+dela; o desempate entre linhas iguais no ORDER BY fica por conta da consulta.
+Sem ORDER BY no nivel externo, a consulta vira subconsulta ordenada pela linha
+inteira (_pagina::text), que e deterministica: o PostgreSQL nao garante que o
+ORDER BY de uma subconsulta sobreviva a consulta externa.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from dataclasses import dataclass
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from app.core.config import settings
+from app.core.tenancy import current_tenant
+from app.services.db_service import check_read_only, fetch_result_set
+from app.services.result_set import ResultSet
+from app.services.sql_params import tokenize
+
+DOWNLOAD_FORMATS = ("csv", "parquet", "arrow")
+
+if settings.RESULT_CURSOR_SECRET:
+    _CURSOR_KEY = settings.RESULT_CURSOR_SECRET.encode()
+else:
+    _CURSOR_KEY = secrets.token_bytes(32)
+    print("RESULT_CURSOR_SECRET nao definido: cursores de pagina/download assinados com chave aleatoria deste processo.")
+
+RESULT_MODE_STATS = {"inline": 0, "paginated": 0, "download": 0, "report_inline": 0, "explain_failures": 0, "count_timeouts": 0}
+
+
+@dataclass
+class ResponseMode:
+    """Modo escolhido, o motivo e as linhas que vao no JSON (todas, a primeira pagina ou a amostra)."""
+    mode: str
+    reason: str
+    data: ResultSet
+    estimated_rows: int | None
+    counted_rows: int | None = None
+    cursor: str | None = None
+    next_cursor: str | None = None
+    formats: tuple = DOWNLOAD_FORMATS
+
+    def describe(self) -> dict:
+        described = {
+            "mode": self.mode,
+            "reason": self.reason,
+            "estimated_rows": self.estimated_rows,
+            "counted_rows": self.counted_rows,
+            "rows": len(self.data),
+        }
+        if self.cursor is not None:
+            described["next_cursor"] = self.next_cursor
+            described["downloads"] = download_links(self.cursor, self.formats)
+        return described
+
+
+# --- SQL auxiliar (a consulta original vira subconsulta) ---
+
+def _statement_tokens(sql: str) -> list:
+    """
+    Tokens do SQL validado (mesma checagem de execute_sql_query), sem ';',
+    espacos e comentarios no fim.
+    """
+    try:
+        check_read_only(sql)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Erro ao executar a consulta SQL: {e}")
+    tokens = tokenize(sql)
+    while tokens and (tokens[-1][0] in ("space", "comment") or tokens[-1][1] == ";"):
+        tokens.pop()
+    return tokens
+
+
+def _base_sql(sql: str) -> str:
+    """SQL pronto para virar subconsulta."""
+    return "".join(value for _, value in _statement_tokens(sql)).strip()
+
+
+def _paging_tail(tokens: list):
+    """
+    Para consultas que terminam em ORDER BY no nivel externo: (posicao onde
+    comecam LIMIT/OFFSET proprios, expressao do LIMIT, expressao do OFFSET), com
+    None para os ausentes. None se nao houver ORDER BY externo ou o final nao
+    for so LIMIT/OFFSET (ex.: FETCH FIRST).
+    """
+    depth, order_by, clauses = 0, None, []
+    significant = [i for i, (kind, _) in enumerate(tokens) if kind not in ("space", "comment")]
+    for pos, i in enumerate(significant):
+        kind, value = tokens[i]
+        if value == "(":
+            depth += 1
+        elif value == ")":
+            depth -= 1
+        elif depth == 0 and kind == "word":
+            word = value.upper()
+            following = tokens[significant[pos + 1]][1].upper() if pos + 1 < len(significant) else ""
+            if word == "ORDER" and following == "BY":
+                order_by, clauses = i, []
+            elif word in ("LIMIT", "OFFSET"):
+                clauses.append((word, i))
+            elif word in ("FETCH", "FOR", "UNION", "INTERSECT", "EXCEPT") and order_by is not None:
+                return None
+    if order_by is None or any(i < order_by for _, i in clauses):
+        return None
+    if not clauses:
+        return len(tokens), None, None
+
+    expressions = {}
+    bounds = [i for _, i in clauses] + [len(tokens)]
+    for (word, start), end in zip(clauses, bounds[1:]):
+        expression = "".join(value for _, value in tokens[start + 1:end]).strip()
+        if word == "OFFSET":
+            for suffix in (" ROWS", " ROW"):
+                if expression.upper().endswith(suffix):
+                    expression = expression[: -len(suffix)].strip()
+        if not expression or word in expressions:
+            return None
+        expressions[word] = expression
+    limit = expressions.get("LIMIT")
+    if limit is not None and limit.upper() == "ALL":
+        limit = None
+    return clauses[0][1], limit, expressions.get("OFFSET")
+
+
+def limited_sql(sql: str, limit: int, offset: int = 0) -> str:
+    """Linhas [offset, offset + limit) da consulta, numa ordem estavel entre chamadas."""
+    limit, offset = int(limit), int(offset)
+    tokens = _statement_tokens(sql)
+    tail = _paging_tail(tokens) if "$" not in sql else None
+    if tail is None:
+        # Quebra de linha antes do ')' para que um comentario '--' no meio do SQL nao o engula
+        base = "".join(value for _, value in tokens).strip()
+        return f"SELECT * FROM (\n{base}\n) AS _pagina ORDER BY _pagina::text LIMIT {limit} OFFSET {offset}"
+    cut, own_limit, own_offset = tail
+    base = "".join(value for _, value in tokens[:cut]).strip()
+    # LIMIT/OFFSET da propria consulta combinados com os da pagina
+    limit_sql = str(limit) if own_limit is None else f"GREATEST(LEAST(({own_limit}) - {offset}, {limit}), 0)"
+    offset_sql = str(offset) if own_offset is None else f"({own_offset}) + {offset}"
+    return f"{base}\nLIMIT {limit_sql} OFFSET {offset_sql}"
+
+
+def _count_sql(sql: str, cap: int) -> str:
+    return f"SELECT COUNT(*) FROM (SELECT 1 FROM (\n{_base_sql(sql)}\n) AS resultado LIMIT {int(cap)}) AS contagem"
+
+
+async def estimate_rows(db, sql: str, params: dict = None) -> int | None:
+    """Linhas previstas pelo planejador (EXPLAIN sem ANALYZE) ou None se o EXPLAIN falhar."""
+    statement = text(f"EXPLAIN (FORMAT JSON) {_base_sql(sql)}")
+    try:
+        async with db.begin_nested():
+            plan = (await db.execute(statement, params or {})).scalar()
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        return int(plan[0]["Plan"]["Plan Rows"])
+    except Exception as e:
+        RESULT_MODE_STATS["explain_failures"] += 1
+        print(f"EXPLAIN para estimar o resultado falhou: {e}")
+        return None
+
+
+async def count_rows(db, sql: str, params: dict = None, cap: int = None) -> int | None:
+    """COUNT(*) limitado a cap linhas, com timeout; None se o tempo acabar ou a contagem falhar."""
+    cap = cap or settings.RESULT_DOWNLOAD_MIN_ROWS + 1
+    statement = text(_count_sql(sql, cap))
+    savepoint = await db.begin_nested()
+    try:
+        await db.execute(text(f"SET LOCAL statement_timeout = {int(settings.RESULT_COUNT_TIMEOUT_MS)}"))
+        count = (await db.execute(statement, params or {})).scalar()
+        # SET LOCAL vale ate o fim da transacao externa: volta o timeout antes de seguir
+        await db.execute(text("SET LOCAL statement_timeout TO DEFAULT"))
+        await savepoint.commit()
+        return int(count)
+    except Exception as e:
+        await savepoint.rollback()
+        RESULT_MODE_STATS["count_timeouts"] += 1
+        print(f"COUNT limitado do resultado falhou: {e}")
+        return None
+
+
+async def _head(db, sql: str, params: dict, rows: int) -> ResultSet:
+    return await fetch_result_set(db, limited_sql(sql, rows), params=params)
+
+
+def _first(result: ResultSet, rows: int) -> ResultSet:
+    if len(result) <= rows:
+        return result
+    return ResultSet(result.columns, [a[:rows] for a in result.arrays], result.scales)
+
+
+# --- Cursores assinados ---
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _unb64(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def sign_cursor(sql: str, offset: int, rows: int | None, title: str = None) -> str:
+    payload = {
+        "sql": sql,
+        "tenant": current_tenant().id,
+        "offset": offset,
+        "rows": rows,
+        "title": title,
+        "exp": int(time.time() + settings.RESULT_CURSOR_TTL_SECONDS),
+    }
+    body = _b64(json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+    return body + "." + _b64(hmac.new(_CURSOR_KEY, body.encode(), hashlib.sha256).digest())
+
+
+def read_cursor(cursor: str) -> dict:
+    """Valida assinatura, expiracao e tenant do cursor e devolve o conteudo."""
+    body, _, signature = (cursor or "").partition(".")
+    expected = _b64(hmac.new(_CURSOR_KEY, body.encode(), hashlib.sha256).digest())
+    if not body or not hmac.compare_digest(signature, expected):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Cursor invalido.")
+    payload = json.loads(_unb64(body))
+    if payload["exp"] < time.time():
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Cursor expirado. Refaca a pergunta.")
+    if payload["tenant"] != current_tenant().id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="O cursor pertence a outro tenant.")
+    return payload
+
+
+def download_links(cursor: str, formats=DOWNLOAD_FORMATS) -> dict:
+    return {fmt: f"/analyze/download?format={fmt}&cursor={cursor}" for fmt in formats}
+
+
+def _paged(mode: str, reason: str, page: ResultSet, estimate: int | None, count: int | None,
+           sql: str, title: str) -> ResponseMode:
+    rows = count if count is not None else estimate
+    cursor = sign_cursor(sql, 0, rows, title)
+    next_cursor = sign_cursor(sql, settings.RESULT_PAGE_ROWS, rows, title) if mode == "paginated" else None
+    RESULT_MODE_STATS[mode] += 1
+    return ResponseMode(mode, reason, page, estimate, count, cursor, next_cursor)
+
+
+async def choose_table_mode(db, sql: str, params: dict, display_sql: str, title: str) -> ResponseMode:
+    """Modo de uma resposta 'table': inline, paginated ou download."""
+    inline_max, download_min, page_rows = (
+        settings.RESULT_INLINE_MAX_ROWS, settings.RESULT_DOWNLOAD_MIN_ROWS, settings.RESULT_PAGE_ROWS,
+    )
+    estimate = await estimate_rows(db, sql, params)
+    head = None
+    if estimate is None or estimate <= download_min:
+        head = await _head(db, sql, params, inline_max + 1)
+        if len(head) <= inline_max:
+            RESULT_MODE_STATS["inline"] += 1
+            return ResponseMode("inline", f"{len(head)} linhas (limite inline {inline_max}).", head, estimate, len(head))
+
+    count = await count_rows(db, sql, params, download_min + 1)
+    if count is not None and count <= inline_max:
+        # O planejador superestimou: cabe inline
+        head = head if head is not None else await _head(db, sql, params, inline_max + 1)
+        RESULT_MODE_STATS["inline"] += 1
+        return ResponseMode("inline", f"{len(head)} linhas (limite inline {inline_max}).", head, estimate, count)
+
+    page = _first(head, page_rows) if head is not None else await _head(db, sql, params, page_rows)
+    if count is not None and count <= download_min:
+        reason = f"{count} linhas: acima do limite inline ({inline_max}), em paginas de {page_rows}."
+        return _paged("paginated", reason, page, estimate, count, display_sql, title)
+    if count is None:
+        reason = f"A contagem passou de {settings.RESULT_COUNT_TIMEOUT_MS} ms (estimativa {estimate}): use o download."
+    else:
+        reason = f"Mais de {download_min} linhas: apenas amostra de {len(page)} e download em fluxo."
+    return _paged("download", reason, page, estimate, count, display_sql, title)
+
+
+async def choose_report_mode(db, sql: str, params: dict, display_sql: str, title: str, report_type: str) -> ResponseMode | None:
+    """
+    PDF/XLSX: tabela inline para resultados minimos, download em CSV/Parquet para
+    os enormes; None segue para a renderizacao normal.
+    """
+    estimate = await estimate_rows(db, sql, params)
+    if estimate is None:
+        return None
+    if estimate <= settings.RESULT_REPORT_INLINE_MAX_ROWS:
+        head = await _head(db, sql, params, settings.RESULT_REPORT_INLINE_MAX_ROWS + 1)
+        if len(head) > settings.RESULT_REPORT_INLINE_MAX_ROWS:
+            return None
+        RESULT_MODE_STATS["report_inline"] += 1
+        reason = f"{len(head)} linhas: tabela inline; o {report_type.upper()} fica disponivel no link."
+        cursor = sign_cursor(display_sql, 0, len(head), title)
+        return ResponseMode("inline", reason, head, estimate, len(head), cursor, formats=(report_type,) + DOWNLOAD_FORMATS)
+    if estimate > settings.RESULT_DOWNLOAD_MIN_ROWS:
+        count = await count_rows(db, sql, params)
+        if count is None or count > settings.RESULT_DOWNLOAD_MIN_ROWS:
+            page = await _head(db, sql, params, settings.RESULT_PAGE_ROWS)
+            reason = f"Grande demais para {report_type.upper()} (mais de {settings.RESULT_DOWNLOAD_MIN_ROWS} linhas): download em CSV/Parquet."
+            return _paged("download", reason, page, estimate, count, display_sql, title)
+    return None
+
+
+async def fetch_page(db, payload: dict) -> tuple[ResultSet, str | None]:
+    """Pagina do cursor e o cursor da seguinte (None na ultima)."""
+    page_rows = settings.RESULT_PAGE_ROWS
+    result = await fetch_result_set(db, limited_sql(payload["sql"], page_rows + 1, payload["offset"]))
+    next_cursor = None
+    if len(result) > page_rows:
+        next_cursor = sign_cursor(payload["sql"], payload["offset"] + page_rows, payload["rows"], payload["title"])
+    return _first(result, page_rows), next_cursor
+
+
+def get_result_mode_stats() -> dict:
+    return {
+        **RESULT_MODE_STATS,
+        "inline_max_rows": settings.RESULT_INLINE_MAX_ROWS,
+        "download_min_rows": settings.RESULT_DOWNLOAD_MIN_ROWS,
+        "page_rows": settings.RESULT_PAGE_ROWS,
+    }
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Representacao colunar compacta do resultado de uma consulta.
+
+O resultado e lido do cursor uma unica vez, em lotes, e guardado como nomes de
+colunas + um array por coluna (NumPy para inteiros e floats, lista para as
+demais). Colunas NUMERIC continuam como listas de Decimal: o valor exato vai
+para o JSON (um SUM inteiro sai 15, nao 15.0) e totais acima de 2**53 nao
+perdem precisao. Os geradores de JSON, CSV, XLSX e PDF percorrem esse objeto em blocos
+de linhas, sem montar DataFrames ou listas de dicionarios intermediarias.
+"""
+import datetime
+import decimal
+import math
+import uuid
+
+ITER_CHUNK_ROWS = 2048
+MAX_DECIMAL_PLACES = 6
+
+
+def _compact_column(values: list):
+    """
+    Converte a coluna para um array tipado quando possivel.
+    Retorna (array_ou_lista, casas_decimais) -- casas_decimais so e definida para
+    colunas NUMERIC (Decimal), que ficam como lista de Decimal, para que CSV/PDF
+    mantenham a formatacao original.
+    """
+    import numpy as np
+
+    kinds = set()
+    scale = None
+    for v in values:
+        if v is None:
+            kinds.add("null")
+        elif isinstance(v, bool):
+            return values, None
+        elif isinstance(v, int):
+            kinds.add("int")
+        elif isinstance(v, float):
+            kinds.add("float")
+        elif isinstance(v, decimal.Decimal):
+            kinds.add("decimal")
+            exponent = v.as_tuple().exponent
+            if isinstance(exponent, int):
+                places = min(max(-exponent, 0), MAX_DECIMAL_PLACES)
+                scale = places if scale is None else max(scale, places)
+        else:
+            return values, None
+
+    numeric = kinds - {"null"}
+    if not numeric:
+        return values, None
+    if "decimal" in numeric:
+        # Decimal exato (sem float64): mesma saida JSON de antes e sem perda acima de 2**53
+        return values, scale
+    if numeric == {"int"} and "null" not in kinds:
+        try:
+            return np.array(values, dtype=np.int64), None
+        except OverflowError:
+            return values, None
+    if numeric == {"int"}:
+        # Inteiros com nulos ficam como objeto para nao virarem float no JSON
+        return values, None
+    return np.array([math.nan if v is None else float(v) for v in values], dtype=np.float64), scale
+
+
+class ResultSet:
+    """Nomes de colunas + um array por coluna, com iteracao por linhas em blocos."""
+
+    __slots__ = ("columns", "arrays", "scales", "row_count")
+
+    def __init__(self, columns: list, arrays: list, scales: list = None):
+        self.columns = [str(c) for c in columns]
+        self.arrays = arrays
+        self.scales = scales or [None] * len(arrays)
+        self.row_count = len(arrays[0]) if arrays else 0
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    @property
+    def empty(self) -> bool:
+        return self.row_count == 0 or not self.columns
+
+    @classmethod
+    def from_columns(cls, columns: list, buffers: list) -> "ResultSet":
+        """Cria o ResultSet a partir de listas por coluna (consumidas e liberadas)."""
+        arrays, scales = [], []
+        for i in range(len(buffers)):
+            array, scale = _compact_column(buffers[i])
+            buffers[i] = None  # libera a lista original assim que o array tipado existe
+            arrays.append(array)
+            scales.append(scale)
+        return cls(columns, arrays, scales)
+
+    @classmethod
+    def from_records(cls, records: list) -> "ResultSet":
+        columns = list(records[0].keys()) if records else []
+        return cls.from_columns(columns, [[r.get(c) for r in records] for c in columns])
+
+    def to_payload(self) -> tuple:
+        """
+        Forma compacta para envio a outro processo: nomes, um array por coluna e
+        escalas. Arrays NumPy sao serializados como buffers binarios e as demais
+        colunas como listas de valores (sem um dicionario por linha).
+        """
+        return self.columns, self.arrays, self.scales
+
+    @classmethod
+    def from_payload(cls, payload: tuple) -> "ResultSet":
+        columns, arrays, scales = payload
+        return cls(columns, arrays, scales)
+
+    def column(self, name: str):
+        return self.arrays[self.columns.index(name)]
+
+    def _column_slice(self, j: int, start: int, stop: int) -> list:
+        array = self.arrays[j]
+        if isinstance(array, list):
+            return array[start:stop]
+        values = array[start:stop].tolist()
+        if array.dtype.kind == "f":
+            values = [None if v != v else v for v in values]
+        return values
+
+    def iter_rows(self, start: int = 0, stop: int = None, chunk_rows: int = ITER_CHUNK_ROWS):
+        """Gera tuplas com valores Python nativos (NaN vira None), em blocos."""
+        stop = self.row_count if stop is None else min(stop, self.row_count)
+        for offset in range(start, stop, chunk_rows):
+            end = min(offset + chunk_rows, stop)
+            yield from zip(*(self._column_slice(j, offset, end) for j in range(len(self.columns))))
+
+    def iter_text_rows(self, start: int = 0, stop: int = None):
+        """Linhas como strings, para CSV/PDF (nulos vazios, NUMERIC com as casas originais)."""
+        formatters = [_text_formatter(scale) for scale in self.scales]
+        for row in self.iter_rows(start, stop):
+            yield [fmt(v) for fmt, v in zip(formatters, row)]
+
+    def to_records(self, start: int = 0, stop: int = None) -> list:
+        columns = self.columns
+        return [dict(zip(columns, row)) for row in self.iter_rows(start, stop)]
+
+
+def _text_formatter(scale):
+    if scale is None:
+        return lambda v: "" if v is None else str(v)
+    return lambda v: "" if v is None else f"{v:.{scale}f}"
+
+
+def json_default(value):
+    """Mesmas conversoes do jsonable_encoder do FastAPI para os tipos vindos do banco."""
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode(errors="replace")
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Tipo {type(value).__name__} nao serializavel em JSON")
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Tabelas pre-agregadas (rollups) de vendas, mantidas de forma incremental.
+
+A partir de pedidosvenda/itenspedidovenda sao mantidas tabelas diarias e mensais
+por cliente, vendedor, status, produto e categoria. Cada atualizacao recalcula
+somente os dias a partir da marca d'agua (maior datapedido ja processado, menos
+uma janela de ROLLUP_LOOKBACK_DAYS para pedidos alterados/atrasados) e os meses
+correspondentes. O resumo do esquema enviado a IA anuncia essas tabelas para
+que perguntas agregadas leiam milhares de linhas em vez de milhoes.
+
+Varios workers podem rodar o laco: um advisory lock do PostgreSQL (por schema)
+garante que apenas um atualize cada tenant por vez; os demais pulam a rodada.
+Cada tenant tem as suas tabelas de rollup no proprio schema. Todo worker
+confere a cada rodada (inclusive quando pula a atualizacao) se as tabelas ja
+existem e, na primeira vez que as encontra, recarrega o seu resumo do esquema,
+para que os prompts de todos os workers passem a citar os rollups.
+"""
+import asyncio
+import datetime
+import time
+from sqlalchemy import text
+from app.core.config import settings
+from app.core.tenancy import TENANTS, Tenant, current_tenant
+from app.services import db_service
+
+ROLLUP_LOCK_KEY = 724_311_036
+FULL_REBUILD_SINCE = datetime.datetime(1900, 1, 1)
+
+ROLLUP_DDL = [
+    text("""
+        CREATE TABLE IF NOT EXISTS rollup_watermark (
+            nome text PRIMARY KEY,
+            ultimo_datapedido timestamp,
+            atualizado_em timestamptz NOT NULL DEFAULT now()
+        )
+    """),
+    text("""
+        CREATE TABLE IF NOT EXISTS rollup_vendas_diarias (
+            dia date NOT NULL,
+            clienteid bigint,
+            vendedorid bigint,
+            statuspedido text,
+            pedidos integer NOT NULL,
+            valor_total numeric NOT NULL
+        )
+    """),
+    text("CREATE INDEX IF NOT EXISTS ix_rollup_vendas_diarias_dia ON rollup_vendas_diarias (dia)"),
+    text("""
+        CREATE TABLE IF NOT EXISTS rollup_vendas_mensais (
+            mes date NOT NULL,
+            clienteid bigint,
+            vendedorid bigint,
+            statuspedido text,
+            pedidos integer NOT NULL,
+            valor_total numeric NOT NULL
+        )
+    """),
+    text("CREATE INDEX IF NOT EXISTS ix_rollup_vendas_mensais_mes ON rollup_vendas_mensais (mes)"),
+    text("""
+        CREATE TABLE IF NOT EXISTS rollup_itens_diarios (
+            dia date NOT NULL,
+            produtoid bigint,
+            categoriaid bigint,
+            vendedorid bigint,
+            quantidade numeric NOT NULL,
+            valor_total numeric NOT NULL,
+            pedidos integer NOT NULL
+        )
+    """),
+    text("CREATE INDEX IF NOT EXISTS ix_rollup_itens_diarios_dia ON rollup_itens_diarios (dia)"),
+    text("""
+        CREATE TABLE IF NOT EXISTS rollup_itens_mensais (
+            mes date NOT NULL,
+            produtoid bigint,
+            categoriaid bigint,
+            vendedorid bigint,
+            quantidade numeric NOT NULL,
+            valor_total numeric NOT NULL,
+            pedidos integer NOT NULL
+        )
+    """),
+    text("CREATE INDEX IF NOT EXISTS ix_rollup_itens_mensais_mes ON rollup_itens_mensais (mes)"),
+]
+
+# Recalculo incremental: apaga o periodo afetado e reagrega a partir das tabelas brutas
+ROLLUP_REFRESH = [
+    text("DELETE FROM rollup_vendas_diarias WHERE dia >= :dia_inicio"),
+    text("""
+        INSERT INTO rollup_vendas_diarias (dia, clienteid, vendedorid, statuspedido, pedidos, valor_total)
+        SELECT datapedido::date, clienteid, vendedorid, statuspedido, COUNT(*), COALESCE(SUM(valortotal), 0)
+        FROM pedidosvenda
+        WHERE datapedido >= :desde
+        GROUP BY 1, 2, 3, 4
+    """),
+    text("DELETE FROM rollup_itens_diarios WHERE dia >= :dia_inicio"),
+    text("""
+        INSERT INTO rollup_itens_diarios (dia, produtoid, categoriaid, vendedorid, quantidade, valor_total, pedidos)
+        SELECT pv.datapedido::date, iv.produtoid, p.categoriaid, pv.vendedorid,
+               COALESCE(SUM(iv.quantidade), 0), COALESCE(SUM(iv.valortotalitem), 0), COUNT(DISTINCT pv.pedidoid)
+        FROM itenspedidovenda AS iv
+        JOIN pedidosvenda AS pv ON pv.pedidoid = iv.pedidoid
+        LEFT JOIN produtos AS p ON p.produtoid = iv.produtoid
+        WHERE pv.datapedido >= :desde
+        GROUP BY 1, 2, 3, 4
+    """),
+    text("DELETE FROM rollup_vendas_mensais WHERE mes >= :mes_inicio"),
+    text("""
+        INSERT INTO rollup_vendas_mensais (mes, clienteid, vendedorid, statuspedido, pedidos, valor_total)
+        SELECT DATE_TRUNC('month', dia)::date, clienteid, vendedorid, statuspedido, SUM(pedidos), SUM(valor_total)
+        FROM rollup_vendas_diarias
+        WHERE dia >= :mes_inicio
+        GROUP BY 1, 2, 3, 4
+    """),
+    text("DELETE FROM rollup_itens_mensais WHERE mes >= :mes_inicio"),
+    text("""
+        INSERT INTO rollup_itens_mensais (mes, produtoid, categoriaid, vendedorid, quantidade, valor_total, pedidos)
+        SELECT DATE_TRUNC('month', dia)::date, produtoid, categoriaid, vendedorid, SUM(quantidade), SUM(valor_total), SUM(pedidos)
+        FROM rollup_itens_diarios
+        WHERE dia >= :mes_inicio
+        GROUP BY 1, 2, 3, 4
+    """),
+]
+
+TABLES_EXIST_QUERY = text("SELECT to_regclass('rollup_vendas_mensais') IS NOT NULL")
+LOCK_QUERY = text("SELECT pg_try_advisory_xact_lock(:key, hashtext(:schema))")
+WATERMARK_QUERY = text("SELECT ultimo_datapedido FROM rollup_watermark WHERE nome = 'vendas'")
+MAX_DATE_QUERY = text("SELECT MAX(datapedido) FROM pedidosvenda WHERE datapedido >= :desde")
+UPSERT_WATERMARK = text("""
+    INSERT INTO rollup_watermark (nome, ultimo_datapedido, atualizado_em)
+    VALUES ('vendas', :ultimo, now())
+    ON CONFLICT (nome) DO UPDATE SET ultimo_datapedido = EXCLUDED.ultimo_datapedido, atualizado_em = now()
+""")
+
+ROLLUP_STATE = {
+    "enabled": settings.ROLLUPS_ENABLED,
+    "tenants": {},
+}
+
+_refresh_task = None
+_tables_created = set()
+# Tenants cujo resumo do esquema, neste worker, ja inclui as tabelas de rollup
+_digest_loaded = set()
+
+
+def _tenant_state(tenant: Tenant) -> dict:
+    return ROLLUP_STATE["tenants"].setdefault(
+        tenant.id, {"ready": False, "last_run": None, "last_result": None, "watermark": None}
+    )
+
+
+def _as_datetime(value):
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.combine(value, datetime.time())
+
+
+async def refresh_rollups(full: bool = False, tenant: Tenant = None) -> dict:
+    """
+    Cria as tabelas (se preciso) e recalcula os rollups do tenant a partir da
+    marca d'agua. Com full=True reconstroi todo o historico.
+    """
+    tenant = tenant or current_tenant()
+    engine = db_service.primary_engine(tenant)
+    if engine is None:
+        raise Exception("O motor do banco de dados nao foi inicializado corretamente.")
+
+    start = time.perf_counter()
+    async with engine.begin() as connection:
+        # Tabelas criadas por outro worker (ou antes do restart) tambem contam
+        if tenant.id not in _tables_created and (await connection.execute(TABLES_EXIST_QUERY)).scalar():
+            _tables_created.add(tenant.id)
+
+        if not (await connection.execute(LOCK_QUERY, {"key": ROLLUP_LOCK_KEY, "schema": tenant.schema})).scalar():
+            skipped = True
+        else:
+            skipped = False
+            latest, watermark, since, created_now = await _refresh_locked(connection, tenant, full)
+
+    if not skipped and created_now:
+        # So depois do commit: as tabelas novas passam a constar no resumo do esquema enviado a IA
+        _tables_created.add(tenant.id)
+    await _ensure_digest(tenant)
+    if skipped:
+        return {"status": "skipped", "detail": "Outra instancia esta atualizando os rollups."}
+
+    result = {
+        "status": "ok",
+        "full": watermark is None,
+        "since": since.isoformat(),
+        "watermark": latest.isoformat() if latest else None,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    _tenant_state(tenant).update(ready=True, watermark=result["watermark"])
+    return result
+
+
+async def _ensure_digest(tenant: Tenant):
+    """Na primeira vez que este worker ve as tabelas de rollup do tenant, recarrega o resumo do esquema."""
+    if tenant.id in _tables_created and tenant.id not in _digest_loaded:
+        await db_service.load_schema_digest(tenant)
+        _digest_loaded.add(tenant.id)
+
+
+async def _refresh_locked(connection, tenant: Tenant, full: bool) -> tuple:
+    """
+    Recalculo dentro da transacao que detem o advisory lock.
+    Retorna (ultimo datapedido, marca anterior, desde, tabelas criadas agora).
+    """
+    created_now = tenant.id not in _tables_created
+    if created_now:
+        for statement in ROLLUP_DDL:
+            await connection.execute(statement)
+
+    watermark = None if full else _as_datetime((await connection.execute(WATERMARK_QUERY)).scalar())
+    if watermark is None:
+        since = FULL_REBUILD_SINCE
+    else:
+        since = datetime.datetime.combine(
+            (watermark - datetime.timedelta(days=settings.ROLLUP_LOOKBACK_DAYS)).date(), datetime.time()
+        )
+    params = {"desde": since, "dia_inicio": since.date(), "mes_inicio": since.date().replace(day=1)}
+
+    for statement in ROLLUP_REFRESH:
+        await connection.execute(statement, params)
+
+    latest = _as_datetime((await connection.execute(MAX_DATE_QUERY, {"desde": since})).scalar()) or watermark
+    await connection.execute(UPSERT_WATERMARK, {"ultimo": latest})
+    return latest, watermark, since, created_now
+
+
+async def refresh_now(full: bool = False, tenant: Tenant = None) -> dict:
+    """
+    Atualiza os rollups do tenant (o da requisicao por padrao) e guarda o
+    resultado em ROLLUP_STATE; erros viram {"status": "error"} em vez de subir.
+    """
+    tenant = tenant or current_tenant()
+    try:
+        result = await refresh_rollups(full, tenant)
+    except Exception as e:
+        print(f"Erro ao atualizar os rollups (tenant {tenant.id}): {e}")
+        result = {"status": "error", "detail": f"{type(e).__name__}: {e}"}
+    state = _tenant_state(tenant)
+    state["last_run"] = time.time()
+    state["last_result"] = result
+    return result
+
+
+async def _refresh_loop():
+    while True:
+        for tenant in TENANTS.values():
+            await refresh_now(tenant=tenant)
+        await asyncio.sleep(settings.ROLLUP_REFRESH_SECONDS)
+
+
+def start():
+    """Agenda a atualizacao periodica dos rollups no event loop atual."""
+    global _refresh_task
+    if settings.ROLLUPS_ENABLED and _refresh_task is None:
+        _refresh_task = asyncio.get_running_loop().create_task(_refresh_loop())
+
+
+async def stop():
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        try:
+            await _refresh_task
+        except asyncio.CancelledError:
+            pass
+        _refresh_task = None
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Sessoes de conversa mantidas no servidor.
+
+Cada sessao guarda as ultimas trocas (pergunta, SQL gerado, mensagem) para que
+perguntas de continuacao ("agora so de julho") sejam respondidas com um prompt
+compacto que reaproveita a consulta anterior. As sessoes ficam numa tabela do
+PostgreSQL (conversa_sessoes, chave (tenant, session_id)), compartilhada por
+todos os workers: uma continuacao atendida por outro worker encontra o mesmo
+contexto.
+
+A tabela fica no schema SESSION_SCHEMA, separado do schema de negocio do
+tenant: nao entra no resumo do esquema enviado a IA nem na versao dos dados
+(app.services.data_version), e o acesso ao schema e revogado de PUBLIC.
+check_read_only ainda recusa SQL gerado que cite o schema ou a tabela, porque o
+papel de leitura pode ser o mesmo dono das tabelas. So trocas cujo SQL executou
+com sucesso viram contexto. Expiram por inatividade (SESSION_TTL_SECONDS); as
+expiradas sao removidas ao criar novas sessoes. Uma sessao desconhecida ou
+expirada nao e recriada em silencio: o /analyze responde 404 session_expired.
+"""
+import json
+import time
+import uuid
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from app.core.config import settings
+from app.core.tenancy import current_tenant
+from app.services import db_service
+
+SESSION_TABLE = f"{settings.SESSION_SCHEMA}.conversa_sessoes"
+
+SESSION_DDL = [
+    text(f"CREATE SCHEMA IF NOT EXISTS {settings.SESSION_SCHEMA}"),
+    text(f"REVOKE ALL ON SCHEMA {settings.SESSION_SCHEMA} FROM PUBLIC"),
+    text(f"""
+        CREATE TABLE IF NOT EXISTS {SESSION_TABLE} (
+            tenant_id text NOT NULL,
+            session_id text NOT NULL,
+            criada_em timestamptz NOT NULL DEFAULT now(),
+            ultimo_acesso timestamptz NOT NULL DEFAULT now(),
+            turnos jsonb NOT NULL DEFAULT '[]'::jsonb,
+            PRIMARY KEY (tenant_id, session_id)
+        )
+    """),
+    text(f"CREATE INDEX IF NOT EXISTS ix_conversa_sessoes_ultimo_acesso ON {SESSION_TABLE} (ultimo_acesso)"),
+]
+
+_COLUMNS = """
+    session_id, EXTRACT(EPOCH FROM criada_em) AS criada_em,
+    EXTRACT(EPOCH FROM ultimo_acesso) AS ultimo_acesso, turnos
+"""
+
+PURGE_SQL = text(f"""
+    DELETE FROM {SESSION_TABLE}
+    WHERE tenant_id = :tenant AND ultimo_acesso < now() - make_interval(secs => :ttl)
+""")
+INSERT_SQL = text(f"""
+    INSERT INTO {SESSION_TABLE} (tenant_id, session_id) VALUES (:tenant, :session_id)
+    ON CONFLICT (tenant_id, session_id) DO UPDATE SET ultimo_acesso = now()
+    RETURNING {_COLUMNS}
+""")
+# Leitura que tambem renova o acesso; sessoes expiradas nao sao devolvidas
+TOUCH_SQL = text(f"""
+    UPDATE {SESSION_TABLE} SET ultimo_acesso = now()
+    WHERE tenant_id = :tenant AND session_id = :session_id
+      AND ultimo_acesso >= now() - make_interval(secs => :ttl)
+    RETURNING {_COLUMNS}
+""")
+DELETE_SQL = text(f"DELETE FROM {SESSION_TABLE} WHERE tenant_id = :tenant AND session_id = :session_id")
+# Acrescenta a troca e mantem apenas as SESSION_MAX_TURNS ultimas, numa unica instrucao
+APPEND_TURN_SQL = text(f"""
+    UPDATE {SESSION_TABLE}
+    SET turnos = (
+            SELECT COALESCE(jsonb_agg(t.turno ORDER BY t.i), '[]'::jsonb)
+            FROM jsonb_array_elements(turnos || jsonb_build_array(CAST(:turno AS jsonb))) WITH ORDINALITY AS t(turno, i)
+            WHERE t.i > jsonb_array_length(turnos) + 1 - :max_turns
+        ),
+        ultimo_acesso = now()
+    WHERE tenant_id = :tenant AND session_id = :session_id
+""")
+
+_tables_created = set()
+
+
+class ConversationSession:
+    __slots__ = ("session_id", "created_at", "last_access", "turns")
+
+    def __init__(self, session_id: str, created_at: float, last_access: float, turns: list):
+        self.session_id = session_id
+        self.created_at = created_at
+        self.last_access = last_access
+        self.turns = turns
+
+    @classmethod
+    def from_row(cls, row) -> "ConversationSession":
+        session_id, created_at, last_access, turns = row
+        if isinstance(turns, str):
+            turns = json.loads(turns)
+        return cls(session_id, float(created_at), float(last_access), list(turns or []))
+
+    def context(self) -> list:
+        """Ultimas trocas enviadas ao modelo (apenas o delta necessario)."""
+        return self.turns[-settings.SESSION_CONTEXT_TURNS:]
+
+    @property
+    def has_query(self) -> bool:
+        return any(turn.get("sql") for turn in self.turns)
+
+    def to_dict(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "created_at": self.created_at,
+            "last_access": self.last_access,
+            "expires_at": self.last_access + settings.SESSION_TTL_SECONDS,
+            "turns": list(self.turns),
+        }
+
+
+async def _execute(statement, params: dict):
+    """Executa no primary do tenant, criando a tabela na primeira vez neste worker."""
+    tenant = current_tenant()
+    engine = db_service.primary_engine(tenant)
+    if engine is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="O banco de dados das sessoes nao foi inicializado."
+        )
+    async with engine.begin() as connection:
+        if tenant.id not in _tables_created:
+            for ddl in SESSION_DDL:
+                await connection.execute(ddl)
+            _tables_created.add(tenant.id)
+        result = await connection.execute(statement, {"tenant": tenant.id, **params})
+        return result.first() if result.returns_rows else result.rowcount
+
+
+async def create_session() -> ConversationSession:
+    await _execute(PURGE_SQL, {"ttl": float(settings.SESSION_TTL_SECONDS)})
+    row = await _execute(INSERT_SQL, {"session_id": uuid.uuid4().hex})
+    return ConversationSession.from_row(row)
+
+
+async def get_session(session_id: str) -> ConversationSession | None:
+    row = await _execute(TOUCH_SQL, {"session_id": session_id, "ttl": float(settings.SESSION_TTL_SECONDS)})
+    return ConversationSession.from_row(row) if row is not None else None
+
+
+async def require_session(session_id: str) -> ConversationSession:
+    """Sessao informada pelo cliente; 404 session_expired se nao existir ou tiver expirado."""
+    session = await get_session(session_id)
+    if session is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={
+                "code": "session_expired",
+                "message": "Sessao nao encontrada ou expirada. Crie outra em POST /sessions.",
+            },
+        )
+    return session
+
+
+async def delete_session(session_id: str) -> bool:
+    return await _execute(DELETE_SQL, {"session_id": session_id}) > 0
+
+
+async def record_turn(session: ConversationSession, question: str, ai_response):
+    """
+    Guarda a troca em formato compacto (sem os dados retornados). Chamada depois
+    que o SQL executou, para que uma consulta com erro nao vire contexto.
+    """
+    turn = {
+        "question": question,
+        "sql": ai_response.sql_query,
+        "message": ai_response.message,
+        "visualization_type": ai_response.visualization_type,
+        "report_type": ai_response.report_type,
+    }
+    await _execute(APPEND_TURN_SQL, {
+        "session_id": session.session_id,
+        "turno": json.dumps(turn, ensure_ascii=False),
+        "max_turns": settings.SESSION_MAX_TURNS,
+    })
+    session.turns = (session.turns + [turn])[-settings.SESSION_MAX_TURNS:]
+    session.last_access = time.time()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Extracao de literais do SQL gerado pela IA para parametros (binds).
+
+Consultas iguais que so diferem nos valores passam a ter o mesmo texto, o que
+permite ao asyncpg reaproveitar o prepared statement em cache (e ao PostgreSQL o
+plano). A troca e conservadora: so literais logo apos um operador de comparacao
+(=, <>, !=, <, >, <=, >=) e os inteiros de LIMIT/OFFSET. Ficam no SQL: decimais,
+datas/horarios em texto, literais tipados (DATE '...', INTERVAL '...', '...'::tipo),
+argumentos de funcoes, listas IN/LIKE e qualquer SQL com dollar-quoting.
+"""
+import re
+
+COMPARISON_OPERATORS = {"=", "<>", "!=", "<", ">", "<=", ">="}
+PAGING_KEYWORDS = {"LIMIT", "OFFSET"}
+
+_TOKEN_RE = re.compile(r"""
+      (?P<comment>--[^\n]*|/\*.*?\*/)
+    | (?P<string>[eE]?'(?:[^']|'')*')
+    | (?P<ident>"(?:[^"]|"")*")
+    | (?P<number>\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)
+    | (?P<word>[A-Za-z_][\w$]*)
+    | (?P<cast>::)
+    | (?P<op><=|>=|<>|!=|=|<|>)
+    | (?P<space>\s+)
+    | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+# Texto com cara de data/hora: o PostgreSQL inferiria o bind como date/timestamp
+_DATE_LIKE_RE = re.compile(r"^\d{4}-\d{1,2}(-\d{1,2})?([ T]\d{1,2}:\d{2}.*)?$|^\d{1,2}:\d{2}")
+
+
+def tokenize(sql: str) -> list:
+    """Tokens (tipo, texto) do SQL; juntar os textos devolve o SQL original."""
+    return [(m.lastgroup, m.group()) for m in _TOKEN_RE.finditer(sql)]
+
+
+def parameterize_literals(sql: str, prefix: str = "lit") -> tuple[str, dict]:
+    """
+    Retorna (sql_com_binds, params). Se nada puder ser extraido com seguranca,
+    devolve o SQL original e um dicionario vazio.
+    """
+    if "$" in sql or ":" in sql.replace("::", ""):
+        # dollar-quoting ou binds ja existentes: nao mexe
+        return sql, {}
+
+    tokens = tokenize(sql)
+    significant = [i for i, (kind, _) in enumerate(tokens) if kind not in ("space", "comment")]
+    params = {}
+
+    for pos, i in enumerate(significant):
+        if pos == 0:
+            continue
+        kind, value = tokens[i]
+        prev_kind, prev_value = tokens[significant[pos - 1]]
+        next_kind = tokens[significant[pos + 1]][0] if pos + 1 < len(significant) else None
+        if next_kind == "cast":
+            continue
+
+        literal = None
+        if prev_kind == "op" and prev_value in COMPARISON_OPERATORS:
+            if kind == "number" and value.isdigit():
+                literal = int(value)
+            elif kind == "string" and value[0] == "'":
+                content = value[1:-1].replace("''", "'")
+                if not _DATE_LIKE_RE.match(content):
+                    literal = content
+        elif prev_kind == "word" and prev_value.upper() in PAGING_KEYWORDS and kind == "number" and value.isdigit():
+            literal = int(value)
+
+        if literal is not None:
+            name = f"{prefix}{len(params)}"
+            params[name] = literal
+            tokens[i] = (kind, f":{name}")
+
+    if not params:
+        return sql, {}
+    return "".join(value for _, value in tokens), params
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Agregacao incremental das series temporais das rotas estaticas (/bar/static).
+
+Em vez de reagrupar o ano inteiro a cada chamada, cada worker guarda em memoria
+os totais diarios do ano corrente, por tenant. Os dias anteriores a marca
+d'agua (maior datapedido ja visto, menos TIMESERIES_LOOKBACK_DAYS) ficam
+congelados; cada atualizacao consulta apenas os pedidos a partir dela e
+substitui esses dias. O custo da atualizacao e proporcional aos pedidos do
+periodo aberto (tipicamente os de hoje), nao ao ano todo. Os totais mensais
+saem da soma dos dias.
+
+A atualizacao so acontece quando a versao dos dados (app.services.data_version)
+mudou. Uma reconstrucao completa roda na virada do ano e a cada
+TIMESERIES_FULL_REFRESH_SECONDS, para absorver pedidos antigos alterados ou
+excluidos depois de congelados.
+"""
+import asyncio
+import datetime
+import time
+from collections import defaultdict
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from app.core.config import settings
+from app.core.tenancy import Tenant, current_tenant
+from app.services import db_service
+from app.services.data_version import get_data_version
+
+# Intervalo semiaberto [desde, ate): datapedido comparado direto, sem TO_CHAR, para usar o indice.
+# O texto e devolvido como "query" do /bar/static, que mostra a consulta que de fato alimenta o grafico.
+DAILY_SALES_QUERY = """
+    SELECT datapedido::date AS dia, SUM(valortotal) AS total_sales, COUNT(*) AS pedidos, MAX(datapedido) AS ultimo
+    FROM pedidosvenda
+    WHERE datapedido >= :desde AND datapedido < :ate
+    GROUP BY 1
+"""
+DAILY_SALES_SQL = text(DAILY_SALES_QUERY)
+
+TIMESERIES_STATS = {"hits": 0, "full_refreshes": 0, "incremental_refreshes": 0, "orders_scanned": 0}
+
+_STATES = {}
+
+
+def _state(tenant: Tenant) -> dict:
+    return _STATES.setdefault(tenant.id, {
+        "year": None,
+        "days": {},
+        "watermark": None,
+        "version": None,
+        "last_full": 0.0,
+        "last_refresh": None,
+        "lock": asyncio.Lock(),
+    })
+
+
+def _as_datetime(value):
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.combine(value, datetime.time())
+
+
+def _refresh_since(state: dict, year: int, now: float) -> datetime.datetime | None:
+    """Inicio do periodo a reconsultar (1o de janeiro numa reconstrucao) ou None se nada mudou."""
+    if state["year"] != year or state["watermark"] is None:
+        return datetime.datetime(year, 1, 1)
+    if now - state["last_full"] >= settings.TIMESERIES_FULL_REFRESH_SECONDS:
+        return datetime.datetime(year, 1, 1)
+    since = (state["watermark"] - datetime.timedelta(days=settings.TIMESERIES_LOOKBACK_DAYS)).date()
+    return max(datetime.datetime.combine(since, datetime.time()), datetime.datetime(year, 1, 1))
+
+
+async def _refresh(state: dict, tenant: Tenant, year: int, since: datetime.datetime, version: str | None) -> dict:
+    start = time.perf_counter()
+    full = since == datetime.datetime(year, 1, 1)
+    params = {"desde": since, "ate": datetime.datetime(year + 1, 1, 1)}
+    try:
+        async with db_service.tenant_registry(tenant).connect_reader() as connection:
+            rows = (await connection.execute(DAILY_SALES_SQL, params)).all()
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Erro ao executar a consulta SQL: {e}")
+
+    days = {} if full or state["year"] != year else {d: v for d, v in state["days"].items() if d < since.date()}
+    watermark = None if full else state["watermark"]
+    scanned = 0
+    for dia, total, pedidos, ultimo in rows:
+        days[dia] = total if total is not None else 0
+        scanned += pedidos
+        ultimo = _as_datetime(ultimo)
+        if ultimo is not None and (watermark is None or ultimo > watermark):
+            watermark = ultimo
+    # Pedidos com data futura nao podem empurrar a marca d'agua alem de agora
+    now = datetime.datetime.now()
+    if watermark is not None and watermark > now:
+        watermark = now
+
+    state.update(year=year, days=days, watermark=watermark, version=version)
+    if full:
+        state["last_full"] = time.time()
+    TIMESERIES_STATS["full_refreshes" if full else "incremental_refreshes"] += 1
+    TIMESERIES_STATS["orders_scanned"] += scanned
+    state["last_refresh"] = {
+        "mode": "full" if full else "incremental",
+        "since": since.date().isoformat(),
+        "days_requeried": len(rows),
+        "orders_scanned": scanned,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    return state["last_refresh"]
+
+
+def _monthly(days: dict) -> list:
+    months = defaultdict(int)
+    for dia, total in days.items():
+        months[dia.strftime("%Y-%m")] += total
+    return [{"month_label": label, "total_sales": months[label]} for label in sorted(months)]
+
+
+async def monthly_sales(tenant: Tenant = None) -> tuple[list, dict]:
+    """
+    Vendas por mes no ano corrente (month_label, total_sales), como a consulta
+    estatica original, e a descricao da atualizacao feita nesta chamada.
+    """
+    tenant = tenant or current_tenant()
+    state = _state(tenant)
+    version = await get_data_version()
+    async with state["lock"]:
+        year = datetime.date.today().year
+        now = time.time()
+        since = _refresh_since(state, year, now)
+        full = since == datetime.datetime(year, 1, 1)
+        if not full and version is not None and version == state["version"]:
+            TIMESERIES_STATS["hits"] += 1
+            info = {"mode": "cached"}
+        else:
+            info = await _refresh(state, tenant, year, since, version)
+        return _monthly(state["days"]), {
+            **info,
+            "watermark": state["watermark"].isoformat() if state["watermark"] else None,
+        }
+
+
+def get_timeseries_stats() -> dict:
+    return {
+        **TIMESERIES_STATS,
+        "enabled": settings.TIMESERIES_INCREMENTAL_ENABLED,
+        "tenants": {
+            tenant_id: {
+                "year": state["year"],
+                "days": len(state["days"]),
+                "watermark": state["watermark"].isoformat() if state["watermark"] else None,
+                "last_full": state["last_full"] or None,
+                "last_refresh": state["last_refresh"],
+            }
+            for tenant_id, state in _STATES.items()
+        },
+    }
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Contagem de tokens do prompt, orcamento por requisicao e contabilidade de uso.
+
+A contagem e local (~4 caracteres por token) ou, com LLM_TOKEN_COUNTER=provider,
+feita pelo provedor (ex.: count_tokens do SDK do Gemini). Como o prefixo do
+prompt (instrucoes, esquema e exemplos) se repete entre as requisicoes, a
+contagem do provedor e feita uma vez por template e guardada em cache; a razao
+entre ela e a estimativa local calibra a estimativa dos trechos variaveis
+(pergunta, exemplos e tabelas candidatos a corte).
+
+Quando o prompt passa de LLM_PROMPT_TOKEN_BUDGET, o ai_service corta por
+prioridade: primeiro os exemplos de conversa, depois os exemplos SQL mais ao
+fim da lista (mantendo LLM_PROMPT_MIN_EXAMPLES) e, por ultimo, as tabelas do
+esquema menos relacionadas com a pergunta.
+
+Cada chamada registra tokens de entrada e saida (os informados pelo provedor
+quando existem) por provedor e classe de requisicao, expostos em /ops/tokens.
+"""
+import hashlib
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from app.core.config import settings
+
+CHARS_PER_TOKEN = 4
+_TEMPLATE_CACHE_SIZE = 256
+
+_template_counts = OrderedDict()
+_template_lock = threading.Lock()
+_stats_lock = threading.Lock()
+
+TOKEN_STATS = {"requests": 0, "input_tokens": 0, "output_tokens": 0, "trimmed": 0, "rejected": 0, "by_route": {}}
+_RECENT = deque(maxlen=200)
+
+
+@dataclass
+class PromptPlan:
+    """Prompt final e como ele foi encaixado no orcamento."""
+    prompt: str
+    input_tokens: int
+    budget: int
+    examples_dropped: int = 0
+    tables_dropped: list = field(default_factory=list)
+
+    @property
+    def trimmed(self) -> bool:
+        return bool(self.examples_dropped or self.tables_dropped)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa local, sem rede."""
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def template_tokens(provider, text: str) -> int:
+    """
+    Tokens de um trecho fixo do prompt. Com LLM_TOKEN_COUNTER=provider, conta no
+    provedor uma unica vez por (provedor, texto); sem isso, ou se a contagem falhar, estima.
+    """
+    if settings.LLM_TOKEN_COUNTER != "provider":
+        return estimate_tokens(text)
+    key = (provider.key, hashlib.sha1(text.encode("utf-8")).hexdigest())
+    with _template_lock:
+        if key in _template_counts:
+            _template_counts.move_to_end(key)
+            return _template_counts[key]
+    try:
+        count = provider.count_tokens(text)
+    except Exception as e:
+        print(f"Falha ao contar tokens no provedor {provider.key}: {e}")
+        return estimate_tokens(text)
+    with _template_lock:
+        _template_counts[key] = count
+        while len(_template_counts) > _TEMPLATE_CACHE_SIZE:
+            _template_counts.popitem(last=False)
+    return count
+
+
+def calibration(provider, template: str) -> float:
+    """Tokens do provedor por token estimado, medidos no template (1.0 na contagem local)."""
+    return template_tokens(provider, template) / estimate_tokens(template)
+
+
+# --- Esquema: tabelas por relevancia para a pergunta ---
+
+def _words(text: str) -> set:
+    text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode()
+    # Radical simples: sem o plural, para "vendas" casar com "venda"/"pedidosvenda"
+    return {w[:-1] if w.endswith("s") and len(w) > 4 else w for w in re.findall(r"[a-z0-9]{3,}", text)}
+
+
+def split_schema(digest: str) -> tuple[list, list]:
+    """Separa o resumo do esquema em (linhas de dica '--', linhas de tabela)."""
+    lines = digest.splitlines()
+    return [l for l in lines if l.startswith("--")], [l for l in lines if l and not l.startswith("--")]
+
+
+def table_drop_order(tables: list, question: str) -> list:
+    """
+    Indices das tabelas na ordem de corte: menor relevancia primeiro (nome da
+    tabela citado na pergunta vale mais que colunas citadas); no empate, as do
+    fim do resumo saem antes (os rollups, preferidos, vem primeiro).
+    """
+    asked = _words(question)
+    scores = []
+    for i, line in enumerate(tables):
+        name, _, columns = line.partition("(")
+        name_words = _words(name.rsplit(".", 1)[-1].replace("_", " "))
+        name_hits = sum(1 for w in asked if any(w in n or n in w for n in name_words))
+        column_hits = len(asked & _words(columns))
+        scores.append((3 * name_hits + column_hits, -i, i))
+    return [i for _, _, i in sorted(scores)]
+
+
+def join_schema(hints: list, tables: list) -> str:
+    # A dica dos rollups so faz sentido enquanto alguma tabela rollup_ continua no esquema
+    if not any(".rollup_" in t or t.startswith("rollup_") for t in tables):
+        hints = []
+    return "\n".join(hints + tables)
+
+
+# --- Contabilidade ---
+
+def record_usage(provider_key: str, request_class: str, plan: PromptPlan | None, input_tokens: int, output_tokens: int):
+    route = f"{request_class}@{provider_key}"
+    with _stats_lock:
+        TOKEN_STATS["requests"] += 1
+        TOKEN_STATS["input_tokens"] += input_tokens
+        TOKEN_STATS["output_tokens"] += output_tokens
+        if plan is not None and plan.trimmed:
+            TOKEN_STATS["trimmed"] += 1
+        stat = TOKEN_STATS["by_route"].setdefault(
+            route, {"requests": 0, "input_tokens": 0, "output_tokens": 0, "max_input_tokens": 0}
+        )
+        stat["requests"] += 1
+        stat["input_tokens"] += input_tokens
+        stat["output_tokens"] += output_tokens
+        stat["max_input_tokens"] = max(stat["max_input_tokens"], input_tokens)
+        _RECENT.append({
+            "ts": time.time(),
+            "route": route,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "budget": plan.budget if plan is not None else None,
+            "examples_dropped": plan.examples_dropped if plan is not None else 0,
+            "tables_dropped": len(plan.tables_dropped) if plan is not None else 0,
+        })
+
+
+def record_rejected():
+    with _stats_lock:
+        TOKEN_STATS["rejected"] += 1
+
+
+def get_token_stats(recent: int = 20) -> dict:
+    with _stats_lock:
+        by_route = {
+            route: {**stat, "mean_input_tokens": round(stat["input_tokens"] / stat["requests"], 1)}
+            for route, stat in TOKEN_STATS["by_route"].items()
+        }
+        return {
+            **{k: v for k, v in TOKEN_STATS.items() if k != "by_route"},
+            "budget": settings.LLM_PROMPT_TOKEN_BUDGET,
+            "counter": settings.LLM_TOKEN_COUNTER,
+            "by_route": by_route,
+            "recent": list(_RECENT)[-recent:] if recent else [],
+        }
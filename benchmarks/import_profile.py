@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Perfil do tempo de importacao (cold start) de um modulo do app.
+
+Executa `python -X importtime -c "import <modulo>"` em um processo limpo,
+agrega a saida e lista os modulos mais caros pelo tempo acumulado.
+
+Uso:
+    python benchmarks/import_profile.py                 # perfil de app.main
+    python benchmarks/import_profile.py --module app.services.report_service
+    python benchmarks/import_profile.py --top 30 --output bench_output.txt
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def profile_imports(module: str, runs: int = 1) -> tuple[float, list[tuple[str, int, int]]]:
+    """
+    Retorna (tempo cumulativo do modulo em ms, lista de (modulo, self_us, cumulativo_us)).
+    Com varias execucoes, mantem o menor tempo observado de cada modulo.
+    """
+    best = {}
+    totals = []
+    for _ in range(runs):
+        env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=ROOT, env=env, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            raise SystemExit(f"Falha ao importar {module}:\n{proc.stderr}")
+
+        target_us = 0
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            self_us, cumulative_us, name = [p.strip() for p in line[len("import time:"):].split("|")]
+            self_us, cumulative_us = int(self_us), int(cumulative_us)
+            depth = (len(name) - len(name.lstrip())) // 2
+            name = name.strip()
+            if depth == 0 and name == module:
+                target_us = cumulative_us
+            previous = best.get(name)
+            if previous is None or cumulative_us < previous[1]:
+                best[name] = (self_us, cumulative_us)
+        totals.append(target_us / 1000)
+
+    rows = sorted(((n, s, c) for n, (s, c) in best.items()), key=lambda r: r[2], reverse=True)
+    return min(totals), rows
+
+
+def format_report(module: str, total_ms: float, rows: list, top: int) -> str:
+    lines = [
+        f"Perfil de importacao: {module}",
+        f"Tempo total de importacao de {module}: {total_ms:.1f} ms",
+        "",
+        f"{'cumulativo (ms)':>16} {'proprio (ms)':>13}  modulo",
+    ]
+    for name, self_us, cumulative_us in rows[:top]:
+        lines.append(f"{cumulative_us / 1000:>16.1f} {self_us / 1000:>13.1f}  {name}")
+
+    heavy = ("pandas", "reportlab", "openpyxl", "google.generativeai", "numpy", "pyarrow")
+    loaded = sorted({h for h in heavy for name, _, _ in rows if name == h})
+    lines.append("")
+    lines.append("Dependencias pesadas carregadas no import: " + (", ".join(loaded) if loaded else "nenhuma"))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perfil do tempo de importacao do app.")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=3, help="execucoes (usa o melhor tempo)")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--output", help="grava o relatorio tambem neste arquivo")
+    args = parser.parse_args()
+
+    total_ms, rows = profile_imports(args.module, args.runs)
+    report = format_report(args.module, total_ms, rows, args.top)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
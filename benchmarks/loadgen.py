@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Gerador de carga que reproduz um trace JSONL de requisicoes contra a API.
+
+Cada linha do trace e uma requisicao com o instante em que chegou ("ts", em
+segundos epoch ou ISO 8601). Formatos aceitos:
+
+    {"ts": 1718900000.12, "question": "quanto vendemos hoje"}          -> POST /analyze
+    {"ts": 1718900000.50, "route": "/kpi/static"}                      -> GET
+    {"ts": "2024-06-20T16:13:21", "method": "POST", "path": "/analyze/batch",
+     "body": {...}, "tenant": "sul", "headers": {...}}
+
+A reproducao e em malha aberta: cada requisicao sai no seu instante original
+(dividido por --speed), independentemente de as anteriores terem respondido,
+como acontece com usuarios reais. O atraso no envio ("lag") e medido para
+indicar quando o proprio gerador virou gargalo.
+
+O relatorio traz, por rota, contagem, erros, codigos de status, latencias
+(p50/p90/p95/p99/max) e vazao, e pode ser gravado como baseline e comparado
+com um baseline anterior (codigo de saida 1 se houver regressao).
+
+Para medir a aplicacao sem depender da IA externa, suba o servidor com o
+provedor stub e um banco local, por exemplo:
+
+    LLM_PROVIDER=stub LLM_STUB_LATENCY_MS=800 DATABASE_URL=postgresql://... \\
+        gunicorn app.main:app -c gunicorn.conf.py
+
+Uso:
+    python benchmarks/loadgen.py --synthesize 2000 --rate 20 --trace trace.jsonl
+    python benchmarks/loadgen.py --trace trace.jsonl --url http://localhost:8000
+    python benchmarks/loadgen.py --trace trace.jsonl --speed 3 --save-baseline baseline.json
+    python benchmarks/loadgen.py --trace trace.jsonl --speed 3 --baseline baseline.json --tolerance 0.15
+
+Requer httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+
+SAMPLE_QUESTIONS = [
+    # Reconhecidas pelo atalho de intencoes (sem IA)
+    "quais sao os 5 produtos mais vendidos",
+    "qual o faturamento por mes",
+    "quais sao os top 3 vendedores",
+    "quantos pedidos foram feitos hoje",
+    # Vao para a IA (stub)
+    "qual a proporcao de vendas por categoria de produto",
+    "liste todas as contas a receber com status a vencer",
+    "mostre em um grafico de barras o total faturado por cliente",
+    "qual foi o ticket medio por pedido no ultimo trimestre",
+    "quero um arquivo csv com todos os clientes cadastrados",
+    "gere um relatorio em pdf com os pedidos do ultimo mes",
+    # Conversa (classificador local)
+    "bom dia",
+    "obrigado",
+    "o que voce pode fazer",
+]
+STATIC_ROUTES = ["/kpi/static", "/bar/static", "/pie/static"]
+
+
+def _parse_ts(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.datetime.fromisoformat(str(value)).timestamp()
+
+
+def load_trace(path: str) -> list:
+    """Le o trace e normaliza cada linha para {offset, method, path, body, headers}."""
+    requests = []
+    with open(path, encoding="utf-8") as fh:
+        for number, line in enumerate(fh, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            item = json.loads(line)
+            if "ts" not in item:
+                raise SystemExit(f"Linha {number} sem 'ts': {line[:80]}")
+            headers = dict(item.get("headers") or {})
+            if item.get("tenant"):
+                headers.setdefault("X-Tenant-Id", item["tenant"])
+            if "question" in item:
+                method, path, body = "POST", "/analyze", {"user_question": item["question"]}
+                if item.get("session_id"):
+                    body["session_id"] = item["session_id"]
+            elif "route" in item:
+                method, path, body = "GET", item["route"], None
+            else:
+                method, path, body = item.get("method", "GET").upper(), item["path"], item.get("body")
+            requests.append({"ts": _parse_ts(item["ts"]), "method": method, "path": path, "body": body, "headers": headers})
+
+    if not requests:
+        raise SystemExit(f"Trace vazio: {path}")
+    requests.sort(key=lambda r: r["ts"])
+    start = requests[0]["ts"]
+    for request in requests:
+        request["offset"] = request.pop("ts") - start
+    return requests
+
+
+def synthesize_trace(path: str, count: int, rate: float, static_share: float, seed: int):
+    """Gera um trace com chegadas Poisson (taxa media 'rate' por segundo)."""
+    rng = random.Random(seed)
+    ts = time.time()
+    with open(path, "w", encoding="utf-8") as fh:
+        for _ in range(count):
+            ts += rng.expovariate(rate)
+            if rng.random() < static_share:
+                item = {"ts": round(ts, 3), "route": rng.choice(STATIC_ROUTES)}
+            else:
+                item = {"ts": round(ts, 3), "question": rng.choice(SAMPLE_QUESTIONS)}
+            fh.write(json.dumps(item, ensure_ascii=False) + "\n")
+    print(f"Trace com {count} requisicoes (~{rate}/s, {static_share:.0%} estaticas) gravado em {path}")
+
+
+async def replay(requests: list, url: str, speed: float, timeout: float, concurrency: int) -> tuple[list, float]:
+    try:
+        import httpx
+    except ImportError:
+        raise SystemExit("httpx nao instalado: pip install httpx")
+
+    limits = httpx.Limits(max_connections=concurrency or None, max_keepalive_connections=concurrency or None)
+    results = []
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        async def _send(request: dict):
+            scheduled = started + request["offset"] / speed
+            delay = scheduled - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            sent = loop.time()
+            status, size, error = None, 0, None
+            try:
+                response = await client.request(request["method"], request["path"], json=request["body"], headers=request["headers"])
+                status, size = response.status_code, len(response.content)
+            except Exception as e:
+                error = type(e).__name__
+            results.append({
+                "path": request["path"],
+                "status": status,
+                "error": error,
+                "bytes": size,
+                "latency_ms": (loop.time() - sent) * 1000,
+                "lag_ms": max(0.0, (sent - scheduled) * 1000),
+            })
+
+        await asyncio.gather(*(_send(r) for r in requests))
+        duration = loop.time() - started
+    return results, duration
+
+
+def _percentile(values: list, p: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(values) - 1)
+    return round(values[low] + (values[high] - values[low]) * (k - low), 1)
+
+
+def _summary(items: list, duration: float) -> dict:
+    latencies = [r["latency_ms"] for r in items]
+    errors = sum(1 for r in items if r["error"] or (r["status"] or 0) >= 500)
+    return {
+        "count": len(items),
+        "errors": errors,
+        "error_rate": round(errors / len(items), 4) if items else 0.0,
+        "status": dict(Counter(str(r["status"] or r["error"]) for r in items)),
+        "throughput_rps": round(len(items) / duration, 2) if duration else None,
+        "p50_ms": _percentile(latencies, 50),
+        "p90_ms": _percentile(latencies, 90),
+        "p95_ms": _percentile(latencies, 95),
+        "p99_ms": _percentile(latencies, 99),
+        "max_ms": round(max(latencies), 1) if latencies else None,
+        "mean_bytes": round(sum(r["bytes"] for r in items) / len(items)) if items else 0,
+    }
+
+
+def build_report(results: list, duration: float, requests: list, args) -> dict:
+    by_path = defaultdict(list)
+    for result in results:
+        by_path[result["path"]].append(result)
+    trace_seconds = requests[-1]["offset"] / args.speed if requests else 0.0
+    lags = [r["lag_ms"] for r in results]
+    return {
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "url": args.url,
+        "trace": args.trace,
+        "speed": args.speed,
+        "duration_s": round(duration, 2),
+        "offered_rps": round(len(requests) / trace_seconds, 2) if trace_seconds else None,
+        "send_lag_p99_ms": _percentile(lags, 99),
+        "overall": _summary(results, duration),
+        "routes": {path: _summary(items, duration) for path, items in sorted(by_path.items())},
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Regressoes em relacao ao baseline: latencias acima da tolerancia, mais erros ou menos vazao."""
+    regressions = []
+    sections = [("overall", report["overall"], baseline.get("overall") or {})]
+    sections += [(path, stats, (baseline.get("routes") or {}).get(path)) for path, stats in report["routes"].items()]
+    for name, current, previous in sections:
+        if not previous:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            before, after = previous.get(metric), current.get(metric)
+            if before and after and after > before * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {before} -> {after} (+{(after / before - 1):.0%})")
+        if current["error_rate"] > previous.get("error_rate", 0) + 0.01:
+            regressions.append(f"{name}: error_rate {previous.get('error_rate')} -> {current['error_rate']}")
+        before, after = previous.get("throughput_rps"), current.get("throughput_rps")
+        if name == "overall" and before and after and after < before * (1 - tolerance):
+            regressions.append(f"{name}: throughput_rps {before} -> {after}")
+    return regressions
+
+
+def format_report(report: dict, regressions: list | None) -> str:
+    lines = [
+        f"Replay de {report['trace']} contra {report['url']} (speed x{report['speed']})",
+        f"Duracao: {report['duration_s']} s, taxa oferecida: {report['offered_rps']} req/s, "
+        f"atraso de envio p99: {report['send_lag_p99_ms']} ms",
+        "",
+        f"{'rota':<28}{'req':>7}{'erros':>7}{'req/s':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}",
+    ]
+    for name, stats in [("(total)", report["overall"])] + list(report["routes"].items()):
+        lines.append(
+            f"{name[:27]:<28}{stats['count']:>7}{stats['errors']:>7}{stats['throughput_rps'] or 0:>8}"
+            f"{stats['p50_ms'] or 0:>9}{stats['p95_ms'] or 0:>9}{stats['p99_ms'] or 0:>9}{stats['max_ms'] or 0:>9}"
+        )
+    if report["send_lag_p99_ms"] and report["send_lag_p99_ms"] > 100:
+        lines.append("\nAviso: o gerador atrasou os envios; os numeros subestimam a carga oferecida.")
+    if regressions is not None:
+        lines.append("")
+        lines.append("Regressoes em relacao ao baseline:" if regressions else "Sem regressoes em relacao ao baseline.")
+        lines.extend(f"  - {r}" for r in regressions)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduz um trace JSONL de requisicoes contra a API.")
+    parser.add_argument("--trace", required=True, help="arquivo JSONL (lido no replay, gravado com --synthesize)")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="fator de aceleracao dos intervalos (2 = duas vezes mais rapido)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--concurrency", type=int, default=0, help="limite de conexoes simultaneas (0 = sem limite)")
+    parser.add_argument("--limit", type=int, help="reproduz apenas as primeiras N requisicoes")
+    parser.add_argument("--output", help="grava o relatorio em JSON")
+    parser.add_argument("--save-baseline", help="grava o relatorio como baseline")
+    parser.add_argument("--baseline", help="compara com um baseline gravado antes")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="piora relativa aceita nas latencias/vazao")
+    parser.add_argument("--synthesize", type=int, metavar="N", help="gera um trace sintetico com N requisicoes e sai")
+    parser.add_argument("--rate", type=float, default=10.0, help="taxa media do trace sintetico (req/s)")
+    parser.add_argument("--static-share", type=float, default=0.3, help="fracao de rotas estaticas no trace sintetico")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.synthesize:
+        synthesize_trace(args.trace, args.synthesize, args.rate, args.static_share, args.seed)
+        return
+
+    requests = load_trace(args.trace)[: args.limit]
+    results, duration = asyncio.run(replay(requests, args.url, args.speed, args.timeout, args.concurrency))
+    report = build_report(results, duration, requests, args)
+
+    regressions = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            regressions = compare(report, json.load(fh), args.tolerance)
+        report["regressions"] = regressions
+
+    print(format_report(report, regressions))
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as fh:
+                json.dump(report, fh, ensure_ascii=False, indent=2)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# Raiz do repositorio no sys.path para que os testes importem o pacote app
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Configuracao de producao do gunicorn (carregada automaticamente a partir do
+diretorio atual ou via `gunicorn -c gunicorn.conf.py app.main:app`).
+
+- Numero de workers calculado a partir das CPUs e da memoria disponiveis
+  (respeitando limites de cgroup em containers). WEB_CONCURRENCY sobrescreve.
+- preload_app: o app, o template do prompt e o resumo do esquema sao montados
+  uma vez no master e compartilhados com os workers (copy-on-write).
+- O pool do engine e descartado no master e recriado em cada worker.
+- Keep-alive, timeouts graciosos e reciclagem por max_requests configuraveis.
+"""
+import asyncio
+import os
+
+WORKER_MEMORY_MB = int(os.getenv("GUNICORN_WORKER_MEMORY_MB", "512"))
+WORKERS_PER_CPU = float(os.getenv("GUNICORN_WORKERS_PER_CPU", "1"))
+
+
+def _cpu_count() -> int:
+    """CPUs utilizaveis pelo processo, considerando affinity e quota do cgroup."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # cgroup v2: "max 100000" ou "<quota> <period>"
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def _memory_bytes() -> int:
+    """Memoria disponivel para o container (cgroup) ou para a maquina."""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value != "max" and int(value) < (1 << 60):
+                return int(value)
+        except (OSError, ValueError):
+            continue
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def compute_workers() -> int:
+    """Workers = CPUs * fator, limitado pela memoria reservada por worker."""
+    if os.getenv("WEB_CONCURRENCY"):
+        return max(1, int(os.getenv("WEB_CONCURRENCY")))
+
+    by_cpu = max(1, int(_cpu_count() * WORKERS_PER_CPU))
+    memory = _memory_bytes()
+    if memory <= 0:
+        return by_cpu
+    by_memory = max(1, memory // (WORKER_MEMORY_MB * 1024 * 1024))
+    return int(min(by_cpu, by_memory))
+
+
+# --- Servidor ---
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = compute_workers()
+preload_app = True
+
+# --- Conexoes e timeouts ---
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+# --- Reciclagem de workers (evita crescimento de memoria com relatorios grandes) ---
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+accesslog = "-"
+errorlog = "-"
+
+
+# --- Hooks ---
+
+def on_starting(server):
+    """
+    Executado no master depois do preload do app: importa as dependencias
+    pesadas, carrega o resumo do esquema e monta o prefixo do prompt de cada
+    tenant antes do fork. As conexoes abertas aqui sao fechadas no mesmo event
+    loop para nao vazarem para os workers.
+    """
+    from app.main import warm_up_imports
+    from app.core.tenancy import TENANTS
+    from app.services import db_service
+    from app.services.ai_service import get_prompt_prefix
+
+    async def _warm_up():
+        try:
+            for tenant in TENANTS.values():
+                digest = await db_service.get_schema_digest(tenant)
+                get_prompt_prefix(digest)
+        finally:
+            await db_service.dispose_all()
+
+    warm_up_imports()
+    try:
+        asyncio.run(_warm_up())
+    except Exception as e:
+        server.log.warning(f"Aquecimento antes do fork falhou: {e}")
+    server.log.info(f"Iniciando {workers} workers")
+
+
+def post_fork(server, worker):
+    """Cada worker recria seu proprio pool de conexoes."""
+    from app.services.db_service import dispose_engine_after_fork
+
+    dispose_engine_after_fork()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import pytest
+from fastapi import HTTPException
+from app.services import batch_service
+
+QUESTIONS = ["Vendas por mes", "clientes de SP", "  vendas   POR mes ", "Erro"]
+
+
+@pytest.fixture
+def analyzed(monkeypatch):
+    """Troca a analise de cada pergunta por uma falsa que registra as chamadas."""
+    calls = []
+
+    async def schema_digest():
+        return "unit.pedidosvenda(pedidoid)"
+
+    async def analyze(key, question, db_schema, llm_limit, sql_limit):
+        calls.append(key)
+        await asyncio.sleep(0.01 if key.startswith("vendas") else 0)
+        if key == "erro":
+            return key, {"status": "error", "error": "falhou"}
+        return key, {"status": "ok", "data": [{"pergunta": key}]}
+
+    monkeypatch.setattr(batch_service, "get_schema_digest", schema_digest)
+    monkeypatch.setattr(batch_service, "_analyze_question", analyze)
+    return calls
+
+
+def test_plan_deduplicates_normalized_questions():
+    unique, indexes = batch_service._plan(QUESTIONS)
+    assert unique == [("vendas por mes", "Vendas por mes"), ("clientes de sp", "clientes de SP"), ("erro", "Erro")]
+    assert indexes["vendas por mes"] == [0, 2]
+
+
+def test_run_batch_keeps_original_order_and_runs_duplicates_once(analyzed):
+    batch = asyncio.run(batch_service.run_batch(QUESTIONS))
+    assert sorted(analyzed) == ["clientes de sp", "erro", "vendas por mes"]
+    assert batch["count"] == 4
+    assert batch["unique"] == 3
+    assert [r["index"] for r in batch["results"]] == [0, 1, 2, 3]
+    assert batch["results"][2]["question"] == "  vendas   POR mes "
+    assert batch["results"][2]["data"] == batch["results"][0]["data"]
+    # O erro de um item nao derruba os demais
+    assert batch["results"][3]["status"] == "error"
+    assert batch["results"][1]["status"] == "ok"
+
+
+def test_ndjson_yields_items_as_they_finish(analyzed):
+    async def collect():
+        return [json.loads(line) async for line in batch_service.iter_batch_ndjson(QUESTIONS)]
+
+    lines = asyncio.run(collect())
+    assert sorted(line["index"] for line in lines) == [0, 1, 2, 3]
+    # As perguntas rapidas saem antes da lenta (e da sua repeticao)
+    assert {line["index"] for line in lines[-2:]} == {0, 2}
+
+
+def test_analysis_errors_become_error_items(monkeypatch):
+    def failing_ai(question, db_schema):
+        raise HTTPException(status_code=503, detail="IA indisponivel")
+
+    monkeypatch.setattr(batch_service, "match_intent", lambda question: None)
+    monkeypatch.setattr(batch_service, "classify_chat", lambda question: None)
+    monkeypatch.setattr(batch_service, "generate_ai_response", failing_ai)
+
+    async def analyze():
+        return await batch_service._analyze_question(
+            "pergunta", "Pergunta", "", asyncio.Semaphore(1), asyncio.Semaphore(1)
+        )
+
+    key, item = asyncio.run(analyze())
+    assert key == "pergunta"
+    assert item["status"] == "error"
+    assert item["error"] == "IA indisponivel"
+    assert "elapsed_ms" in item
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import datetime
+import decimal
+import numpy as np
+from app.core.config import settings
+from app.services.chart_service import downsample_chart, lttb_indices
+from app.services.result_set import ResultSet
+
+
+def test_lttb_keeps_threshold_points_with_endpoints():
+    x = np.arange(10_000, dtype=np.float64)
+    y = np.sin(x / 50)
+    chosen = lttb_indices(x, y, 500)
+    assert len(chosen) == 500
+    assert chosen[0] == 0 and chosen[-1] == 9_999
+    assert np.all(np.diff(chosen) > 0)
+
+
+def test_lttb_returns_everything_below_threshold():
+    x = np.arange(10, dtype=np.float64)
+    assert lttb_indices(x, x, 500).tolist() == list(range(10))
+
+
+def test_line_downsampled_to_max_points():
+    rows = settings.CHART_MAX_POINTS * 4
+    result = ResultSet.from_columns(["dia", "total"], [list(range(rows)), [float(i % 97) for i in range(rows)]])
+    data, info = downsample_chart(result, "line", x_axis="dia", y_axis="total")
+    assert info["method"] == "lttb"
+    assert len(data) == settings.CHART_MAX_POINTS
+
+
+def test_bar_with_date_axis_is_bucketed():
+    start = datetime.date(2024, 1, 1)
+    rows = settings.CHART_MAX_POINTS * 3
+    days = [start + datetime.timedelta(days=i) for i in range(rows)]
+    result = ResultSet.from_columns(["dia", "total"], [days, [1] * rows])
+    data, info = downsample_chart(result, "bar", x_axis="dia", y_axis="total")
+    assert info["method"] == "buckets"
+    assert len(data) == settings.CHART_MAX_POINTS
+    assert sum(data.arrays[1].tolist()) == rows
+
+
+def test_bar_with_integer_id_axis_uses_top_n():
+    rows = settings.CHART_MAX_POINTS * 2
+    result = ResultSet.from_columns(["clienteid", "total"], [list(range(1, rows + 1)), list(range(rows))])
+    data, info = downsample_chart(result, "bar", x_axis="clienteid", y_axis="total")
+    assert info["method"] == "top_n"
+    assert len(data) == settings.CHART_MAX_CATEGORIES
+    labels = list(data.arrays[0])
+    assert labels[-1] == settings.CHART_OTHERS_LABEL
+    assert rows in labels
+    assert sum(data.arrays[1]) == sum(range(rows))
+
+
+def test_pie_top_n_keeps_decimal_totals_exact():
+    rows = settings.CHART_PIE_MAX_SLICES + 5
+    values = [decimal.Decimal("0.10")] * rows
+    result = ResultSet.from_columns(["categoria", "valor"], [[f"c{i}" for i in range(rows)], values])
+    data, info = downsample_chart(result, "pie", label="categoria", value="valor")
+    assert info["method"] == "top_n"
+    assert len(data) == settings.CHART_PIE_MAX_SLICES
+    assert sum(data.arrays[1]) == decimal.Decimal("0.10") * rows
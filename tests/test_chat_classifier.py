@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+import pytest
+from app.services.chat_classifier import CLASSIFIER, classify_chat, has_data_vocabulary
+
+
+@pytest.mark.parametrize("question", [
+    "qual a previsao de vendas para amanha",
+    "qual a cotacao do dolar nas vendas",
+    "envie por email o ultimo relatorio de vendas",
+    "quantos clientes compraram hoje",
+    "faturamento previsto para o proximo mes",
+])
+def test_data_vocabulary_vetoes_canned_reply(question):
+    assert classify_chat(question) is None
+
+
+def test_veto_does_not_depend_on_training_examples():
+    # "vendas" aparece em exemplos de acao_externa, entao nao e exclusiva da classe dados
+    assert "vendas" not in CLASSIFIER.data_only_words
+    assert has_data_vocabulary(["previsao", "de", "vendas"])
+
+
+@pytest.mark.parametrize("question,label", [
+    ("oi tudo bem", "saudacao"),
+    ("obrigado pela ajuda", "agradecimento"),
+    ("qual a previsao do tempo para amanha", "fora_de_escopo"),
+    ("mande por email", "acao_externa"),
+])
+def test_small_talk_still_answered(question, label):
+    assert CLASSIFIER.predict(question)[0] == label
+    assert classify_chat(question) is not None
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pytest.importorskip("brotli_asgi")
+
+from fastapi import FastAPI
+from fastapi.responses import Response, StreamingResponse
+from fastapi.testclient import TestClient
+from app.core.compression import ExcludingBrotliMiddleware
+from app.main import COMPRESSION_EXCLUDED_CONTENT_TYPES
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(
+        ExcludingBrotliMiddleware, minimum_size=10, gzip_level=6,
+        exclude_content_types=COMPRESSION_EXCLUDED_CONTENT_TYPES,
+    )
+
+    @app.get("/json")
+    def json_response():
+        return {"valor": "a" * 2000}
+
+    @app.get("/pdf")
+    def pdf_response():
+        return Response(b"%PDF" + b"a" * 2000, media_type="application/pdf")
+
+    @app.get("/ndjson")
+    def ndjson_response():
+        return StreamingResponse(iter([b'{"a": 1}\n' * 300] * 2), media_type="application/x-ndjson")
+
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("encoding", ["br", "gzip"])
+def test_json_is_compressed(client, encoding):
+    response = client.get("/json", headers={"Accept-Encoding": encoding})
+    assert response.headers["content-encoding"] == encoding
+    assert response.json() == {"valor": "a" * 2000}
+
+
+@pytest.mark.parametrize("encoding", ["br", "gzip"])
+@pytest.mark.parametrize("path", ["/pdf", "/ndjson"])
+def test_excluded_content_types_pass_through(client, encoding, path):
+    response = client.get(path, headers={"Accept-Encoding": encoding})
+    assert "content-encoding" not in response.headers
+    assert len(response.content) > 2000
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import datetime
+import pytest
+from app.services.intent_service import (
+    MONTHLY_REVENUE_SQL, ORDER_STATUS_ALL_SQL, TOP_SELLERS_SQL, display_sql, match_intent,
+)
+
+TODAY = datetime.date(2025, 3, 15)
+
+
+def test_top_sellers_with_month_and_count():
+    match = match_intent("top 10 vendedores de janeiro de 2024", today=TODAY)
+    assert match.intent == "top_vendedores"
+    assert match.statement is TOP_SELLERS_SQL
+    assert match.params == {
+        "inicio": datetime.datetime(2024, 1, 1),
+        "fim": datetime.datetime(2024, 2, 1),
+        "n": 10,
+    }
+    assert match.ai_response.visualization_type == "bar"
+
+
+def test_relative_period_and_format():
+    match = match_intent("melhores vendedores do mes passado em pdf", today=TODAY)
+    assert match.params["inicio"] == datetime.datetime(2025, 2, 1)
+    assert match.params["fim"] == datetime.datetime(2025, 3, 1)
+    assert match.params["n"] == 5
+    assert (match.ai_response.visualization_type, match.ai_response.report_type) == ("report", "pdf")
+
+
+def test_december_range_crosses_year():
+    match = match_intent("top vendedores dezembro 2024", today=TODAY)
+    assert match.params["fim"] == datetime.datetime(2025, 1, 1)
+
+
+def test_monthly_revenue_defaults_to_current_year():
+    match = match_intent("faturamento mensal", today=TODAY)
+    assert match.statement is MONTHLY_REVENUE_SQL
+    assert match.params == {"inicio": datetime.datetime(2025, 1, 1), "fim": datetime.datetime(2026, 1, 1)}
+    assert match.ai_response.visualization_type == "line"
+
+
+def test_order_status_without_period_has_no_params():
+    match = match_intent("status dos pedidos", today=TODAY)
+    assert match.statement is ORDER_STATUS_ALL_SQL
+    assert match.params == {}
+
+
+@pytest.mark.parametrize("question", [
+    "top vendedores por regiao",
+    "faturamento mensal de julho",
+    "quantos clientes compraram hoje",
+])
+def test_unknown_words_fall_back_to_ai(question):
+    assert match_intent(question, today=TODAY) is None
+
+
+@pytest.mark.parametrize("question", [
+    "top 5 vendedores de janeiro a março de 2024",
+    "top 5 vendedores de 2023 e 2024",
+    "top vendedores de 01/2024 e 02/2024",
+    "status dos pedidos de janeiro e deste mes",
+    "faturamento mensal de 2024 e do ano passado",
+])
+def test_more_than_one_period_falls_back_to_ai(question):
+    assert match_intent(question, today=TODAY) is None
+
+
+def test_display_sql_inlines_literals():
+    params = {"inicio": datetime.datetime(2024, 1, 1), "fim": datetime.datetime(2024, 2, 1), "n": 10}
+    sql = display_sql(TOP_SELLERS_SQL, params)
+    assert "pv.datapedido >= '2024-01-01' AND pv.datapedido < '2024-02-01'" in sql
+    assert sql.endswith("LIMIT 10")
+    assert ":" not in sql
+    assert "\n" not in sql
+
+
+def test_display_sql_matches_whole_bind_names():
+    assert display_sql("WHERE a = :n AND b = :nome", {"n": 3, "nome": 7}) == "WHERE a = 3 AND b = 7"
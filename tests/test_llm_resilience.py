@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import pytest
+from app.core.config import settings
+from app.services import llm_resilience
+from app.services.llm_resilience import CircuitBreaker, LatencyWindow, LLMUnavailable, call_with_resilience
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(llm_resilience, "LLM_STATS", dict.fromkeys(llm_resilience.LLM_STATS, 0))
+    monkeypatch.setattr(llm_resilience, "_breakers", {})
+    monkeypatch.setattr(llm_resilience, "_latencies", {})
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_MS", 1.0)
+    monkeypatch.setattr(settings, "LLM_RETRY_MAX_MS", 3.0)
+    monkeypatch.setattr(settings, "LLM_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", False)
+
+
+def _wait_orphans_done():
+    deadline = time.monotonic() + 5
+    while llm_resilience._orphans_running and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert llm_resilience._orphans_running == 0
+
+
+def _flaky(failures: int, error=TimeoutError):
+    calls = []
+
+    def call(timeout):
+        calls.append(timeout)
+        if len(calls) <= failures:
+            raise error("falha")
+        return "ok"
+
+    return call, calls
+
+
+def test_breaker_opens_after_threshold_and_closes_after_successful_probe():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.retry_after() >= 1
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()  # uma unica chamada de teste por vez
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_release_probe_keeps_state_and_failures():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.state == "half_open"
+    assert breaker.failures == 1
+    assert breaker.allow()
+
+
+def test_transient_errors_are_retried_with_jittered_backoff(monkeypatch):
+    bounds = []
+    monkeypatch.setattr(llm_resilience.random, "uniform", lambda low, high: bounds.append((low, high)) or 0.0)
+    call, calls = _flaky(failures=2)
+    assert call_with_resilience(call, key="retry") == "ok"
+    assert len(calls) == 3
+    assert llm_resilience.LLM_STATS["retries"] == 2
+    # Full jitter: sorteio entre 0 e min(LLM_RETRY_MAX_MS, base * 2^tentativa)
+    assert bounds == [(0, 2.0), (0, 3.0)]
+    assert llm_resilience._breakers["retry"].state == "closed"
+
+
+def test_exhausted_retries_open_the_breaker_and_short_circuit(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BREAKER_FAILURES", 1)
+    call, calls = _flaky(failures=10, error=ConnectionError)
+    with pytest.raises(LLMUnavailable):
+        call_with_resilience(call, key="down")
+    assert len(calls) == settings.LLM_MAX_ATTEMPTS
+    assert llm_resilience._breakers["down"].state == "open"
+
+    with pytest.raises(LLMUnavailable) as excinfo:
+        call_with_resilience(call, key="down")
+    assert len(calls) == settings.LLM_MAX_ATTEMPTS
+    assert llm_resilience.LLM_STATS["short_circuited"] == 1
+    assert excinfo.value.retry_after >= 1
+
+
+def test_non_retryable_errors_surface_without_touching_the_breaker():
+    call, calls = _flaky(failures=1, error=ValueError)
+    with pytest.raises(ValueError):
+        call_with_resilience(call, key="bad-request")
+    assert len(calls) == 1
+    breaker = llm_resilience._breakers["bad-request"]
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+def test_timed_out_attempt_is_abandoned_as_orphan():
+    release = threading.Event()
+
+    def call(timeout):
+        release.wait(5)
+        return "tarde"
+
+    with pytest.raises(TimeoutError):
+        llm_resilience._attempt(call, 0.05, LatencyWindow())
+    assert llm_resilience.LLM_STATS["timeouts"] == 1
+    assert llm_resilience.LLM_STATS["orphaned"] == 1
+    assert llm_resilience._orphans_running == 1
+    release.set()
+    _wait_orphans_done()
+
+
+def test_orphan_limit_fails_fast(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_ORPHANS", 0)
+    with pytest.raises(TimeoutError):
+        llm_resilience._attempt(lambda timeout: "ok", 1.0, LatencyWindow())
+    assert llm_resilience.LLM_STATS["orphan_limit_hits"] == 1
+    assert llm_resilience.LLM_STATS["attempts"] == 0
+
+
+def test_slow_first_attempt_is_hedged(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_SAMPLES", 1)
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_MS", 10.0)
+    latency = LatencyWindow()
+    latency.add(0.01)
+    release = threading.Event()
+    calls = []
+    lock = threading.Lock()
+
+    def call(timeout):
+        with lock:
+            calls.append(timeout)
+            first = len(calls) == 1
+        if first:
+            release.wait(5)
+            return "primeira"
+        return "hedge"
+
+    assert llm_resilience._attempt(call, 2.0, latency) == "hedge"
+    assert llm_resilience.LLM_STATS["hedges"] == 1
+    assert llm_resilience.LLM_STATS["hedge_wins"] == 1
+    assert llm_resilience.LLM_STATS["orphaned"] == 1
+    release.set()
+    _wait_orphans_done()
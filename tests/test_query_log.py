@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import subprocess
+import sys
+import pytest
+from app.core.config import settings
+from app.services import query_log
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def log_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "QUERY_LOG_ENABLED", True)
+    monkeypatch.setattr(query_log, "_slot", None)
+    monkeypatch.setattr(query_log, "_slot_fd", None)
+    monkeypatch.setattr(query_log, "QUERY_STATS", {})
+    monkeypatch.setattr(query_log, "LOG_STATS", {"recorded": 0, "written": 0, "explained": 0, "dropped": 0})
+    yield tmp_path
+    if query_log._slot_fd is not None:
+        os.close(query_log._slot_fd)
+
+
+def _slot_in_child(directory) -> str:
+    code = "from app.services import query_log; print(query_log.worker_slot())"
+    env = dict(os.environ, QUERY_LOG_DIR=str(directory))
+    return subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout.split()[-1]
+
+
+@pytest.mark.skipif(query_log.fcntl is None, reason="flock indisponivel")
+def test_slots_are_reused_after_a_worker_exits(log_dir):
+    assert query_log.worker_slot() == "0"
+    # Cada filho ocupa o slot 1 e o libera ao sair: o seguinte reaproveita o mesmo numero
+    assert _slot_in_child(log_dir) == "1"
+    assert _slot_in_child(log_dir) == "1"
+
+
+def test_report_sums_every_worker_of_the_host(log_dir):
+    query_log.record_query("SELECT * FROM clientes WHERE clienteid = 1", None, 30.0, 1)
+    other = {
+        "saved_at": 0,
+        "log": {"recorded": 2, "written": 1, "explained": 0, "dropped": 0},
+        "stats": {},
+    }
+    for key, stat in query_log.QUERY_STATS.items():
+        other["stats"][key] = {**stat, "count": 2, "total_ms": 900.0, "max_ms": 800.0, "last_seen": 0}
+    (log_dir / "query_stats-99.json").write_text(json.dumps(other), encoding="utf-8")
+
+    report = query_log.slow_query_report()
+    assert report["workers"] == 2
+    assert report["log"]["recorded"] == 3
+    [query] = report["queries"]
+    assert (query["count"], query["total_ms"], query["max_ms"]) == (3, 930.0, 800.0)
+    assert query["last_sql"] == "SELECT * FROM clientes WHERE clienteid = 1"
+
+
+def test_stats_survive_worker_recycling(log_dir):
+    query_log.record_query("SELECT 1", None, 12.0, 1)
+    query_log.save_stats()
+    query_log.QUERY_STATS.clear()
+    query_log.LOG_STATS["recorded"] = 0
+    query_log.load_stats()
+    assert [s["count"] for s in query_log.QUERY_STATS.values()] == [1]
+    assert query_log.LOG_STATS["recorded"] == 1
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import datetime
+import decimal
+import io
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from fastapi import HTTPException
+from app.services import report_service
+from app.services.db_service import QueryColumns
+from app.services.report_service import write_columnar_export
+
+
+async def _partitions(batches):
+    for columns, rows in batches:
+        yield columns, rows
+
+
+def _export(batches, report_type="parquet") -> pa.Table:
+    fh = io.BytesIO()
+    asyncio.run(write_columnar_export(_partitions(batches), report_type, fh))
+    fh.seek(0)
+    if report_type == "parquet":
+        return pq.read_table(fh)
+    return pa.ipc.open_file(fh).read_all()
+
+
+@pytest.mark.parametrize("report_type", ["parquet", "arrow"])
+def test_types_come_from_cursor_oids(report_type):
+    columns = QueryColumns(["clienteid", "nome", "criado"], [23, 1043, 1114])
+    batches = [
+        (columns, [(None, None, None)]),
+        (columns, [(7, "Ana", datetime.datetime(2024, 5, 1, 10, 30))]),
+    ]
+    table = _export(batches, report_type)
+    assert table.schema.types == [pa.int32(), pa.string(), pa.timestamp("us")]
+    assert table.column("clienteid").to_pylist() == [None, 7]
+
+
+def test_numeric_never_rounded():
+    columns = QueryColumns(["valor"], [1700])
+    batches = [(columns, [(decimal.Decimal("1.23"),)]), (columns, [(decimal.Decimal("1.234"),)])]
+    with pytest.raises(HTTPException) as error:
+        _export(batches)
+    assert error.value.status_code == 422
+
+
+def test_numeric_keeps_exact_values():
+    columns = QueryColumns(["valor"], [1700])
+    big = decimal.Decimal("9007199254740993.25")
+    table = _export([(columns, [(decimal.Decimal("15.00"),)]), (columns, [(big,)])])
+    assert table.schema.types == [pa.decimal128(38, 2)]
+    assert table.column("valor").to_pylist() == [decimal.Decimal("15.00"), big]
+
+
+def test_null_prefix_without_oids_waits_for_values():
+    columns = ["a"]
+    table = _export([(columns, [(None,)] * 3), (columns, [(5,)])], "arrow")
+    assert table.schema.types == [pa.int64()]
+    assert table.column("a").to_pylist() == [None, None, None, 5]
+
+
+def test_all_null_column_without_oids_is_string():
+    table = _export([(["a"], [(None,)])])
+    assert table.schema.types == [pa.string()]
+
+
+def test_empty_result_writes_schema_only():
+    table = _export([(QueryColumns(["a"], [20]), [])])
+    assert table.num_rows == 0
+    assert table.schema.types == [pa.int64()]
+
+
+def test_writer_closed_when_a_batch_fails(monkeypatch):
+    closed = []
+    real_open = report_service._open_columnar_writer
+
+    def tracking_open(*args):
+        writer = real_open(*args)
+        close = writer.close
+        writer.close = lambda: (closed.append(True), close())
+        return writer
+
+    monkeypatch.setattr(report_service, "_open_columnar_writer", tracking_open)
+    columns = QueryColumns(["valor"], [1700])
+    with pytest.raises(HTTPException):
+        _export([(columns, [(decimal.Decimal("1.2"),)]), (columns, [(decimal.Decimal("1.25"),)])])
+    assert closed == [True]
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import dataclasses
+import pytest
+from fastapi import HTTPException
+from app.core.tenancy import current_tenant, reset_tenant, set_tenant
+from app.services import result_mode
+from app.services.result_mode import _b64, _unb64, limited_sql, read_cursor, sign_cursor
+
+SQL = "SELECT nome, estado FROM clientes WHERE estado = 'SP'"
+
+
+def test_cursor_round_trip():
+    payload = read_cursor(sign_cursor(SQL, 500, 12_000, "Clientes de SP"))
+    assert payload["sql"] == SQL
+    assert (payload["offset"], payload["rows"], payload["title"]) == (500, 12_000, "Clientes de SP")
+    assert payload["tenant"] == current_tenant().id
+
+
+def test_tampered_cursor_is_rejected():
+    body, _, signature = sign_cursor(SQL, 0, None).partition(".")
+    forged = _unb64(body).replace(b"'SP'", b"'RJ'")
+    with pytest.raises(HTTPException) as error:
+        read_cursor(_b64(forged) + "." + signature)
+    assert error.value.status_code == 401
+
+
+@pytest.mark.parametrize("cursor", ["", "abc", "abc.def", "."])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        read_cursor(cursor)
+    assert error.value.status_code == 401
+
+
+def test_expired_cursor(monkeypatch):
+    cursor = sign_cursor(SQL, 0, None)
+    monkeypatch.setattr(result_mode.time, "time", lambda: 2 ** 40)
+    with pytest.raises(HTTPException) as error:
+        read_cursor(cursor)
+    assert error.value.status_code == 410
+
+
+def test_cursor_from_another_tenant():
+    cursor = sign_cursor(SQL, 0, None)
+    token = set_tenant(dataclasses.replace(current_tenant(), id="outro"))
+    try:
+        with pytest.raises(HTTPException) as error:
+            read_cursor(cursor)
+    finally:
+        reset_tenant(token)
+    assert error.value.status_code == 403
+
+
+def test_limited_sql_without_order_by_sorts_whole_rows():
+    sql = limited_sql(SQL + ";  -- comentario", 100, 200)
+    assert sql == f"SELECT * FROM (\n{SQL}\n) AS _pagina ORDER BY _pagina::text LIMIT 100 OFFSET 200"
+
+
+def test_limited_sql_keeps_outer_order_by():
+    sql = limited_sql("SELECT nome FROM clientes ORDER BY nome; /* fim */ -- comentario\n", 100, 200)
+    assert sql == "SELECT nome FROM clientes ORDER BY nome\nLIMIT 100 OFFSET 200"
+
+
+def test_limited_sql_combines_own_limit_and_offset():
+    sql = limited_sql("SELECT nome FROM clientes ORDER BY nome LIMIT 50 OFFSET 10", 100, 20)
+    assert sql == "SELECT nome FROM clientes ORDER BY nome\nLIMIT GREATEST(LEAST((50) - 20, 100), 0) OFFSET (10) + 20"
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM (SELECT nome FROM clientes ORDER BY nome) t",
+    "SELECT string_agg(nome, ',' ORDER BY nome) FROM clientes",
+    "SELECT nome FROM clientes ORDER BY nome FETCH FIRST 10 ROWS ONLY",
+])
+def test_limited_sql_ignores_inner_order_by(sql):
+    assert limited_sql(sql, 10).endswith(") AS _pagina ORDER BY _pagina::text LIMIT 10 OFFSET 0")
+
+
+def test_comment_markers_inside_strings_are_kept():
+    sql = limited_sql("SELECT nome FROM clientes WHERE nome <> 'a; -- b' ORDER BY nome", 10)
+    assert sql.startswith("SELECT nome FROM clientes WHERE nome <> 'a; -- b' ORDER BY nome\n")
+
+
+def test_limited_sql_refuses_write_statements():
+    with pytest.raises(HTTPException) as error:
+        limited_sql("DELETE FROM clientes", 10)
+    assert error.value.status_code == 500
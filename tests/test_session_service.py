@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+from app.core.config import settings
+from app.services import db_service, session_service
+from app.services.session_service import ConversationSession
+
+
+class FakeEngine:
+    """Registra as instrucoes executadas; devolve uma linha de sessao para as que retornam linhas."""
+
+    def __init__(self, row=None):
+        self.row = row
+        self.statements = []
+
+    @asynccontextmanager
+    async def begin(self):
+        yield self
+
+    async def execute(self, statement, params=None):
+        self.statements.append((statement, params))
+        returns_rows = "RETURNING" in str(statement)
+        return SimpleNamespace(
+            returns_rows=returns_rows, first=lambda: self.row, rowcount=1,
+        )
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    fake = FakeEngine(row=("abc", 100.0, 110.0, "[]"))
+    monkeypatch.setattr(db_service, "primary_engine", lambda tenant=None: fake)
+    monkeypatch.setattr(session_service, "_tables_created", set())
+    return fake
+
+
+def _turn(i):
+    return {"question": f"pergunta {i}", "sql": f"SELECT {i}", "message": "ok"}
+
+
+def test_from_row_decodes_turns_and_limits_context(monkeypatch):
+    monkeypatch.setattr(settings, "SESSION_CONTEXT_TURNS", 2)
+    session = ConversationSession.from_row(("abc", 100, 110, json.dumps([_turn(1), _turn(2), _turn(3)])))
+    assert [t["question"] for t in session.context()] == ["pergunta 2", "pergunta 3"]
+    assert session.has_query
+    assert session.to_dict()["expires_at"] == 110 + settings.SESSION_TTL_SECONDS
+
+
+def test_ddl_runs_once_per_tenant_and_purge_precedes_insert(engine):
+    async def scenario():
+        await session_service.create_session()
+        await session_service.create_session()
+
+    asyncio.run(scenario())
+    executed = [statement for statement, _ in engine.statements]
+    ddl_count = len(session_service.SESSION_DDL)
+    assert executed[:ddl_count] == session_service.SESSION_DDL
+    assert executed[ddl_count:] == [session_service.PURGE_SQL, session_service.INSERT_SQL] * 2
+    insert_params = [params for statement, params in engine.statements if statement is session_service.INSERT_SQL]
+    assert insert_params[0]["session_id"] != insert_params[1]["session_id"]
+
+
+def test_unknown_session_is_reported_as_expired(engine):
+    engine.row = None
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(session_service.require_session("sumiu"))
+    assert excinfo.value.status_code == 404
+    assert excinfo.value.detail["code"] == "session_expired"
+
+
+def test_record_turn_keeps_only_the_last_turns(engine, monkeypatch):
+    monkeypatch.setattr(settings, "SESSION_MAX_TURNS", 2)
+    session = ConversationSession("abc", 100.0, 110.0, [_turn(1), _turn(2)])
+    ai_response = SimpleNamespace(sql_query="SELECT 3", message="ok", visualization_type="table", report_type=None)
+    asyncio.run(session_service.record_turn(session, "pergunta 3", ai_response))
+
+    statement, params = engine.statements[-1]
+    assert statement is session_service.APPEND_TURN_SQL
+    assert params["max_turns"] == 2
+    assert json.loads(params["turno"])["sql"] == "SELECT 3"
+    assert [t["question"] for t in session.turns] == ["pergunta 2", "pergunta 3"]
+
+
+@pytest.mark.parametrize("sql", [
+    f"SELECT * FROM {settings.SESSION_SCHEMA}.conversa_sessoes",
+    "SELECT turnos FROM conversa_sessoes",
+])
+def test_generated_sql_cannot_read_the_sessions_table(sql):
+    with pytest.raises(ValueError):
+        db_service.check_read_only(sql)
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import pytest
+from app.services.sql_params import parameterize_literals
+
+
+def test_comparison_literals_become_binds():
+    sql, params = parameterize_literals("SELECT * FROM clientes WHERE estado = 'SP' AND clienteid > 10")
+    assert sql == "SELECT * FROM clientes WHERE estado = :lit0 AND clienteid > :lit1"
+    assert params == {"lit0": "SP", "lit1": 10}
+
+
+def test_same_shape_queries_share_text():
+    first, _ = parameterize_literals("SELECT nome FROM produtos WHERE produtoid = 1 LIMIT 5")
+    second, params = parameterize_literals("SELECT nome FROM produtos WHERE produtoid = 2 LIMIT 50")
+    assert first == second
+    assert params == {"lit0": 2, "lit1": 50}
+
+
+def test_escaped_quotes_are_unescaped_in_params():
+    _, params = parameterize_literals("SELECT 1 FROM clientes WHERE nome = 'D''Avila'")
+    assert params == {"lit0": "D'Avila"}
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM pedidosvenda WHERE datapedido >= '2024-01-01'",
+    "SELECT * FROM pedidosvenda WHERE valortotal > 10.5",
+    "SELECT * FROM pedidosvenda WHERE datapedido >= '2024-01-01'::date",
+    "SELECT * FROM pedidosvenda WHERE statuspedido IN ('Pago', 'Enviado')",
+    "SELECT * FROM clientes WHERE nome LIKE 'A%'",
+    "SELECT * FROM clientes -- estado = 'SP'",
+])
+def test_literals_kept_in_sql(sql):
+    assert parameterize_literals(sql) == (sql, {})
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT $$texto$$ FROM clientes WHERE clienteid = 1",
+    "SELECT * FROM clientes WHERE clienteid = :id AND estado = 'SP'",
+    "SELECT * FROM pedidosvenda WHERE datapedido > '10:30' AND pedidoid = 3",
+])
+def test_dollar_quoting_and_existing_binds_are_left_alone(sql):
+    assert parameterize_literals(sql) == (sql, {})
+
+
+def test_casts_do_not_block_parameterization():
+    sql, params = parameterize_literals("SELECT valortotal::int FROM pedidosvenda WHERE pedidoid = 7")
+    assert sql == "SELECT valortotal::int FROM pedidosvenda WHERE pedidoid = :lit0"
+    assert params == {"lit0": 7}
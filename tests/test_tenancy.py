@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+import pytest
+from app.core import tenancy
+from app.core.tenancy import Tenant, TenantError, resolve_tenant
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MATRIZ = Tenant("matriz", "unit", None, 5, 2, 5)
+FILIAL = Tenant("filial_sul", "unit_sul", None, 5, 2, 5)
+
+
+@pytest.fixture
+def tenants(monkeypatch):
+    monkeypatch.setattr(tenancy, "TENANTS", {"matriz": MATRIZ, "filial_sul": FILIAL})
+    monkeypatch.setattr(tenancy, "TENANT_TOKENS", {"tok-matriz": "matriz", "tok-orfao": "removido"})
+    monkeypatch.setattr(tenancy, "REQUIRE_TOKEN", True)
+
+
+def test_token_resolves_its_tenant(tenants):
+    assert resolve_tenant("", "tok-matriz") is MATRIZ
+    assert resolve_tenant("matriz", "tok-matriz") is MATRIZ
+
+
+def test_nothing_informed_resolves_to_none(tenants):
+    assert resolve_tenant("", "") is None
+
+
+@pytest.mark.parametrize("tenant_id, token, status_code", [
+    ("", "tok-invalido", 401),
+    ("", "tok-orfao", 401),  # token apontando para tenant que nao existe mais
+    ("filial_sul", "tok-matriz", 403),
+    ("filial_sul", "", 401),  # id sozinho com token obrigatorio
+])
+def test_rejected_combinations(tenants, tenant_id, token, status_code):
+    with pytest.raises(TenantError) as excinfo:
+        resolve_tenant(tenant_id, token)
+    assert excinfo.value.status_code == status_code
+
+
+def test_id_alone_accepted_when_token_not_required(tenants, monkeypatch):
+    monkeypatch.setattr(tenancy, "REQUIRE_TOKEN", False)
+    assert resolve_tenant("filial_sul", "") is FILIAL
+    with pytest.raises(TenantError) as excinfo:
+        resolve_tenant("desconhecido", "")
+    assert excinfo.value.status_code == 404
+
+
+def test_load_tenants_rejects_invalid_schema(monkeypatch):
+    monkeypatch.setattr(tenancy.settings, "TENANTS", "matriz=unit;drop")
+    with pytest.raises(ValueError):
+        tenancy.load_tenants()
+
+
+@pytest.mark.parametrize("tenants_env, require_env, expected", [
+    ("matriz=unit", None, "False"),
+    ("matriz=unit,filial_sul=unit_sul", None, "True"),
+    ("matriz=unit,filial_sul=unit_sul", "false", "False"),
+])
+def test_token_required_by_default_with_several_tenants(tenants_env, require_env, expected):
+    env = {k: v for k, v in os.environ.items() if k != "TENANT_REQUIRE_TOKEN"}
+    env["TENANTS"] = tenants_env
+    if require_env is not None:
+        env["TENANT_REQUIRE_TOKEN"] = require_env
+    code = "from app.core import tenancy; print(tenancy.REQUIRE_TOKEN)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    assert output.split()[-1] == expected
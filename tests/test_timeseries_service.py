@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import datetime
+from contextlib import asynccontextmanager
+from decimal import Decimal
+import pytest
+from app.core.config import settings
+from app.core.tenancy import DEFAULT_TENANT
+from app.services import db_service, timeseries_service
+from app.services.timeseries_service import _monthly, _refresh, _refresh_since
+
+YEAR = 2025
+
+
+class FakeRegistry:
+    """Devolve as linhas diarias (dia, total, pedidos, ultimo) a partir de :desde."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    @asynccontextmanager
+    async def connect_reader(self):
+        yield self
+
+    async def execute(self, statement, params):
+        self.calls.append(params)
+        rows = [row for row in self.rows if row[0] >= params["desde"].date()]
+        return type("Result", (), {"all": lambda _: rows})()
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    fake = FakeRegistry([])
+    monkeypatch.setattr(db_service, "tenant_registry", lambda tenant=None: fake)
+    monkeypatch.setattr(timeseries_service, "_STATES", {})
+    monkeypatch.setattr(timeseries_service, "TIMESERIES_STATS", dict.fromkeys(timeseries_service.TIMESERIES_STATS, 0))
+    monkeypatch.setattr(settings, "TIMESERIES_LOOKBACK_DAYS", 2)
+    monkeypatch.setattr(settings, "TIMESERIES_FULL_REFRESH_SECONDS", 3600)
+    return fake
+
+
+def _day(month, day, total, orders=1):
+    date = datetime.date(YEAR, month, day)
+    return date, Decimal(total), orders, datetime.datetime.combine(date, datetime.time(18))
+
+
+def test_refresh_since_full_then_incremental(registry):
+    state = timeseries_service._state(DEFAULT_TENANT)
+    assert _refresh_since(state, YEAR, now=1000.0) == datetime.datetime(YEAR, 1, 1)
+
+    state.update(year=YEAR, watermark=datetime.datetime(YEAR, 3, 10, 9), last_full=1000.0)
+    assert _refresh_since(state, YEAR, now=1500.0) == datetime.datetime(YEAR, 3, 8)
+    # Reconstrucao periodica e virada do ano voltam a 1o de janeiro
+    assert _refresh_since(state, YEAR, now=1000.0 + 3600) == datetime.datetime(YEAR, 1, 1)
+    assert _refresh_since(state, YEAR + 1, now=1500.0) == datetime.datetime(YEAR + 1, 1, 1)
+    # A janela de reconsulta nao volta para o ano anterior
+    state["watermark"] = datetime.datetime(YEAR, 1, 1, 9)
+    assert _refresh_since(state, YEAR, now=1500.0) == datetime.datetime(YEAR, 1, 1)
+
+
+def test_incremental_refresh_only_requeries_open_days(registry):
+    state = timeseries_service._state(DEFAULT_TENANT)
+    registry.rows = [_day(1, 5, "100"), _day(2, 3, "50"), _day(2, 4, "25")]
+
+    async def scenario():
+        full = await _refresh(state, DEFAULT_TENANT, YEAR, datetime.datetime(YEAR, 1, 1), "v1")
+        # Pedido novo em 04/02 e primeiro pedido de 05/02
+        registry.rows = [_day(1, 5, "999"), _day(2, 3, "50"), _day(2, 4, "40", 2), _day(2, 5, "10")]
+        since = _refresh_since(state, YEAR, now=state["last_full"])
+        incremental = await _refresh(state, DEFAULT_TENANT, YEAR, since, "v2")
+        return full, since, incremental
+
+    full, since, incremental = asyncio.run(scenario())
+    assert full["mode"] == "full"
+    assert since == datetime.datetime(YEAR, 2, 2)
+    assert incremental["mode"] == "incremental"
+    assert incremental["days_requeried"] == 3
+    assert registry.calls[-1]["desde"] == since
+    # O dia congelado (05/01) nao e reconsultado: a alteracao tardia so entra na proxima reconstrucao
+    assert state["days"][datetime.date(YEAR, 1, 5)] == Decimal("100")
+    assert state["days"][datetime.date(YEAR, 2, 4)] == Decimal("40")
+    assert state["watermark"] == datetime.datetime(YEAR, 2, 5, 18)
+    assert state["version"] == "v2"
+    assert timeseries_service.TIMESERIES_STATS["full_refreshes"] == 1
+    assert timeseries_service.TIMESERIES_STATS["incremental_refreshes"] == 1
+    assert _monthly(state["days"]) == [
+        {"month_label": f"{YEAR}-01", "total_sales": Decimal("100")},
+        {"month_label": f"{YEAR}-02", "total_sales": Decimal("100")},
+    ]
+
+
+def test_unchanged_data_version_skips_the_query(registry, monkeypatch):
+    today = datetime.date.today()
+    registry.rows = [(today, Decimal("10"), 1, datetime.datetime.combine(today, datetime.time()))]
+
+    async def version():
+        return "v1"
+
+    monkeypatch.setattr(timeseries_service, "get_data_version", version)
+
+    async def scenario():
+        first = await timeseries_service.monthly_sales(DEFAULT_TENANT)
+        second = await timeseries_service.monthly_sales(DEFAULT_TENANT)
+        return first, second
+
+    (months, info), (cached_months, cached_info) = asyncio.run(scenario())
+    assert info["mode"] == "full"
+    assert cached_info["mode"] == "cached"
+    assert cached_months == months == [{"month_label": today.strftime("%Y-%m"), "total_sales": Decimal("10")}]
+    assert len(registry.calls) == 1
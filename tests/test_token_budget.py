@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import pytest
+from fastapi import HTTPException
+from app.core.config import settings
+from app.services import ai_service, token_budget
+from app.services.token_budget import estimate_tokens, join_schema, split_schema, table_drop_order, template_tokens
+
+SCHEMA = "\n".join([
+    "-- Prefira as tabelas rollup_ quando a pergunta for por mes.",
+    "unit.rollup_vendas_mes(mes, total_vendas)",
+    "unit.clientes(clienteid, nome, estado)",
+    "unit.produtos(produtoid, nome, categoria)",
+    "unit.pedidosvenda(pedidoid, clienteid, datapedido, valortotal)",
+])
+
+
+class FakeProvider:
+    key = "fake:modelo"
+
+    def __init__(self, factor: float = 2.0, fail: bool = False):
+        self.factor = factor
+        self.fail = fail
+        self.calls = 0
+
+    def count_tokens(self, text: str) -> int:
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("sem rede")
+        return int(estimate_tokens(text) * self.factor)
+
+
+@pytest.fixture(autouse=True)
+def fresh_counts(monkeypatch):
+    monkeypatch.setattr(token_budget, "_template_counts", type(token_budget._template_counts)())
+    monkeypatch.setattr(settings, "LLM_TOKEN_COUNTER", "local")
+
+
+def test_provider_count_is_cached_per_template(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_TOKEN_COUNTER", "provider")
+    provider = FakeProvider()
+    text = "instrucoes fixas " * 10
+    assert template_tokens(provider, text) == 2 * estimate_tokens(text)
+    assert template_tokens(provider, text) == 2 * estimate_tokens(text)
+    assert provider.calls == 1
+    assert token_budget.calibration(provider, text) == 2.0
+
+
+def test_provider_failure_falls_back_to_estimate(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_TOKEN_COUNTER", "provider")
+    assert template_tokens(FakeProvider(fail=True), "abcdefgh") == estimate_tokens("abcdefgh") == 2
+
+
+def test_tables_named_in_the_question_are_dropped_last():
+    _, tables = split_schema(SCHEMA)
+    order = table_drop_order(tables, "Quais clientes de SP compraram mais?")
+    assert order[-1] == tables.index("unit.clientes(clienteid, nome, estado)")
+    # Empate sem relevancia: as do fim do resumo saem primeiro
+    assert order[0] == len(tables) - 1
+
+
+def test_rollup_hint_dropped_with_the_rollup_tables():
+    hints, tables = split_schema(SCHEMA)
+    assert join_schema(hints, tables).startswith("-- Prefira")
+    assert join_schema(hints, tables[1:]) == "\n".join(tables[1:])
+
+
+def test_prompt_within_budget_is_untouched(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_PROMPT_TOKEN_BUDGET", 100_000)
+    plan = ai_service.plan_prompt("total de vendas por mes", SCHEMA, FakeProvider())
+    assert plan.prompt == ai_service.build_prompt("total de vendas por mes", SCHEMA)
+    assert not plan.trimmed
+
+
+def test_prompt_over_budget_drops_examples_then_tables(monkeypatch):
+    question = "Quais clientes de SP compraram mais?"
+    full = ai_service.plan_prompt(question, SCHEMA, FakeProvider())
+    monkeypatch.setattr(settings, "LLM_PROMPT_TOKEN_BUDGET", full.input_tokens - 1)
+    plan = ai_service.plan_prompt(question, SCHEMA, FakeProvider())
+    assert plan.trimmed
+    assert plan.examples_dropped > 0
+    assert plan.input_tokens <= plan.budget
+    assert question in plan.prompt
+
+
+def test_prompt_that_cannot_fit_is_rejected(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_PROMPT_TOKEN_BUDGET", 10)
+    monkeypatch.setattr(token_budget, "TOKEN_STATS", {**token_budget.TOKEN_STATS, "rejected": 0})
+    with pytest.raises(HTTPException) as excinfo:
+        ai_service.plan_prompt("total de vendas", SCHEMA, FakeProvider())
+    assert excinfo.value.status_code == 413
+    assert token_budget.TOKEN_STATS["rejected"] == 1